@@ -13,8 +13,11 @@ from graphrag.index.utils import dict_has_keys_with_types
 from graphrag.llm import CompletionLLM
 
 from .prompts import COMMUNITY_REPORT_PROMPT
+from .schemas import EDGE_CHUNK_ID
+import graphrag.my_graphrag.db as db
 from graphrag.my_graphrag.db import save_new_community_report
 import graphrag.my_graphrag.model as model
+from graphrag.my_graphrag.context import get_prompt_dir
 
 import re
 import csv
@@ -24,12 +27,24 @@ import xml.etree.ElementTree as ET
 import os
 import random
 from datetime import datetime
-from pathlib import Path
 
 import asyncio
 
 log = logging.getLogger(__name__)
 
+# the report sections of the prompt in its order, used with constrained decoding:
+# a one-line title, a summary of at most 3 paragraphs, then 1 to 10 insights, each a heading and at most 4 paragraphs
+# free text never spans a line, and a paragraph does not start with the heading marker
+COMMUNITY_REPORT_PARAGRAPH_REGEX = r"[^\n#][^\n]*"
+COMMUNITY_REPORT_INSIGHT_REGEX = (
+    rf"### [^\n]+\n\n{COMMUNITY_REPORT_PARAGRAPH_REGEX}(?:\n\n{COMMUNITY_REPORT_PARAGRAPH_REGEX}){{0,3}}"
+)
+COMMUNITY_REPORT_REGEX = (
+    rf"Title: [^\n]+\n\n"
+    rf"Summary: [^\n]+(?:\n\n{COMMUNITY_REPORT_PARAGRAPH_REGEX}){{0,2}}\n\n"
+    rf"Insights:\n\n{COMMUNITY_REPORT_INSIGHT_REGEX}(?:\n\n{COMMUNITY_REPORT_INSIGHT_REGEX}){{0,9}}\n?"
+)
+
 
 @dataclass
 class CommunityReportsResult:
@@ -67,8 +82,7 @@ class CommunityReportsExtractor:
         tmp_prompt_dir = ''
         prefix = ''
         try:
-            cur_file_path = Path(os.path.realpath(__file__))
-            tmp_prompt_dir = os.path.join(cur_file_path.parents[5], 'prompts', 'tmp')
+            tmp_prompt_dir = get_prompt_dir()
             if os.path.isdir(tmp_prompt_dir):
                 now = datetime.now()
                 timestamp = now.strftime("%Y%m%d%H%M%S") + f"_{now.microsecond:06d}"
@@ -86,13 +100,25 @@ class CommunityReportsExtractor:
         """Call method definition."""
         try:
             original_input = inputs[self._input_text_key]
-            converted_input = self._convert_input(original_input)
+
+            # a community reported before a restart is skipped, communities are keyed by their context
+            community_key = db.get_content_hash(original_input)
+            if db.get_done_journal_output(db.JOURNAL_COMMUNITY_REPORT, community_key, db.get_cur_group_id()) is not None:
+                return CommunityReportsResult(
+                    structured_output={},
+                    output='',
+                )
+
+            converted_input, chunk_id_list = self._convert_input(original_input)
 
             desc_list = re.findall(r'<description>(.*?)</description>', converted_input, re.DOTALL)
             desc_input = '\n\n'.join(desc_list)
 
             community_prompt = COMMUNITY_REPORT_PROMPT.format(input_text=desc_input)
-            output = model.get_response_from_sgl(community_prompt)
+            output = await model.get_response_from_sgl_async(
+                community_prompt, sampling_params=model.get_constrained_params(COMMUNITY_REPORT_REGEX), role='extract',
+                phase='community_report'
+            )
 
             await self._export_prompt(
                 prompt_input=community_prompt,
@@ -103,6 +129,8 @@ class CommunityReportsExtractor:
             save_new_community_report(
                 converted_input,
                 output,
+                chunk_id_list=chunk_id_list,
+                community_key=community_key,
             )
 
         except Exception as e:
@@ -136,7 +164,8 @@ class CommunityReportsExtractor:
         return f"# {title}\n\n{summary}\n\n{report_sections}"
 
     # 240805
-    def _convert_input(self, input_text: str) -> str:
+    # return the converted input text and the chunk ids of the relationships, None if the context has no chunk ids
+    def _convert_input(self, input_text: str) -> tuple[str, list[str] | None]:
         entities_section = re.search(r'(?i)^[^a-zA-Z]*entities[^a-zA-Z]*$\s*(.*?)\s*(?i)^[^a-zA-Z]*relationships[^a-zA-Z]*$', input_text, re.DOTALL | re.MULTILINE)
         relationships_section = re.search(r'(?i)^[^a-zA-Z]*relationships[^a-zA-Z]*$\s*(.*)', input_text, re.DOTALL | re.MULTILINE)
 
@@ -171,6 +200,7 @@ class CommunityReportsExtractor:
                 entities_xml = []
 
         relationships_xml = []
+        chunk_id_list = None
         if relationships_section:
             try:
                 lines = relationships_section.group(1).strip().split('\n')
@@ -180,12 +210,17 @@ class CommunityReportsExtractor:
                 headers = next(csv_reader)
                 for i, header in enumerate(headers):
                     header = header.strip().lower()
-                    if 'id' in header:
+                    if header == EDGE_CHUNK_ID:
+                        headers[i] = EDGE_CHUNK_ID
+                        chunk_id_list = []
+                    elif 'id' in header:
                         headers[i] = 'id'
 
                 for row in csv_reader:
                     try:
                         record = dict(zip(headers, row))
+                        if chunk_id_list is not None:
+                            chunk_id_list += [c.strip() for c in record.get(EDGE_CHUNK_ID, '').split(',') if c.strip()]
                         xml_record = ET.Element('root')
                         for header in headers:
                             if header in ('id', 'source', 'target', 'description'):
@@ -204,7 +239,10 @@ class CommunityReportsExtractor:
         if len(relationships_xml) > 0:
             input_text_list += ['Relationships:'] + relationships_xml
 
-        return '\n\n'.join(input_text_list)
+        if chunk_id_list is not None:
+            chunk_id_list = list(set(chunk_id_list))
+
+        return '\n\n'.join(input_text_list), chunk_id_list
 
     def _convert_output(self, llm_response: str) -> dict[str, Any]:
         # original format:
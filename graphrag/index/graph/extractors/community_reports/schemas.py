@@ -19,6 +19,7 @@ EDGE_DESCRIPTION = "description"
 EDGE_DEGREE = "rank"
 EDGE_DETAILS = "edge_details"
 EDGE_WEIGHT = "weight"
+EDGE_CHUNK_ID = "chunk_id"
 
 # POST-PREP CLAIM TABLE SCHEMA
 CLAIM_ID = "human_readable_id"
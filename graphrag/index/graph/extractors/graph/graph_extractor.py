@@ -10,7 +10,6 @@ import traceback
 import os
 import random
 from datetime import datetime
-from pathlib import Path
 from collections.abc import Mapping
 from dataclasses import dataclass
 from typing import Any
@@ -27,8 +26,10 @@ from .prompts import GRAPH_EXTRACTION_PROMPT, GLEANING_PROMPT, ENTITIES_IDENTIFI
 
 import xml.etree.ElementTree as ET
 
-from graphrag.my_graphrag.db import save_new_relationship
+import graphrag.my_graphrag.db as db
+from graphrag.my_graphrag.db import save_new_relationships
 import graphrag.my_graphrag.model as model
+from graphrag.my_graphrag.context import get_prompt_dir
 
 import asyncio
 
@@ -36,6 +37,17 @@ DEFAULT_TUPLE_DELIMITER = "<|>"
 DEFAULT_RECORD_DELIMITER = "##"
 DEFAULT_COMPLETION_DELIMITER = "<|COMPLETE|>"
 DEFAULT_ENTITY_TYPES = ["organization", "person", "geo", "event"]
+# a gleaning that starts with NOMORE is complete, and it may think for at most 2048 tokens
+GLEANING_STOP = model.StopCondition(stop_regex=r"^\s*NOMORE", think_budget=2048)
+
+# formats of the responses, used with constrained decoding
+ENTITY_REGEX = model.get_xml_regex("entity", ["entity_name", "entity_type", "entity_description"])
+RELATIONSHIP_REGEX = model.get_xml_regex(
+    "relationship", ["source_entity", "target_entity", "relationship_description", "relationship_strength"]
+)
+EXTRACTION_REGEX = rf"(?:{ENTITY_REGEX}\n)+(?:{RELATIONSHIP_REGEX}\n)*"
+GLEANING_REGEX = rf"NOMORE|(?:(?:{ENTITY_REGEX}|{RELATIONSHIP_REGEX})\n)+"
+ENTITIES_IDENTIFICATION_REGEX = rf"(?:{ENTITY_REGEX}\n)+"
 
 
 @dataclass
@@ -108,8 +120,7 @@ class GraphExtractor:
         tmp_prompt_dir = ''
         prefix = ''
         try:
-            cur_file_path = Path(os.path.realpath(__file__))
-            tmp_prompt_dir = os.path.join(cur_file_path.parents[5], 'prompts', 'tmp')
+            tmp_prompt_dir = get_prompt_dir()
             if os.path.isdir(tmp_prompt_dir):
                 now = datetime.now()
                 timestamp = now.strftime("%Y%m%d%H%M%S") + f"_{now.microsecond:06d}"
@@ -124,13 +135,20 @@ class GraphExtractor:
         self._lock = asyncio.Lock()
 
     async def __call__(
-        self, texts: list[str], prompt_variables: dict[str, Any] | None = None
+        self,
+        texts: list[str],
+        prompt_variables: dict[str, Any] | None = None,
+        metadata_list: list[dict | None] | None = None,
     ) -> GraphExtractionResult:
         """Call method definition."""
         if prompt_variables is None:
             prompt_variables = {}
+        if metadata_list is None:
+            metadata_list = [None] * len(texts)
         all_records: dict[int, str] = {}
         source_doc_map: dict[int, str] = {}
+        # chunk id in the database of each document, from the chunk metadata
+        chunk_id_map: dict[int, str] = {}
 
         # Wire defaults into the prompt variables
         prompt_variables = {
@@ -148,12 +166,14 @@ class GraphExtractor:
             ),
         }
 
-        for doc_index, text in enumerate(texts):
+        for doc_index, (text, metadata) in enumerate(zip(texts, metadata_list)):
             try:
                 # Invoke the entity extraction
-                result = await self._process_document(text, prompt_variables)
+                result = await self._process_document(text, prompt_variables, metadata)
                 source_doc_map[doc_index] = text
                 all_records[doc_index] = result
+                if metadata and metadata.get("chunk_id"):
+                    chunk_id_map[doc_index] = str(metadata["chunk_id"])
             except Exception as e:
                 logging.exception("error extracting graph")
                 self._on_error(
@@ -169,6 +189,7 @@ class GraphExtractor:
             all_records,
             prompt_variables.get(self._tuple_delimiter_key, DEFAULT_TUPLE_DELIMITER),
             prompt_variables.get(self._record_delimiter_key, DEFAULT_RECORD_DELIMITER),
+            chunk_id_map,
         )
 
         return GraphExtractionResult(
@@ -177,12 +198,24 @@ class GraphExtractor:
         )
 
     async def _process_document(
-        self, text: str, prompt_variables: dict[str, str]
+        self,
+        text: str,
+        prompt_variables: dict[str, str],
+        metadata: dict | None = None,
     ) -> str:
+        # a sub chunk extracted before a restart is not sent again, its output is kept in the journal
+        journal_output = db.get_done_journal_output(
+            db.JOURNAL_EXTRACTION, db.get_sub_chunk_unit(metadata), metadata.get('group_id') if metadata else None
+        )
+        if journal_output is not None:
+            return journal_output
+
         idx = 1
 
         extraction_prompt = self._extraction_prompt.format(input_text=text)
-        results = model.get_response_from_sgl(extraction_prompt)
+        results = await model.get_response_from_sgl_async(
+            extraction_prompt, sampling_params=model.get_constrained_params(EXTRACTION_REGEX), role='extract', phase='extraction'
+        )
 
         await self._export_prompt(
             prompt_input=extraction_prompt,
@@ -195,7 +228,10 @@ class GraphExtractor:
         for i in range(self._max_gleanings):
             tmp_conv_output = _clean_entities_text(results) + '\n' + _clean_relationships_text(results)
             gleaning_prompt = GLEANING_PROMPT.format(input_text=text, previous_output=tmp_conv_output)
-            output = model.get_response_from_sgl(gleaning_prompt)
+            output = await model.get_response_from_sgl_async(
+                gleaning_prompt, sampling_params=model.get_constrained_params(GLEANING_REGEX), role='extract', stop=GLEANING_STOP,
+                phase='gleaning'
+            )
 
             await self._export_prompt(
                 prompt_input=gleaning_prompt,
@@ -214,7 +250,10 @@ class GraphExtractor:
                 break
 
         entities_identification_prompt = ENTITIES_IDENTIFICATION_PROMPT.format(input_text=text, entities=_clean_entities_text(results))
-        output = model.get_response_from_sgl(entities_identification_prompt)
+        output = await model.get_response_from_sgl_async(
+            entities_identification_prompt, sampling_params=model.get_constrained_params(ENTITIES_IDENTIFICATION_REGEX), role='extract',
+            phase='entity_identification'
+        )
         filtered_entities_results = results
         if output:
             _clean_output = _clean_entities_text(output)
@@ -235,7 +274,8 @@ class GraphExtractor:
             prompt_variables.get(self._tuple_delimiter_key, DEFAULT_TUPLE_DELIMITER),
             prompt_variables.get(self._record_delimiter_key, DEFAULT_RECORD_DELIMITER),
             prompt_variables.get(self._completion_delimiter_key, DEFAULT_COMPLETION_DELIMITER),
-            text
+            text,
+            metadata,
         )
 
         async with self._lock:
@@ -256,6 +296,7 @@ class GraphExtractor:
         results: dict[int, str],
         tuple_delimiter: str,
         record_delimiter: str,
+        chunk_id_map: dict[int, str] | None = None,
     ) -> nx.Graph:
         """Parse the result string to create an undirected unipartite graph.
 
@@ -263,12 +304,16 @@ class GraphExtractor:
             - results - dict of results from the extraction chain
             - tuple_delimiter - delimiter between tuples in an output record, default is '<|>'
             - record_delimiter - delimiter between records, default is '##'
+            - chunk_id_map - database chunk id of each source document, stored in the "chunk_id" attribute
         Returns:
             - output - unipartite graph in graphML format
         """
+        if chunk_id_map is None:
+            chunk_id_map = {}
         graph = nx.Graph()
         for source_doc_id, extracted_data in results.items():
             records = [r.strip() for r in extracted_data.split(record_delimiter)]
+            chunk_id = chunk_id_map.get(source_doc_id, "")
 
             for record in records:
                 record = re.sub(r"^\(|\)$", "", record.strip())
@@ -298,6 +343,7 @@ class GraphExtractor:
                                 str(source_doc_id),
                             })
                         )
+                        node["chunk_id"] = _join_chunk_ids(node, chunk_id)
                         node["entity_type"] = (
                             entity_type if entity_type != "" else node["entity_type"]
                         )
@@ -307,6 +353,7 @@ class GraphExtractor:
                             type=entity_type,
                             description=entity_description,
                             source_id=str(source_doc_id),
+                            chunk_id=chunk_id,
                         )
 
                 if (
@@ -323,12 +370,14 @@ class GraphExtractor:
                         if isinstance(record_attributes[-1], numbers.Number)
                         else 1.0
                     )
+                    edge_chunk_id = chunk_id
                     if source not in graph.nodes():
                         graph.add_node(
                             source,
                             type="",
                             description="",
                             source_id=edge_source_id,
+                            chunk_id=chunk_id,
                         )
                     if target not in graph.nodes():
                         graph.add_node(
@@ -336,6 +385,7 @@ class GraphExtractor:
                             type="",
                             description="",
                             source_id=edge_source_id,
+                            chunk_id=chunk_id,
                         )
                     if graph.has_edge(source, target):
                         edge_data = graph.get_edge_data(source, target)
@@ -354,12 +404,14 @@ class GraphExtractor:
                                     str(source_doc_id),
                                 })
                             )
+                            edge_chunk_id = _join_chunk_ids(edge_data, chunk_id)
                     graph.add_edge(
                         source,
                         target,
                         weight=weight,
                         description=edge_description,
                         source_id=edge_source_id,
+                        chunk_id=edge_chunk_id,
                     )
 
         return graph
@@ -372,6 +424,7 @@ class GraphExtractor:
         record_delimiter: str,
         completion_delimiter: str,
         input_chunk: str,
+        chunk_metadata: dict | None = None,
     ) -> str:
         # original input variables: entity_types, tuple_delimiter, record_delimiter, completion_delimiter, input_text
         # new input variables: input_text
@@ -407,10 +460,21 @@ class GraphExtractor:
 
         for (source, target, desc, strength) in relationship_list:
             original_format.append(f'("relationship"{tuple_delimiter}{source}{tuple_delimiter}{target}{tuple_delimiter}{desc}{tuple_delimiter}{strength})')
-            # 240904 save relationship to chromadb
-            save_new_relationship(input_chunk, source, target, desc, strength)
+
+        # 240904 save relationship to chromadb, all relationships of the chunk in one write
+        chunk_id = chunk_metadata.get('chunk_id') if chunk_metadata else None
+        group_id = chunk_metadata.get('group_id') if chunk_metadata else None
+        relationship_id_list = save_new_relationships(input_chunk, relationship_list, chunk_id=chunk_id, group_id=group_id)
 
         original_str = ('\n' + record_delimiter + '\n').join(original_format) + '\n' + completion_delimiter
+
+        # the sub chunk is done once its relationships are written
+        unit = db.get_sub_chunk_unit(chunk_metadata)
+        if unit and group_id:
+            db.finish_journal_unit(
+                db.JOURNAL_EXTRACTION, unit, group_id, {db.COLLECTION_RELATIONSHIP: relationship_id_list or []}, original_str
+            )
+
         return original_str
 
     async def _export_prompt(
@@ -445,6 +509,12 @@ def _unpack_source_ids(data: Mapping) -> list[str]:
     return [] if value is None else value.split(", ")
 
 
+def _join_chunk_ids(data: Mapping, chunk_id: str) -> str:
+    value = data.get("chunk_id", None)
+    chunk_ids = {*([] if not value else value.split(", ")), chunk_id}
+    return ", ".join(sorted(c for c in chunk_ids if c))
+
+
 def _extract_entities(text):
     entity_list = []
     if not text:
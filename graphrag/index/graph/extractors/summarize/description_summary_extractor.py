@@ -7,7 +7,6 @@ import json
 import os
 import random
 from datetime import datetime
-from pathlib import Path
 from dataclasses import dataclass
 
 from graphrag.index.typing import ErrorHandlerFn
@@ -19,6 +18,7 @@ from .prompts import SUMMARIZE_PROMPT
 import asyncio
 
 import graphrag.my_graphrag.model as model
+from graphrag.my_graphrag.context import get_prompt_dir
 
 # Max token size for input prompts
 DEFAULT_MAX_INPUT_TOKENS = 4_000
@@ -71,8 +71,7 @@ class SummarizeExtractor:
         tmp_prompt_dir = ''
         prefix = ''
         try:
-            cur_file_path = Path(os.path.realpath(__file__))
-            tmp_prompt_dir = os.path.join(cur_file_path.parents[5], 'prompts', 'tmp')
+            tmp_prompt_dir = get_prompt_dir()
             if os.path.isdir(tmp_prompt_dir):
                 now = datetime.now()
                 timestamp = now.strftime("%Y%m%d%H%M%S") + f"_{now.microsecond:06d}"
@@ -151,7 +150,7 @@ class SummarizeExtractor:
     ):
         """Summarize descriptions using the LLM."""
         summarization_prompt = self._summarization_prompt.format(entity_name=json.dumps(items), description_list=json.dumps(sorted(descriptions)))
-        output = model.get_response_from_sgl(summarization_prompt)
+        output = await model.get_response_from_sgl_async(summarization_prompt, role='extract', phase='description_summary')
 
         await self._export_prompt(
             prompt_input=summarization_prompt,
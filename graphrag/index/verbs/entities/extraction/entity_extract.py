@@ -148,8 +148,15 @@ async def entity_extract(
         nonlocal num_started
         text = row[column]
         id = row[id_column]
+        metadata = row.get("chunk_metadata")
         result = await strategy_exec(
-            [Document(text=text, id=id)],
+            [
+                Document(
+                    text=text,
+                    id=id,
+                    metadata=metadata if isinstance(metadata, dict) else None,
+                )
+            ],
             entity_types,
             callbacks,
             cache,
@@ -79,10 +79,19 @@ async def run_extract_entities(
         ),
     )
     text_list = [doc.text.strip() for doc in docs]
+    metadata_list = [doc.metadata for doc in docs]
 
     # If it's not pre-chunked, then re-chunk the input
     if not prechunked:
-        text_list = text_splitter.split_text("\n".join(text_list))
+        text_list = list(text_splitter.split_text("\n".join(text_list)))
+        # every split keeps the chunk identity of a single input document,
+        # with its index among the splits so each split is its own journal unit
+        metadata_list = [
+            {**docs[0].metadata, "split_idx": split_idx}
+            if len(docs) == 1 and docs[0].metadata
+            else None
+            for split_idx in range(len(text_list))
+        ]
 
     results = await extractor(
         list(text_list),
@@ -92,6 +101,7 @@ async def run_extract_entities(
             "record_delimiter": record_delimiter,
             "completion_delimiter": completion_delimiter,
         },
+        metadata_list,
     )
 
     graph = results.output
@@ -22,6 +22,7 @@ class Document:
 
     text: str
     id: str
+    metadata: dict | None = None
 
 
 @dataclass
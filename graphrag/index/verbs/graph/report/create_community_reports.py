@@ -27,6 +27,8 @@ from graphrag.index.graph.extractors.community_reports import (
     prep_community_report_context,
 )
 from graphrag.index.utils.ds_util import get_required_input_table
+import graphrag.my_graphrag.db as db
+from graphrag.my_graphrag.db import COLLECTION_COMMUNITY_REPORT, BufferedWriter
 
 from .strategies.typing import CommunityReport, CommunityReportsStrategy
 
@@ -65,6 +67,8 @@ async def create_community_reports(
     reports: list[CommunityReport | None] = []
     tick = progress_ticker(callbacks.progress, len(local_contexts))
     runner = load_strategy(strategy["type"])
+    # journal units of the communities of this run, keyed by their context as in the extractor
+    community_key_list = []
 
     for level in levels:
         level_contexts = prep_community_report_context(
@@ -90,14 +94,24 @@ async def create_community_reports(
             tick()
             return result
 
-        local_reports = await derive_from_rows(
-            level_contexts,
-            run_generate,
-            callbacks=NoopVerbCallbacks(),
-            num_threads=num_threads,
-            scheduling_type=async_mode,
-        )
+        # write the reports of one level to chromadb in batches
+        with BufferedWriter(COLLECTION_COMMUNITY_REPORT):
+            local_reports = await derive_from_rows(
+                level_contexts,
+                run_generate,
+                callbacks=NoopVerbCallbacks(),
+                num_threads=num_threads,
+                scheduling_type=async_mode,
+            )
         reports.extend([lr for lr in local_reports if lr is not None])
+        community_key_list += [
+            db.get_content_hash(context) for context in level_contexts[schemas.CONTEXT_STRING]
+        ]
+
+    # reports of communities that no longer exist in this run, e.g. after a restart with other description summaries
+    group_id = db.get_cur_group_id()
+    if group_id:
+        db.prune_journal_units(db.JOURNAL_COMMUNITY_REPORT, community_key_list, group_id)
 
     return TableContainer(table=pd.DataFrame(reports))
 
@@ -9,6 +9,7 @@ import pandas as pd
 from datashaper import TableContainer, VerbInput, verb
 
 from graphrag.index.graph.extractors.community_reports.schemas import (
+    EDGE_CHUNK_ID,
     EDGE_DEGREE,
     EDGE_DESCRIPTION,
     EDGE_DETAILS,
@@ -35,6 +36,7 @@ def prepare_community_reports_edges(
     edge_df: pd.DataFrame = cast(pd.DataFrame, input.get_input()).fillna(
         value={description_column: _MISSING_DESCRIPTION}
     )
+    has_chunk_id = EDGE_CHUNK_ID in edge_df.columns
     edge_df[to] = edge_df.apply(
         lambda x: {
             id_column: x[id_column],
@@ -42,6 +44,8 @@ def prepare_community_reports_edges(
             target_column: x[target_column],
             description_column: x[description_column],
             degree_column: x[degree_column],
+            # database chunk ids of the relationship, read back by the community report extractor
+            **({EDGE_CHUNK_ID: x[EDGE_CHUNK_ID]} if has_chunk_id else {}),
         },
         axis=1,
     )
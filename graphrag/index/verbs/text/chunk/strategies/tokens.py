@@ -55,13 +55,14 @@ def split_text_on_tokens(
         tick(1)
 
         chunks = get_chunks_for_graphrag(text)
-        for chunk in chunks:
+        for chunk, chunk_metadata in chunks:
             # no sub chunk
             result.append(
                 TextChunk(
                     text_chunk=chunk,
                     source_doc_indices=[source_doc_idx],
                     n_tokens=len(enc.encode(chunk)),
+                    metadata=chunk_metadata,
                 )
             )
 
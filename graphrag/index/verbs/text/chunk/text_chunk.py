@@ -110,7 +110,7 @@ def run_strategy(
     input: ChunkInput,
     strategy_args: dict[str, Any],
     tick: ProgressTicker,
-) -> list[str | tuple[list[str] | None, str, int]]:
+) -> list[str | tuple[list[str] | None, str, int, dict | None]]:
     """Run strategy method definition."""
     if isinstance(input, str):
         return [item.text_chunk for item in strategy([input], {**strategy_args}, tick)]
@@ -138,6 +138,7 @@ def run_strategy(
                 doc_ids,
                 strategy_result.text_chunk,
                 strategy_result.n_tokens,
+                strategy_result.metadata,
             ))
     return results
 
@@ -13,6 +13,8 @@ class TextChunk:
     text_chunk: str
     source_doc_indices: list[int]
     n_tokens: int | None = None
+    metadata: dict | None = None
+    """Identity of the source chunk in the database (chunk_id, paper_id, group_id, sub_chunk_idx)."""
 
 
 ChunkInput = str | list[str] | list[tuple[str, str]]
@@ -60,6 +60,11 @@ def build_steps(
                                 "delimiter": ", ",
                                 "distinct": True,
                             },
+                            "chunk_id": {
+                                "operation": "concat",
+                                "separator": ", ",
+                                "distinct": True,
+                            },
                             "description": ({
                                 "operation": "concat",
                                 "separator": "\n",
@@ -72,6 +77,11 @@ def build_steps(
                                 "delimiter": ", ",
                                 "distinct": True,
                             },
+                            "chunk_id": {
+                                "operation": "concat",
+                                "separator": ", ",
+                                "distinct": True,
+                            },
                             "description": ({
                                 "operation": "concat",
                                 "separator": "\n",
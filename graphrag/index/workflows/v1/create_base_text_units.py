@@ -92,7 +92,12 @@ def build_steps(
             "verb": "unzip",
             "args": {
                 "column": chunk_column_name,
-                "to": ["document_ids", chunk_column_name, n_tokens_column_name],
+                "to": [
+                    "document_ids",
+                    chunk_column_name,
+                    n_tokens_column_name,
+                    "chunk_metadata",
+                ],
             },
         },
         {"verb": "copy", "args": {"column": "chunk_id", "to": "id"}},
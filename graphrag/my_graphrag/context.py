@@ -0,0 +1,141 @@
+import os
+import contextlib
+import contextvars
+import threading
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+
+PRJ_DIR = Path(os.path.dirname(os.path.realpath(__file__))).parent.parent.absolute()
+# prompts of the graphrag extractors are exported here when no prompt dir is set and the folder exists
+DEFAULT_PROMPT_DIR = os.path.join(PRJ_DIR, 'prompts', 'tmp')
+DEFAULT_SERVER_URL = 'http://localhost:30000'
+
+# environment variables used to hand the context to the graphrag.index subprocess
+ENV_DB_PATH = 'RG_RAG_DB_PATH'
+ENV_GROUP_ID = 'RG_RAG_GROUP_ID'
+ENV_MODEL_PATH = 'RG_RAG_MODEL_PATH'
+ENV_SERVER_URL = 'RG_RAG_SERVER_URL'
+ENV_PROMPT_DIR = 'RG_RAG_PROMPT_DIR'
+ENV_LLM_CACHE_BYPASS = 'RG_RAG_LLM_CACHE_BYPASS'
+ENV_ENDPOINTS = 'RG_RAG_SGL_ENDPOINTS'
+ENV_CONSTRAINED_DECODING = 'RG_RAG_CONSTRAINED_DECODING'
+ENV_TRACE_PATH = 'RG_RAG_TRACE_PATH'
+
+
+@dataclass(frozen=True)
+class Context:
+    # db_path: chroma database folder, '' for the default database
+    # group_id: group being indexed by graphrag, '' outside of graphrag indexing
+    # model_path: model served by the SGL server, '' if no server is running
+    # server_url: base url of the SGL server
+    # prompt_dir: folder the graphrag extractors export their prompts to, '' for DEFAULT_PROMPT_DIR
+    # llm_cache_bypass: non-empty to skip reading the LLM cache, responses are still written to it
+    # endpoints: json {model_path: server_url} of the running SGL servers, '' if only model_path is served at server_url
+    # constrained_decoding: non-empty to constrain the responses of prompts with a known format to that format
+    # trace_path: JSONL file the LLM calls are recorded to, '' to not record them
+    db_path: str = ''
+    group_id: str = ''
+    model_path: str = ''
+    server_url: str = DEFAULT_SERVER_URL
+    prompt_dir: str = ''
+    llm_cache_bypass: str = ''
+    endpoints: str = ''
+    constrained_decoding: str = ''
+    trace_path: str = ''
+
+    def to_env(self):
+        return {
+            ENV_DB_PATH: self.db_path,
+            ENV_GROUP_ID: self.group_id,
+            ENV_MODEL_PATH: self.model_path,
+            ENV_SERVER_URL: self.server_url,
+            ENV_PROMPT_DIR: self.prompt_dir,
+            ENV_LLM_CACHE_BYPASS: self.llm_cache_bypass,
+            ENV_ENDPOINTS: self.endpoints,
+            ENV_CONSTRAINED_DECODING: self.constrained_decoding,
+            ENV_TRACE_PATH: self.trace_path,
+        }
+
+    @classmethod
+    def from_env(cls, environ=None):
+        environ = os.environ if environ is None else environ
+        return cls(
+            db_path=environ.get(ENV_DB_PATH, ''),
+            group_id=environ.get(ENV_GROUP_ID, ''),
+            model_path=environ.get(ENV_MODEL_PATH, ''),
+            server_url=environ.get(ENV_SERVER_URL, '') or DEFAULT_SERVER_URL,
+            prompt_dir=environ.get(ENV_PROMPT_DIR, ''),
+            llm_cache_bypass=environ.get(ENV_LLM_CACHE_BYPASS, ''),
+            endpoints=environ.get(ENV_ENDPOINTS, ''),
+            constrained_decoding=environ.get(ENV_CONSTRAINED_DECODING, ''),
+            trace_path=environ.get(ENV_TRACE_PATH, ''),
+        )
+
+
+# context of the process, read from the environment on first use
+LOCK = threading.RLock()
+PROCESS_CONTEXT = None
+
+# context of the current job, set by use_context, overrides the process context
+# asyncio tasks inherit it, threads have to be started with contextvars.copy_context().run
+JOB_CONTEXT = contextvars.ContextVar('rg_rag_job_context', default=None)
+
+
+def clean_changes(changes):
+    # all context fields are strings, None and False clear a field
+    return {k: '' if v is None or v is False else str(v) for k, v in changes.items()}
+
+
+def get_context():
+    global PROCESS_CONTEXT
+
+    ctx = JOB_CONTEXT.get()
+    if ctx is not None:
+        return ctx
+
+    with LOCK:
+        if PROCESS_CONTEXT is None:
+            PROCESS_CONTEXT = Context.from_env()
+        return PROCESS_CONTEXT
+
+
+def update_context(**changes):
+    # update the job context inside use_context, the process context otherwise
+    global PROCESS_CONTEXT
+
+    changes = clean_changes(changes)
+    if JOB_CONTEXT.get() is not None:
+        ctx = replace(JOB_CONTEXT.get(), **changes)
+        JOB_CONTEXT.set(ctx)
+        return ctx
+
+    with LOCK:
+        PROCESS_CONTEXT = replace(get_context(), **changes)
+        return PROCESS_CONTEXT
+
+
+@contextlib.contextmanager
+def use_context(ctx=None, **changes):
+    # run a block with its own context, e.g. one job of several running in the same process
+    ctx = replace(ctx if ctx is not None else get_context(), **clean_changes(changes))
+    token = JOB_CONTEXT.set(ctx)
+    try:
+        yield ctx
+    finally:
+        JOB_CONTEXT.reset(token)
+
+
+def get_subprocess_env(**changes):
+    # environment of a child process that continues the current context
+    ctx = get_context()
+    if changes:
+        ctx = replace(ctx, **clean_changes(changes))
+
+    env = os.environ.copy()
+    env.update(ctx.to_env())
+    return env
+
+
+def get_prompt_dir():
+    return get_context().prompt_dir or DEFAULT_PROMPT_DIR
@@ -3,119 +3,501 @@ import re
 import json
 import traceback
 import chromadb
+from chromadb.utils import embedding_functions
 import hashlib
+import heapq
+import itertools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import graphrag.my_graphrag.store as store
+import graphrag.my_graphrag.context as context
+
 import nltk
 nltk.download('punkt')
 from nltk.tokenize import word_tokenize
 
 FILE_DIR = Path(os.path.dirname(os.path.realpath(__file__))).parent.parent.absolute()
 DATABASE_PATH = os.path.join(FILE_DIR, './my_graphrag/vector_database')
-DB_TMP_FILE_PATH = os.path.join(FILE_DIR, './my_graphrag/db_tmp_file.txt')
-GROUP_ID_TMP_FILE_PATH = os.path.join(FILE_DIR, './my_graphrag/group_id_tmp_file.txt')
 COLLECTION_GROUP = 'group'
 COLLECTION_PAPER = 'paper'
 COLLECTION_CHUNK = 'chunk'
 COLLECTION_RELATIONSHIP = 'relationship'
 COLLECTION_COMMUNITY_REPORT = 'community_report'
 COLLECTION_SUMMARY = 'summary'
+COLLECTION_LIST = [
+    COLLECTION_GROUP,
+    COLLECTION_PAPER,
+    COLLECTION_CHUNK,
+    COLLECTION_RELATIONSHIP,
+    COLLECTION_COMMUNITY_REPORT,
+    COLLECTION_SUMMARY,
+]
+# collections that get_id looks up by content
+CONTENT_HASH_COLLECTION_LIST = [
+    COLLECTION_PAPER,
+    COLLECTION_CHUNK,
+]
+
+# collections kept in the side store instead of chroma, they are only read by id or metadata, never searched by embedding
+STORE_COLLECTION_LIST = [
+    COLLECTION_GROUP,
+    COLLECTION_PAPER,
+    COLLECTION_RELATIONSHIP,
+]
+# large chunk metadatas kept in the side store, chroma only keeps the chunk text and the metadatas used by where filters
+CHUNK_STORE_METADATA_KEYS = [
+    'denoising_chunk',
+    'sub_chunks',
+]
+
+SIDE_STORE_LOCK = threading.RLock()
+SIDE_STORE_CHECKED = set()
+
+CLIENT_LOCK = threading.RLock()
+CLIENTS = {}
+COLLECTIONS = {}
+EMBEDDING_FUNCTION = None
+
+CATALOG_LOCK = threading.RLock()
+CATALOGS = {}
+
+GROUP_REF_LOCK = threading.RLock()
+GROUP_REF_CACHE = {}
+
+# stages of the indexing journal, a unit of a stage is done once all its items are written
+# denoise: unit per paper name, the chunk of the paper
+# extraction: unit per sub chunk, '<chunk_id>:<sub_chunk_idx>', or per piece of it, '<chunk_id>:<sub_chunk_idx>:<split_idx>',
+#     the relationships of the sub chunk or piece
+# community_report: unit per community, the content hash of the community context, the report of the community
+# raptor_level: unit per raptor level, the summaries of the level
+# graphrag, raptor: one JOURNAL_GROUP_UNIT per group, started when the stage is scheduled and done when it finished
+JOURNAL_DENOISE = 'denoise'
+JOURNAL_EXTRACTION = 'extraction'
+JOURNAL_COMMUNITY_REPORT = 'community_report'
+JOURNAL_RAPTOR_LEVEL = 'raptor_level'
+JOURNAL_GRAPHRAG = 'graphrag'
+JOURNAL_RAPTOR = 'raptor'
+JOURNAL_GROUP_UNIT = 'group'
+JOURNAL_STARTED = 'started'
+JOURNAL_DONE = 'done'
+# {stage: {unit stage: collection of the items written by its units}}, rolled back when the stage is restarted
+JOURNAL_STAGE_UNITS = {
+    JOURNAL_GRAPHRAG: {
+        JOURNAL_EXTRACTION: COLLECTION_RELATIONSHIP,
+        JOURNAL_COMMUNITY_REPORT: COLLECTION_COMMUNITY_REPORT,
+    },
+    JOURNAL_RAPTOR: {
+        JOURNAL_RAPTOR_LEVEL: COLLECTION_SUMMARY,
+    },
+}
+
+# number of items read per get by iter_items
+PAGE_SIZE = 1000
+
+# {collection_name: BufferedWriter} of the current job, groups indexed at the same time each have their own writers
+# asyncio tasks and asyncio.to_thread inherit it
+ACTIVE_WRITERS = contextvars.ContextVar('rg_rag_active_writers', default={})
+
+
+def get_client():
+    # one client per database path for the whole process
+    db_path = os.path.normpath(get_db_path())
+    with CLIENT_LOCK:
+        client = CLIENTS.get(db_path)
+        if client is None:
+            client = chromadb.PersistentClient(path=db_path)
+            CLIENTS[db_path] = client
+    return client
+
+
+def get_embedding_function():
+    # the default embedding model of chromadb, loaded once and shared by all collections
+    global EMBEDDING_FUNCTION
+    with CLIENT_LOCK:
+        if EMBEDDING_FUNCTION is None:
+            EMBEDDING_FUNCTION = embedding_functions.DefaultEmbeddingFunction()
+    return EMBEDDING_FUNCTION
+
+
+def get_collection(collection_name, create=False):
+    # cached collection handle, raises like client.get_collection if the collection does not exist and create is False
+    key = (os.path.normpath(get_db_path()), collection_name)
+    with CLIENT_LOCK:
+        collection = COLLECTIONS.get(key)
+        if collection is None:
+            client = get_client()
+            if create:
+                collection = client.get_or_create_collection(name=collection_name, embedding_function=get_embedding_function())
+            else:
+                collection = client.get_collection(name=collection_name, embedding_function=get_embedding_function())
+            COLLECTIONS[key] = collection
+    return collection
 
 
-def save_new_item(collection_name: str, documents: str, metadatas: dict):
-    client = chromadb.PersistentClient(path=get_db_path())
-    collection = client.get_or_create_collection(name=collection_name)
+def reset_clients():
+    with CLIENT_LOCK:
+        CLIENTS.clear()
+        COLLECTIONS.clear()
+    with SIDE_STORE_LOCK:
+        SIDE_STORE_CHECKED.clear()
+    refresh_catalog()
+    invalidate_ref_ids_for_group()
 
-    all_data = collection.get()
+
+def get_max_id(collection):
+    # full scan of the ids only, used once per collection to seed the id sequence
+    all_data = collection.get(include=[])
 
     last_ids = 0
     for ids in all_data['ids']:
         last_ids = max(last_ids, int(ids))
 
-    new_ids = last_ids + 1
-    new_ids = str(new_ids)
-    collection.add(
-        documents=[
-            documents
-        ],
-        metadatas=[
-            metadatas
-        ],
-        ids=[
-            new_ids
+    return last_ids
+
+
+def save_new_items(collection_name: str, documents_list: list, metadatas_list: list):
+    # write a batch of items with one id allocation and one collection.add
+    if not documents_list:
+        return []
+
+    db_path = get_db_path()
+
+    if collection_name in STORE_COLLECTION_LIST:
+        check_side_store(collection_name)
+        new_ids_list = store.next_ids(
+            db_path,
+            collection_name,
+            count=len(documents_list),
+            seed_fn=lambda: store.get_max_item_id(db_path, collection_name)
+        )
+        store.add_items(db_path, collection_name, new_ids_list, documents_list, metadatas_list)
+
+    else:
+        collection = get_collection(collection_name, create=True)
+
+        new_ids_list = store.next_ids(
+            db_path,
+            collection_name,
+            count=len(documents_list),
+            seed_fn=lambda: get_max_id(collection)
+        )
+
+        chroma_metadatas_list = metadatas_list
+        if collection_name == COLLECTION_CHUNK:
+            check_side_store(collection_name)
+            chroma_metadatas_list, chunk_text_list = split_chunk_metadatas(new_ids_list, metadatas_list)
+            store.set_chunk_texts(db_path, chunk_text_list)
+
+        collection.add(
+            documents=documents_list,
+            metadatas=chroma_metadatas_list,
+            ids=new_ids_list
+        )
+
+    if collection_name in CONTENT_HASH_COLLECTION_LIST:
+        add_to_content_hash_index(collection_name, new_ids_list, documents_list, metadatas_list)
+
+    invalidate_ref_ids_for_group(list(set([str(metadatas.get('group_id', '')) for metadatas in metadatas_list])))
+
+    if collection_name == COLLECTION_COMMUNITY_REPORT:
+        finish_community_report_units(new_ids_list, metadatas_list)
+
+    return new_ids_list
+
+
+def save_new_item(collection_name: str, documents: str, metadatas: dict):
+    return save_new_items(collection_name, [documents], [metadatas])[0]
+
+
+class BufferedWriter(object):
+    # collect items of one collection and write them with save_new_items
+    # usage:
+    # with BufferedWriter(COLLECTION_COMMUNITY_REPORT) as writer:
+    #     ...  # save_new_community_report() calls inside are buffered
+    def __init__(self, collection_name, batch_size=100):
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.documents_list = []
+        self.metadatas_list = []
+        self.ids_list = []
+        self.lock = threading.RLock()
+        self.previous_writer = None
+
+    def add(self, documents_list, metadatas_list):
+        with self.lock:
+            self.documents_list += documents_list
+            self.metadatas_list += metadatas_list
+            if len(self.documents_list) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            new_ids_list = save_new_items(self.collection_name, self.documents_list, self.metadatas_list)
+            self.ids_list += new_ids_list
+            self.documents_list = []
+            self.metadatas_list = []
+        return new_ids_list
+
+    def __enter__(self):
+        writer_dict = ACTIVE_WRITERS.get()
+        self.previous_writer = writer_dict.get(self.collection_name)
+        ACTIVE_WRITERS.set({**writer_dict, self.collection_name: self})
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        writer_dict = dict(ACTIVE_WRITERS.get())
+        if self.previous_writer is None:
+            writer_dict.pop(self.collection_name, None)
+        else:
+            writer_dict[self.collection_name] = self.previous_writer
+        ACTIVE_WRITERS.set(writer_dict)
+        self.flush()
+        return False
+
+
+def write_items(collection_name: str, documents_list: list, metadatas_list: list):
+    # go through the active BufferedWriter of the collection if there is one
+    # return None for buffered items, because their ids are only known after the flush
+    writer = ACTIVE_WRITERS.get().get(collection_name)
+
+    if writer is not None:
+        writer.add(documents_list, metadatas_list)
+        return None
+
+    return save_new_items(collection_name, documents_list, metadatas_list)
+
+
+def migrate_db():
+    # bring an existing database up to date with the side store
+    db_path = get_db_path()
+
+    # move groups, papers, relationships and the large chunk metadatas out of chroma
+    for collection_name in STORE_COLLECTION_LIST + [COLLECTION_CHUNK]:
+        check_side_store(collection_name)
+        print(f'Collection {collection_name}: moved to the side store.')
+
+    for collection_name in COLLECTION_LIST:
+        if collection_name in STORE_COLLECTION_LIST:
+            last_id = store.get_max_item_id(db_path, collection_name)
+        else:
+            try:
+                last_id = get_max_id(get_collection(collection_name))
+            except Exception as e:
+                # collection not created yet
+                continue
+
+        # seed the id sequence of each collection
+        store.seed_id_sequence(db_path, collection_name, last_id)
+        print(f'Collection {collection_name}: id sequence starts after {store.get_last_id(db_path, collection_name)}.')
+
+    # index the content of papers and chunks for get_id
+    for collection_name in CONTENT_HASH_COLLECTION_LIST:
+        build_content_hash_index(collection_name)
+        print(f'Collection {collection_name}: content hash index built.')
+
+    # group of each relationship
+    print(f'Collection {COLLECTION_RELATIONSHIP}: {backfill_relationship_group_id()} relationships backfilled with group ids.')
+
+    # base chunks and papers under each raptor summary
+    print(f'Collection {COLLECTION_SUMMARY}: {backfill_summary_closure()} summaries backfilled with base chunk ids and paper ids.')
+
+
+def check_side_store(collection_name):
+    # move a collection of a database created before the side store was added, once per database
+    # only write paths and --migrate move it, so reading an old database leaves its chroma files as they are
+    key = (os.path.normpath(get_db_path()), collection_name)
+    if key in SIDE_STORE_CHECKED:
+        return
+
+    with SIDE_STORE_LOCK:
+        if key in SIDE_STORE_CHECKED:
+            return
+
+        meta_key = f'side_store:{collection_name}'
+        if not store.get_meta(key[0], meta_key):
+            if collection_name == COLLECTION_CHUNK:
+                move_chunk_metadatas_to_side_store()
+            else:
+                move_collection_to_side_store(collection_name)
+            store.set_meta(key[0], meta_key, 1)
+
+        SIDE_STORE_CHECKED.add(key)
+
+
+def is_side_store_ready(collection_name):
+    # True once the collection has been moved to the side store, read paths use chroma until then
+    key = (os.path.normpath(get_db_path()), collection_name)
+    if key in SIDE_STORE_CHECKED:
+        return True
+
+    # do not create the side store of a database that has none
+    if not os.path.isfile(store.get_store_path(key[0])) or not store.get_meta(key[0], f'side_store:{collection_name}'):
+        return False
+
+    with SIDE_STORE_LOCK:
+        SIDE_STORE_CHECKED.add(key)
+    return True
+
+
+def move_collection_to_side_store(collection_name):
+    # copy all items of a chroma collection into its side store table, then drop the chroma collection
+    db_path = get_db_path()
+    try:
+        collection = get_collection(collection_name)
+    except Exception as e:
+        # collection not created yet
+        return 0
+
+    count = 0
+    for page_list in iter_pages(iter_chroma_items(collection_name, ['documents', 'metadatas'])):
+        ids_list, documents_list, metadatas_list = zip(*page_list)
+
+        if collection_name == COLLECTION_RELATIONSHIP:
+            # relationships saved before group_id was added get the group of their chunk
+            ref_dict = get_ref_ids_of_chunks([metadatas['chunk_id'] for metadatas in metadatas_list])
+            metadatas_list = [
+                metadatas if 'group_id' in metadatas else {**metadatas, 'group_id': ref_dict.get(str(metadatas['chunk_id']), (None, ''))[1] or ''}
+                for metadatas in metadatas_list
+            ]
+
+        store.add_items(db_path, collection_name, ids_list, documents_list, metadatas_list)
+        count += len(ids_list)
+
+    store.seed_id_sequence(db_path, collection_name, get_max_id(collection))
+
+    get_client().delete_collection(name=collection_name)
+    with CLIENT_LOCK:
+        COLLECTIONS.pop((os.path.normpath(db_path), collection_name), None)
+
+    return count
+
+
+def move_chunk_metadatas_to_side_store():
+    # copy denoising_chunk and sub_chunks of the chunks into the side store and clear them in chroma
+    db_path = get_db_path()
+    try:
+        collection = get_collection(COLLECTION_CHUNK)
+    except Exception as e:
+        # collection not created yet
+        return 0
+
+    count = 0
+    for page_list in iter_pages(iter_chroma_items(COLLECTION_CHUNK, ['metadatas'])):
+        page_list = [
+            (ids, metadatas) for ids, _, metadatas in page_list
+            if metadatas.get('denoising_chunk') or metadatas.get('sub_chunks', '[]') != '[]'
         ]
-    )
+        if not page_list:
+            continue
+
+        ids_list = [ids for ids, _ in page_list]
+        chroma_metadatas_list, chunk_text_list = split_chunk_metadatas(ids_list, [metadatas for _, metadatas in page_list])
+        store.set_chunk_texts(db_path, chunk_text_list, replace=False)
+        collection.update(
+            ids=ids_list,
+            metadatas=[{**metadatas, 'denoising_chunk': '', 'sub_chunks': '[]'} for metadatas in chroma_metadatas_list]
+        )
+        count += len(ids_list)
+
+    return count
+
+
+def split_chunk_metadatas(ids_list, metadatas_list):
+    # return the chroma metadatas without CHUNK_STORE_METADATA_KEYS and the chunk_text rows of the side store
+    chroma_metadatas_list = []
+    chunk_text_list = []
+    for ids, metadatas in zip(ids_list, metadatas_list):
+        chroma_metadatas_list.append({k: v for k, v in metadatas.items() if k not in CHUNK_STORE_METADATA_KEYS})
+        chunk_text_list.append((ids, metadatas.get('denoising_chunk', ''), metadatas.get('sub_chunks', '[]')))
+    return chroma_metadatas_list, chunk_text_list
+
+
+def merge_store_metadatas(collection_name, item_list, include):
+    # add the chunk metadatas kept in the side store to [(ids, documents, metadatas)] read from chroma
+    # chunks not moved yet keep the values in their chroma metadatas
+    if collection_name != COLLECTION_CHUNK or 'metadatas' not in include or not item_list:
+        return item_list
+
+    if not is_side_store_ready(COLLECTION_CHUNK):
+        return item_list
+
+    chunk_text_dict = store.get_chunk_texts(get_db_path(), [ids for ids, _, _ in item_list])
+
+    new_item_list = []
+    for ids, documents, metadatas in item_list:
+        denoising_chunk, sub_chunks = chunk_text_dict.get(
+            ids,
+            (metadatas.get('denoising_chunk', ''), metadatas.get('sub_chunks', '[]'))
+        )
+        new_item_list.append((ids, documents, {**metadatas, 'denoising_chunk': denoising_chunk, 'sub_chunks': sub_chunks}))
+    return new_item_list
+
+
+def get_content_hash(text):
+    # whitespace is removed, so the same text with a different layout has the same hash
+    return hashlib.sha256(re.sub(r'\s+', '', text).encode()).hexdigest()
+
+
+def get_item_texts(collection_name, documents, metadatas):
+    # all texts of an item that get_id can be asked for
+    text_list = [documents]
+    if collection_name == COLLECTION_CHUNK:
+        if metadatas.get('denoising_chunk'):
+            text_list.append(metadatas['denoising_chunk'])
+        try:
+            text_list += json.loads(metadatas.get('sub_chunks', '[]'))
+        except:
+            pass
+    return [text for text in text_list if text]
+
 
-    return new_ids
+def add_to_content_hash_index(collection_name, ids_list, documents_list, metadatas_list):
+    hash_list = []
+    for ids, documents, metadatas in zip(ids_list, documents_list, metadatas_list):
+        group_id = metadatas.get('group_id', '')
+        for text in get_item_texts(collection_name, documents, metadatas):
+            hash_list.append((get_content_hash(text), ids, group_id))
+    store.add_content_hashes(get_db_path(), collection_name, hash_list)
+
+
+def build_content_hash_index(collection_name):
+    # one full scan to index a database created before the content hash index was added
+    db_path = get_db_path()
+    try:
+        for page_list in iter_pages(iter_items(collection_name)):
+            ids_list, documents_list, metadatas_list = zip(*page_list)
+            add_to_content_hash_index(collection_name, ids_list, documents_list, metadatas_list)
+    except Exception as e:
+        # collection not created yet
+        pass
+    store.set_meta(db_path, f'content_hash_index:{collection_name}', 1)
+
+
+def check_content_hash_index(collection_name):
+    if not store.get_meta(get_db_path(), f'content_hash_index:{collection_name}'):
+        build_content_hash_index(collection_name)
 
 
 def get_id(collection_name: str, query_content: str, metadatas=''):
-    group_id = get_group_id_by_tmp_file()
+    # exact lookup of an item by its whitespace free content hash
+    # metadatas is kept for compatibility, chunk items are indexed by content, denoising_chunk and sub_chunks
+    group_id = get_cur_group_id()
     group_id_validity = check_group_id(group_id)
 
     ids = '0'
     try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=collection_name)
-        all_data = collection.get()
-
-        if ids == '0':
-            query_content_clean = re.sub(r'\s+', '', query_content)
-            for i in range(len(all_data['ids'])):
-                if group_id_validity and 'group_id' in all_data['metadatas'][i] and all_data['metadatas'][i]['group_id'] != group_id:
-                    continue
-
-                documents = all_data['documents'][i]
-                if metadatas:
-                    m_text = ''
-                    try:
-                        m_text = all_data['metadatas'][i][metadatas]
-                    except:
-                        pass
-                    if m_text != '':
-                        documents = m_text
-
-                documents_clean = re.sub(r'\s+', '', documents)
-                if query_content_clean in documents_clean or query_content in documents:
-                    ids = all_data['ids'][i]
-                    break
-
-        if ids == '0':
-            try:
-                results = collection.query(
-                    query_texts=[query_content],
-                    n_results=1,
-                    where=None if not group_id_validity else {'group_id': group_id}
-                )
-                ids = results['ids'][0][0]
-            except:
-                pass
-
-        if ids == '0':
-            split_text = query_content.split('\n')
-            for text in split_text:
-                text_clean = re.sub(r'\s+', '', text)
-                for i in range(len(all_data['ids'])):
-                    if group_id_validity and 'group_id' in all_data['metadatas'][i] and all_data['metadatas'][i]['group_id'] != group_id:
-                        continue
-
-                    documents = all_data['documents'][i]
-                    if metadatas:
-                        m_text = ''
-                        try:
-                            m_text = all_data['metadatas'][i][metadatas]
-                        except:
-                            pass
-                        if m_text != '':
-                            documents = m_text
-
-                    documents_clean = re.sub(r'\s+', '', documents)
-                    if text_clean in documents_clean or text in documents:
-                        ids = all_data['ids'][i]
-                        break
-                if ids != '0':
-                    break
-
+        check_content_hash_index(collection_name)
+        found_ids = store.find_content_hash(
+            get_db_path(),
+            collection_name,
+            get_content_hash(query_content),
+            group_id if group_id_validity else None
+        )
+        if found_ids is not None:
+            ids = found_ids
     except:
         pass
 
@@ -123,7 +505,7 @@ def get_id(collection_name: str, query_content: str, metadatas=''):
 
 
 def save_new_group(group_name):
-    # group
+    # group, in the side store
     # ids: group id
     # documents: group_name
     # metadatas: group_name
@@ -140,7 +522,7 @@ def save_new_group(group_name):
 
 
 def save_new_paper(paper_content, paper_name, group_id):
-    # paper
+    # paper, in the side store
     # ids: paper id
     # documents: paper_name
     # metadatas: paper_name, group_id
@@ -164,7 +546,7 @@ def save_new_chunk(chunk, paper_id, group_id, denoising_chunk=''):
     # chunk
     # ids: chunk id
     # documents: chunk_content
-    # metadatas: paper_id
+    # metadatas: paper_id, group_id, denoising_chunk and sub_chunks in the side store
 
     sub_chunks = split_text_into_sub_chunks(denoising_chunk) if denoising_chunk else []
 
@@ -183,364 +565,532 @@ def save_new_chunk(chunk, paper_id, group_id, denoising_chunk=''):
 
 
 def save_new_relationship(chunk, source_entity_name, target_entity_name, relationship_description, relationship_strength):
-    # relationship
+    relationship_id_list = save_new_relationships(
+        chunk,
+        [(source_entity_name, target_entity_name, relationship_description, relationship_strength)]
+    )
+
+    return relationship_id_list[0] if relationship_id_list else None
+
+
+def save_new_relationships(chunk, relationship_list, chunk_id=None, group_id=None):
+    # relationship, in the side store
     # ids: relationship id
     # documents: relationship_description
-    # metadatas: source entity name, target entity name, relationship description, relationship strength, chunk id
+    # metadatas: source entity name, target entity name, relationship description, relationship strength, chunk id, group id
+    # relationship_list: [(source_entity_name, target_entity_name, relationship_description, relationship_strength)]
+    # chunk_id: id of the chunk the relationships come from, looked up by the chunk text if not given
+    # group_id: group of the chunk, taken from the chunk if not given
 
-    chunk_id = get_id(COLLECTION_CHUNK, chunk, metadatas='denoising_chunk')
+    if not relationship_list:
+        return []
 
-    relationship_id = save_new_item(
-        COLLECTION_RELATIONSHIP,
-        relationship_description,
-        {
-            'source_entity_name': source_entity_name,
-            'target_entity_name': target_entity_name,
-            'relationship_description': relationship_description,
-            'relationship_strength': relationship_strength,
-            'chunk_id': chunk_id,
-        }
-    )
+    if chunk_id is None:
+        chunk_id = get_id(COLLECTION_CHUNK, chunk, metadatas='denoising_chunk')
+
+    if group_id is None:
+        _, group_id = get_ref_id_of_chunk(chunk_id)
 
-    return relationship_id
+    documents_list = []
+    metadatas_list = []
+    for source_entity_name, target_entity_name, relationship_description, relationship_strength in relationship_list:
+        documents_list.append(relationship_description)
+        metadatas_list.append(
+            {
+                'source_entity_name': source_entity_name,
+                'target_entity_name': target_entity_name,
+                'relationship_description': relationship_description,
+                'relationship_strength': relationship_strength,
+                'chunk_id': chunk_id,
+                'group_id': group_id or '',
+            }
+        )
 
+    return write_items(COLLECTION_RELATIONSHIP, documents_list, metadatas_list)
 
-def save_new_community_report(index_prompt3_input_text, community_report_text):
+
+def save_new_community_report(index_prompt3_input_text, community_report_text, chunk_id_list=None, community_key=''):
     # community report
     # ids: community report id
     # documents: community report text
     # metadatas: relationship ids, title, summary, rating, rating explanation, findings (<insight> <insight_summary> ... </insight_summary> <insight_explanation> ... </insight_explanation> </insight>)
+    # chunk_id_list: ids of the chunks of the relationships in the report context
+    # community_key: journal unit of the community, done once the report is written
 
-    group_id = get_group_id_by_tmp_file()
+    group_id = get_cur_group_id()
     _, group_chunk_id_list, _, _, _ = get_ref_ids_for_group(group_id)
+    group_chunk_id_set = set(group_chunk_id_list)
+
+    if chunk_id_list is None:
+        # context without chunk ids, match the relationship descriptions exactly
+        chunk_id_list = []
+        descriptions = re.findall(r'</target><description>(.*?)</description>', index_prompt3_input_text, re.DOTALL)
+        if descriptions:
+            chunk_id_list = [
+                metadatas['chunk_id']
+                for _, _, metadatas in iter_items(
+                    COLLECTION_RELATIONSHIP,
+                    include=['metadatas'],
+                    where={'relationship_description': {'$in': list(set(descriptions))}}
+                )
+            ]
 
-    descriptions = re.findall(r'</target><description>(.*?)</description>', index_prompt3_input_text, re.DOTALL)
-    chunk_id_list = []
-
-    if descriptions:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_RELATIONSHIP)
-
-        for des in descriptions:
-            results = collection.query(
-                query_texts=[des],
-                n_results=1
-            )
-
-            chunk_id = results['metadatas'][0][0]['chunk_id']
-            if chunk_id in group_chunk_id_list:
-                chunk_id_list.append(chunk_id)
-
-        chunk_id_list = list(set(chunk_id_list))
+    chunk_id_list = list(set([chunk_id for chunk_id in chunk_id_list if chunk_id in group_chunk_id_set]))
 
     if check_group_id(group_id) and chunk_id_list and community_report_text:
-        report_id = save_new_item(
+        report_id_list = write_items(
             COLLECTION_COMMUNITY_REPORT,
-            community_report_text,
-            {
-                'chunk_id_list': json.dumps(chunk_id_list),
-                'group_id': group_id,
-            }
+            [community_report_text],
+            [
+                {
+                    'chunk_id_list': json.dumps(chunk_id_list),
+                    'group_id': group_id,
+                    'community_key': community_key,
+                }
+            ]
         )
 
-        return report_id
+        return report_id_list[0] if report_id_list else None
+
+    if community_key and group_id:
+        # nothing to write, the community is done as well
+        finish_journal_unit(JOURNAL_COMMUNITY_REPORT, community_key, group_id)
 
     return None
 
 
-def save_new_summary(summary_text, chunk_id_list, from_base_chunk, root_summary, group_id):
+def finish_community_report_units(ids_list, metadatas_list):
+    # a community is done once its report is written, for a BufferedWriter that is when the batch is flushed
+    for ids, metadatas in zip(ids_list, metadatas_list):
+        if metadatas.get('community_key'):
+            finish_journal_unit(JOURNAL_COMMUNITY_REPORT, metadatas['community_key'], metadatas['group_id'], {COLLECTION_COMMUNITY_REPORT: [ids]})
+
+
+def save_new_summary(summary_text, chunk_id_list, from_base_chunk, root_summary, group_id, base_chunk_id_list=None, paper_id_list=None):
+    if base_chunk_id_list is None and from_base_chunk:
+        base_chunk_id_list = chunk_id_list
+    if base_chunk_id_list is not None and paper_id_list is None:
+        paper_id_list = get_paper_id_list_of_chunks(base_chunk_id_list, group_id, get_ref_ids_of_chunks(base_chunk_id_list))
+
+    summary_id_list = save_new_summaries(
+        [(summary_text, chunk_id_list, base_chunk_id_list or [], paper_id_list or [])],
+        from_base_chunk,
+        root_summary,
+        group_id
+    )
+
+    return summary_id_list[0] if summary_id_list else None
+
+
+def save_new_summaries(summary_list, from_base_chunk, root_summary, group_id):
     # summary chunk
     # ids: summary chunk id
     # documents: summary text
-    # metadatas: chunk_id_list
-    summary_id = save_new_item(
-        COLLECTION_SUMMARY,
-        summary_text,
-        {
-            'chunk_id_list': json.dumps(chunk_id_list),
-            'from_base_chunk': from_base_chunk,
-            'root_summary': root_summary,
-            'group_id': group_id,
-        }
-    )
+    # metadatas: chunk_id_list, base_chunk_id_list, paper_id_list
+    # summary_list: [(summary_text, chunk_id_list, base_chunk_id_list, paper_id_list)], all summaries of one raptor level
+    # chunk_id_list: ids of the children, base chunks on the first level and summaries above
+    # base_chunk_id_list, paper_id_list: all base chunks and papers under the summary in the raptor tree
+    documents_list = []
+    metadatas_list = []
+    for summary_text, chunk_id_list, base_chunk_id_list, paper_id_list in summary_list:
+        documents_list.append(summary_text)
+        metadatas_list.append(
+            {
+                'chunk_id_list': json.dumps(chunk_id_list),
+                'from_base_chunk': from_base_chunk,
+                'root_summary': root_summary,
+                'group_id': group_id,
+                'base_chunk_id_list': json.dumps(base_chunk_id_list),
+                'paper_id_list': json.dumps(paper_id_list),
+            }
+        )
 
-    return summary_id
+    return write_items(COLLECTION_SUMMARY, documents_list, metadatas_list)
 
 
-def get_all_community_reports():
-    report_list = []
+def backfill_summary_closure():
+    # add base_chunk_id_list and paper_id_list to the summaries of a database created before they were saved
     try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_COMMUNITY_REPORT)
+        collection = get_collection(COLLECTION_SUMMARY)
+    except Exception as e:
+        # collection not created yet
+        return 0
+
+    all_data = collection.get(include=['metadatas'])
+    metadatas_dict = dict(zip(all_data['ids'], all_data['metadatas']))
+
+    base_dict = {}
+
+    def get_base_chunk_id_list(summary_id, visited):
+        if summary_id in base_dict:
+            return base_dict[summary_id]
+        metadatas = metadatas_dict.get(summary_id)
+        if metadatas is None or summary_id in visited:
+            return []
+        chunk_id_list = json.loads(metadatas['chunk_id_list'])
+        if metadatas['from_base_chunk']:
+            base_chunk_id_list = chunk_id_list
+        else:
+            base_chunk_id_list = []
+            for child_id in chunk_id_list:
+                base_chunk_id_list += get_base_chunk_id_list(child_id, visited | {summary_id})
+        base_dict[summary_id] = sorted(set(base_chunk_id_list), key=int)
+        return base_dict[summary_id]
+
+    ids_list = []
+    new_metadatas_list = []
+    for summary_id, metadatas in metadatas_dict.items():
+        if 'base_chunk_id_list' in metadatas and 'paper_id_list' in metadatas:
+            continue
+        ids_list.append(summary_id)
+        new_metadatas_list.append({**metadatas, 'base_chunk_id_list': get_base_chunk_id_list(summary_id, set())})
+
+    ref_dict = get_ref_ids_of_chunks([chunk_id for metadatas in new_metadatas_list for chunk_id in metadatas['base_chunk_id_list']])
+    for metadatas in new_metadatas_list:
+        metadatas['paper_id_list'] = json.dumps(get_paper_id_list_of_chunks(metadatas['base_chunk_id_list'], metadatas['group_id'], ref_dict))
+        metadatas['base_chunk_id_list'] = json.dumps(metadatas['base_chunk_id_list'])
+
+    if ids_list:
+        collection.update(ids=ids_list, metadatas=new_metadatas_list)
+
+    return len(ids_list)
+
+
+def iter_items(collection_name, include=None, where=None, page_size=PAGE_SIZE):
+    # yield (ids, documents, metadatas) of the items matching where, one page of page_size items per read
+    # include: chroma include list, documents or metadatas not in include are yielded as None
+    if include is None:
+        include = ['documents', 'metadatas']
+
+    if collection_name in STORE_COLLECTION_LIST and is_side_store_ready(collection_name):
+        for ids, documents, metadatas in store.iter_items(get_db_path(), collection_name, where, 'documents' in include, page_size):
+            yield ids, documents, metadatas if 'metadatas' in include else None
+        return
 
-        all_data = collection.get()
-        for i in range(len(all_data['ids'])):
-            report_list.append(
-                {
-                    'report_id': all_data['ids'][i],
-                    'report_content': all_data['documents'][i],
-                    'chunk_id_list': json.loads(all_data['metadatas'][i]['chunk_id_list']),
-                    'group_id': all_data['metadatas'][i]['group_id'],
-                }
-            )
+    for page_list in iter_pages(iter_chroma_items(collection_name, include, where, page_size), page_size):
+        yield from merge_store_metadatas(collection_name, page_list, include)
 
-        report_list.sort(key=lambda x: int(x['report_id']), reverse=False)
+
+def iter_chroma_items(collection_name, include, where=None, page_size=PAGE_SIZE):
+    try:
+        collection = get_collection(collection_name)
     except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
+        # collection not created yet
+        return
+
+    offset = 0
+    while True:
+        page = collection.get(where=where, include=include, limit=page_size, offset=offset)
+        ids_list = page['ids']
+        if not ids_list:
+            break
 
-    return report_list
+        documents_list = page['documents'] if 'documents' in include else [None] * len(ids_list)
+        metadatas_list = page['metadatas'] if 'metadatas' in include else [None] * len(ids_list)
+        yield from zip(ids_list, documents_list, metadatas_list)
 
+        if len(ids_list) < page_size:
+            break
+        offset += len(ids_list)
 
-def get_all_chunks():
-    chunk_list = []
-    try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_CHUNK)
 
-        all_data = collection.get()
-        for i in range(len(all_data['ids'])):
-            chunk_list.append(
-                {
-                    'chunk_id': all_data['ids'][i],
-                    'chunk_content': all_data['documents'][i],
-                    'paper_id': all_data['metadatas'][i]['paper_id'],
-                    'group_id': all_data['metadatas'][i]['group_id'],
-                    'denoising_chunk': all_data['metadatas'][i]['denoising_chunk'],
-                    'sub_chunks': json.loads(all_data['metadatas'][i]['sub_chunks']),
-                }
-            )
+def iter_pages(item_iter, page_size=PAGE_SIZE):
+    # group the items of an iterator into lists of page_size items
+    page_list = []
+    for item in item_iter:
+        page_list.append(item)
+        if len(page_list) >= page_size:
+            yield page_list
+            page_list = []
+    if page_list:
+        yield page_list
 
-        chunk_list.sort(key=lambda x: int(x['chunk_id']), reverse=False)
+
+def get_items(collection_name, convert_fn, id_key, include=None, where=None):
+    # all items matching where converted by convert_fn(ids, documents, metadatas), sorted by id
+    item_list = []
+    try:
+        for ids, documents, metadatas in iter_items(collection_name, include=include, where=where):
+            item_list.append(convert_fn(ids, documents, metadatas))
+
+        item_list.sort(key=lambda x: int(x[id_key]), reverse=False)
     except Exception as e:
         # print(e)
         # traceback.print_exc()
         pass
 
-    return chunk_list
+    return item_list
 
 
-def get_all_summary_chunks():
-    summary_list = []
-    try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_SUMMARY)
+def convert_community_report(ids, documents, metadatas):
+    return {
+        'report_id': ids,
+        'report_content': documents or '',
+        'chunk_id_list': json.loads(metadatas['chunk_id_list']),
+        'group_id': metadatas['group_id'],
+    }
 
-        all_data = collection.get()
-        for i in range(len(all_data['ids'])):
-            summary_list.append(
-                {
-                    'summary_id': all_data['ids'][i],
-                    'summary_content': all_data['documents'][i],
-                    'chunk_id_list': json.loads(all_data['metadatas'][i]['chunk_id_list']),
-                    'from_base_chunk': all_data['metadatas'][i]['from_base_chunk'],
-                    'root_summary': all_data['metadatas'][i]['root_summary'],
-                    'group_id': all_data['metadatas'][i]['group_id'],
-                }
-            )
 
-        summary_list.sort(key=lambda x: int(x['summary_id']), reverse=False)
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
+def convert_chunk(ids, documents, metadatas):
+    return {
+        'chunk_id': ids,
+        'chunk_content': documents or '',
+        'paper_id': metadatas['paper_id'],
+        'group_id': metadatas['group_id'],
+        'denoising_chunk': metadatas['denoising_chunk'],
+        'sub_chunks': json.loads(metadatas['sub_chunks']),
+    }
 
-    return summary_list
 
+def convert_summary_chunk(ids, documents, metadatas):
+    return {
+        'summary_id': ids,
+        'summary_content': documents or '',
+        'chunk_id_list': json.loads(metadatas['chunk_id_list']),
+        'from_base_chunk': metadatas['from_base_chunk'],
+        'root_summary': metadatas['root_summary'],
+        'group_id': metadatas['group_id'],
+    }
 
-def get_all_papers():
-    paper_list = []
-    try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_PAPER)
 
-        all_data = collection.get()
-        for i in range(len(all_data['ids'])):
-            paper_list.append(
-                {
-                    'paper_id': all_data['ids'][i],
-                    'paper_content': all_data['documents'][i],
-                    'paper_name': all_data['metadatas'][i]['paper_name'],
-                    'group_id': all_data['metadatas'][i]['group_id'],
-                    'hash': all_data['metadatas'][i]['hash'],
-                }
-            )
+def convert_paper(ids, documents, metadatas):
+    return {
+        'paper_id': ids,
+        'paper_content': documents or '',
+        'paper_name': metadatas['paper_name'],
+        'group_id': metadatas['group_id'],
+        'hash': metadatas['hash'],
+    }
 
-        paper_list.sort(key=lambda x: int(x['paper_id']), reverse=False)
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
 
-    return paper_list
+def convert_group(ids, documents, metadatas):
+    return {
+        'group_id': ids,
+        'group_name': metadatas['group_name'],
+    }
 
 
-def get_all_groups():
-    group_list = []
-    try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_GROUP)
+def convert_relationship(ids, documents, metadatas):
+    return {
+        'relationship_id': ids,
+        'source_entity_name': metadatas['source_entity_name'],
+        'target_entity_name': metadatas['target_entity_name'],
+        'relationship_description': metadatas['relationship_description'],
+        'relationship_strength': metadatas['relationship_strength'],
+        'chunk_id': metadatas['chunk_id'],
+        'group_id': metadatas.get('group_id', ''),
+    }
 
-        all_data = collection.get()
-        for i in range(len(all_data['ids'])):
-            group_list.append(
-                {
-                    'group_id': all_data['ids'][i],
-                    'group_name': all_data['metadatas'][i]['group_name'],
-                }
-            )
 
-        group_list.sort(key=lambda x: int(x['group_id']), reverse=False)
+def get_content_include(with_content):
+    # without content only the metadatas are read, the content fields are ''
+    return ['documents', 'metadatas'] if with_content else ['metadatas']
 
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
 
-    return group_list
+def get_all_community_reports(where=None, with_content=True):
+    return get_items(COLLECTION_COMMUNITY_REPORT, convert_community_report, 'report_id', get_content_include(with_content), where)
 
 
-def get_all_relationships():
-    relationship_list = []
-    try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_RELATIONSHIP)
+def get_all_chunks(where=None, with_content=True):
+    return get_items(COLLECTION_CHUNK, convert_chunk, 'chunk_id', get_content_include(with_content), where)
+
+
+def get_all_summary_chunks(where=None, with_content=True):
+    return get_items(COLLECTION_SUMMARY, convert_summary_chunk, 'summary_id', get_content_include(with_content), where)
 
-        all_data = collection.get()
-        for i in range(len(all_data['ids'])):
-            relationship_list.append(
-                {
-                    'relationship_id': all_data['ids'][i],
-                    'source_entity_name': all_data['metadatas'][i]['source_entity_name'],
-                    'target_entity_name': all_data['metadatas'][i]['target_entity_name'],
-                    'relationship_description': all_data['metadatas'][i]['relationship_description'],
-                    'relationship_strength': all_data['metadatas'][i]['relationship_strength'],
-                    'chunk_id': all_data['metadatas'][i]['chunk_id'],
-                }
-            )
 
-        relationship_list.sort(key=lambda x: int(x['relationship_id']), reverse=False)
+def get_all_papers(where=None, with_content=True):
+    return get_items(COLLECTION_PAPER, convert_paper, 'paper_id', get_content_include(with_content), where)
 
+
+def get_all_groups(where=None):
+    return get_items(COLLECTION_GROUP, convert_group, 'group_id', ['metadatas'], where)
+
+
+def get_all_relationships(where=None):
+    return get_items(COLLECTION_RELATIONSHIP, convert_relationship, 'relationship_id', ['metadatas'], where)
+
+
+def get_items_by_ids(collection_name, ids_list, convert_fn, include=None):
+    # {ids: item} for the ids in ids_list that exist, with one get
+    if include is None:
+        include = ['metadatas']
+
+    item_dict = {}
+    ids_list = list(set([str(ids) for ids in ids_list]))
+    if not ids_list:
+        return item_dict
+
+    try:
+        if collection_name in STORE_COLLECTION_LIST and is_side_store_ready(collection_name):
+            item_list = store.get_items(get_db_path(), collection_name, ids_list, 'documents' in include)
+        else:
+            collection = get_collection(collection_name)
+            results = collection.get(ids=ids_list, include=include)
+            documents_list = results['documents'] if 'documents' in include else [None] * len(results['ids'])
+            metadatas_list = results['metadatas'] if 'metadatas' in include else [None] * len(results['ids'])
+            item_list = merge_store_metadatas(collection_name, list(zip(results['ids'], documents_list, metadatas_list)), include)
+
+        for ids, documents, metadatas in item_list:
+            item_dict[ids] = convert_fn(ids, documents, metadatas)
     except Exception as e:
         # print(e)
         # traceback.print_exc()
         pass
 
-    return relationship_list
+    return item_dict
+
+
+def get_catalog(collection_name):
+    # in-memory metadata catalog of the current database
+    # chunk: {chunk_id: (paper_id, group_id)}
+    # summary: {summary_id: (chunk_id_list, from_base_chunk)}
+    key = (os.path.normpath(get_db_path()), collection_name)
+    with CATALOG_LOCK:
+        if key not in CATALOGS:
+            CATALOGS[key] = {}
+        return CATALOGS[key]
+
+
+def refresh_catalog():
+    with CATALOG_LOCK:
+        CATALOGS.clear()
+
+
+def get_catalog_items(collection_name, ids_list, convert_fn):
+    # return {ids: item} for ids_list, fetch the ids missing in the catalog with one get
+    catalog = get_catalog(collection_name)
+    ids_list = [str(ids) for ids in ids_list]
+
+    with CATALOG_LOCK:
+        missing_ids_list = list(set([ids for ids in ids_list if ids not in catalog]))
+
+    if missing_ids_list:
+        try:
+            collection = get_collection(collection_name)
+            results = collection.get(ids=missing_ids_list, include=['metadatas'])
+            with CATALOG_LOCK:
+                for ids, metadatas in zip(results['ids'], results['metadatas']):
+                    catalog[ids] = convert_fn(metadatas)
+        except Exception as e:
+            # print(e)
+            # traceback.print_exc()
+            pass
+
+    with CATALOG_LOCK:
+        return {ids: catalog[ids] for ids in ids_list if ids in catalog}
+
+
+def get_ref_ids_of_chunks(chunk_id_list):
+    # {chunk_id: (paper_id, group_id)}
+    return get_catalog_items(
+        COLLECTION_CHUNK,
+        chunk_id_list,
+        lambda metadatas: (metadatas['paper_id'], metadatas['group_id'])
+    )
 
 
 def get_ref_id_of_chunk(chunk_id):
-    paper_id = None
-    group_id = None
-    try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=COLLECTION_CHUNK)
+    return get_ref_ids_of_chunks([chunk_id]).get(str(chunk_id), (None, None))
+
+
+def get_base_chunk_ids_of_summaries(summary_metadatas_list):
+    # return the base chunk id list of each summary
+    # read base_chunk_id_list of the summary if it is saved,
+    # otherwise walk all summaries of a result set up the raptor tree together, one get per tree level
+    cur_list = []
+    for metadatas in summary_metadatas_list:
+        if 'base_chunk_id_list' in metadatas:
+            cur_list.append((json.loads(metadatas['base_chunk_id_list']), True))
+        else:
+            cur_list.append((json.loads(metadatas['chunk_id_list']), metadatas['from_base_chunk']))
+
+    while True:
+        parent_id_list = []
+        for chunk_id_list, from_base_chunk in cur_list:
+            if not from_base_chunk:
+                parent_id_list += chunk_id_list
+        if not parent_id_list:
+            break
 
-        results = collection.get(
-            ids=[str(chunk_id)]
+        summary_dict = get_catalog_items(
+            COLLECTION_SUMMARY,
+            parent_id_list,
+            lambda metadatas: (json.loads(metadatas['chunk_id_list']), metadatas['from_base_chunk'])
         )
 
-        paper_id = results['metadatas'][0]['paper_id']
-        group_id = results['metadatas'][0]['group_id']
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
+        new_list = []
+        for chunk_id_list, from_base_chunk in cur_list:
+            if not from_base_chunk:
+                tmp_chunk_id_list = []
+                tmp_from_base_chunk = True
+                for summary_id in chunk_id_list:
+                    if summary_id in summary_dict:
+                        tmp_chunk_id_list += summary_dict[summary_id][0]
+                        tmp_from_base_chunk = summary_dict[summary_id][1]
+                chunk_id_list = list(set(tmp_chunk_id_list))
+                from_base_chunk = tmp_from_base_chunk
+            new_list.append((chunk_id_list, from_base_chunk))
+        cur_list = new_list
 
-    return paper_id, group_id
+    return [chunk_id_list for chunk_id_list, _ in cur_list]
 
 
-def count_all_collection():
-    client = chromadb.PersistentClient(path=get_db_path())
+def get_paper_id_list_of_chunks(chunk_id_list, group_id, ref_dict):
+    paper_id_list = []
+    for chunk_id in chunk_id_list:
+        tmp_paper_id, tmp_group_id = ref_dict.get(str(chunk_id), (None, None))
+        if tmp_group_id == group_id:
+            paper_id_list.append(tmp_paper_id)
+    return list(set(paper_id_list))
 
-    # group
-    group_count = 0
-    try:
-        collection = client.get_collection(name=COLLECTION_GROUP)
-        all_data = collection.get()
-        group_count = len(all_data['ids'])
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
-    print('count of group:', group_count)
 
-    # paper
-    paper_count = 0
+def count_items(collection_name):
     try:
-        collection = client.get_collection(name=COLLECTION_PAPER)
-        all_data = collection.get()
-        paper_count = len(all_data['ids'])
+        if collection_name in STORE_COLLECTION_LIST and is_side_store_ready(collection_name):
+            return store.count_items(get_db_path(), collection_name)
+        return get_collection(collection_name).count()
     except Exception as e:
         # print(e)
         # traceback.print_exc()
-        pass
-    print('count of paper:', paper_count)
+        return 0
 
-    # chunk
-    chunk_count = 0
-    try:
-        collection = client.get_collection(name=COLLECTION_CHUNK)
-        all_data = collection.get()
-        chunk_count = len(all_data['ids'])
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
-    print('count of chunk:', chunk_count)
 
-    # relationship
-    relationship_count = 0
-    try:
-        collection = client.get_collection(name=COLLECTION_RELATIONSHIP)
-        all_data = collection.get()
-        relationship_count = len(all_data['ids'])
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
-    print('count of relationship:', relationship_count)
+def count_all_collection():
+    print('count of group:', count_items(COLLECTION_GROUP))
+    print('count of paper:', count_items(COLLECTION_PAPER))
+    print('count of chunk:', count_items(COLLECTION_CHUNK))
+    print('count of relationship:', count_items(COLLECTION_RELATIONSHIP))
+    print('count of community report:', count_items(COLLECTION_COMMUNITY_REPORT))
+    print('count of summary:', count_items(COLLECTION_SUMMARY))
 
-    # community report
-    report_count = 0
-    try:
-        collection = client.get_collection(name=COLLECTION_COMMUNITY_REPORT)
-        all_data = collection.get()
-        report_count = len(all_data['ids'])
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
-    print('count of community report:', report_count)
 
-    # summary
-    summary_count = 0
-    try:
-        collection = client.get_collection(name=COLLECTION_SUMMARY)
-        all_data = collection.get()
-        summary_count = len(all_data['ids'])
-    except Exception as e:
-        # print(e)
-        # traceback.print_exc()
-        pass
-    print('count of summary:', summary_count)
+def get_query_embedding(query_text):
+    # embed the question once, so every collection is searched with the same embedding
+    embedding = get_embedding_function()([query_text])[0]
+    return [float(x) for x in embedding]
 
 
-def query_base_chunk(query_text, top_k=20, query_group_id=-1):
-    client = chromadb.PersistentClient(path=get_db_path())
-    collection = client.get_collection(name=COLLECTION_CHUNK)
+def query_collection(collection_name, query_text, top_k=20, query_group_id=-1, query_embedding=None):
+    collection = get_collection(collection_name)
 
-    results = collection.query(
-        query_texts=[query_text],
+    query_kwargs = {'query_texts': [query_text]} if query_embedding is None else {'query_embeddings': [query_embedding]}
+    return collection.query(
         n_results=top_k,
-        where=None if query_group_id == -1 else {'group_id': str(query_group_id)}
+        where=None if query_group_id == -1 else {'group_id': str(query_group_id)},
+        **query_kwargs
     )
 
+
+def query_base_chunk(query_text, top_k=20, query_group_id=-1, query_embedding=None):
+    results = query_collection(COLLECTION_CHUNK, query_text, top_k, query_group_id, query_embedding)
+
     result_list = []
     for i in range(len(results['ids'][0])):
         chunk_id = results['ids'][0][i]
-        paper_id, group_id = get_ref_id_of_chunk(chunk_id)
+        # paper id and group id are in the chunk metadatas already
+        paper_id = results['metadatas'][0][i]['paper_id']
+        group_id = results['metadatas'][0][i]['group_id']
         result_list.append({
             'id': chunk_id,
             'text': results['documents'][0][i],
@@ -554,42 +1104,24 @@ def query_base_chunk(query_text, top_k=20, query_group_id=-1):
     return result_list
 
 
-def query_summary_chunk(query_text, top_k=20, query_group_id=-1):
-    client = chromadb.PersistentClient(path=get_db_path())
-    collection = client.get_collection(name=COLLECTION_SUMMARY)
+def query_summary_chunk(query_text, top_k=20, query_group_id=-1, query_embedding=None):
+    results = query_collection(COLLECTION_SUMMARY, query_text, top_k, query_group_id, query_embedding)
 
-    results = collection.query(
-        query_texts=[query_text],
-        n_results=top_k,
-        where=None if query_group_id == -1 else {'group_id': str(query_group_id)}
-    )
-
-    summary_list = get_all_summary_chunks()
+    # summaries saved with paper_id_list need no lookup, the others are resolved through the raptor tree
+    resolve_idx_list = [i for i, metadatas in enumerate(results['metadatas'][0]) if 'paper_id_list' not in metadatas]
+    base_chunk_id_list_list = get_base_chunk_ids_of_summaries([results['metadatas'][0][i] for i in resolve_idx_list])
+    ref_dict = get_ref_ids_of_chunks([chunk_id for chunk_id_list in base_chunk_id_list_list for chunk_id in chunk_id_list])
+    resolved_dict = dict(zip(resolve_idx_list, base_chunk_id_list_list))
 
     result_list = []
     for i in range(len(results['ids'][0])):
         summary_id = results['ids'][0][i]
         group_id = results['metadatas'][0][i]['group_id']
 
-        from_base_chunk = results['metadatas'][0][i]['from_base_chunk']
-        cur_chunk_id_list = json.loads(results['metadatas'][0][i]['chunk_id_list'])
-        while not from_base_chunk:
-            tmp_chunk_id_list = []
-            for tmp_summary_id in cur_chunk_id_list:
-                for summary in summary_list:
-                    if summary['summary_id'] == tmp_summary_id:
-                        tmp_chunk_id_list += summary['chunk_id_list']
-                        from_base_chunk = summary['from_base_chunk']
-                        break
-            cur_chunk_id_list = list(set(tmp_chunk_id_list))
-
-        paper_id_list = []
-        for chunk_id in cur_chunk_id_list:
-            tmp_paper_id, tmp_group_id = get_ref_id_of_chunk(chunk_id)
-            if tmp_group_id == group_id:
-                paper_id_list.append(tmp_paper_id)
-
-        paper_id_list = list(set(paper_id_list))
+        if i in resolved_dict:
+            paper_id_list = get_paper_id_list_of_chunks(resolved_dict[i], group_id, ref_dict)
+        else:
+            paper_id_list = json.loads(results['metadatas'][0][i]['paper_id_list'])
 
         result_list.append({
             'id': summary_id,
@@ -604,28 +1136,18 @@ def query_summary_chunk(query_text, top_k=20, query_group_id=-1):
     return result_list
 
 
-def query_report_chunk(query_text, top_k=20, query_group_id=-1):
-    client = chromadb.PersistentClient(path=get_db_path())
-    collection = client.get_collection(name=COLLECTION_COMMUNITY_REPORT)
+def query_report_chunk(query_text, top_k=20, query_group_id=-1, query_embedding=None):
+    results = query_collection(COLLECTION_COMMUNITY_REPORT, query_text, top_k, query_group_id, query_embedding)
 
-    results = collection.query(
-        query_texts=[query_text],
-        n_results=top_k,
-        where=None if query_group_id == -1 else {'group_id': str(query_group_id)}
-    )
+    chunk_id_list_list = [json.loads(metadatas['chunk_id_list']) for metadatas in results['metadatas'][0]]
+    ref_dict = get_ref_ids_of_chunks([chunk_id for chunk_id_list in chunk_id_list_list for chunk_id in chunk_id_list])
 
     result_list = []
     for i in range(len(results['ids'][0])):
         report_id = results['ids'][0][i]
-
-        chunk_id_list = json.loads(results['metadatas'][0][i]['chunk_id_list'])
         group_id = results['metadatas'][0][i]['group_id']
 
-        paper_id_list = []
-        for chunk_id in chunk_id_list:
-            tmp_paper_id, tmp_group_id = get_ref_id_of_chunk(chunk_id)
-            if tmp_group_id == group_id:
-                paper_id_list.append(tmp_paper_id)
+        paper_id_list = get_paper_id_list_of_chunks(chunk_id_list_list[i], group_id, ref_dict)
 
         result_list.append({
             'id': report_id,
@@ -666,67 +1188,50 @@ def get_query_chunks(query_option, query_text, top_k=20, query_group_id=-1):
         need_summary_chunk = False
         need_report_chunk = False
 
-    base_chunk_list = query_base_chunk(query_text, top_k, query_group_id) if need_base_chunk else []
-    summary_chunk_list = query_summary_chunk(query_text, top_k, query_group_id) if need_summary_chunk else []
-    report_chunk_list = query_report_chunk(query_text, top_k, query_group_id) if need_report_chunk else []
-
-    chunk_list = base_chunk_list + summary_chunk_list + report_chunk_list
-    chunk_list.sort(key=lambda x: x['distance'], reverse=False)
-
-    return chunk_list[:top_k]
+    query_fn_list = []
+    if need_base_chunk:
+        query_fn_list.append(query_base_chunk)
+    if need_summary_chunk:
+        query_fn_list.append(query_summary_chunk)
+    if need_report_chunk:
+        query_fn_list.append(query_report_chunk)
 
+    if not query_fn_list:
+        return []
 
-def get_db_path():
-    try:
-        with open(DB_TMP_FILE_PATH, 'r') as f:
-            db_path = f.read()
-        db_path = db_path.strip()
-        if not db_path:
-            db_path = DATABASE_PATH
-    except:
-        db_path = DATABASE_PATH
-    return db_path
+    query_embedding = get_query_embedding(query_text)
 
+    # search the collections at the same time, each thread runs in a copy of the current context
+    with ThreadPoolExecutor(max_workers=len(query_fn_list)) as executor:
+        future_list = [
+            executor.submit(contextvars.copy_context().run, query_fn, query_text, top_k, query_group_id, query_embedding)
+            for query_fn in query_fn_list
+        ]
+        chunk_list_list = [future.result() for future in future_list]
 
-def update_db_path(new_db_path):
-    with open(DB_TMP_FILE_PATH, 'w') as f:
-        f.write(new_db_path)
-        f.flush()
-
+    # the results of each collection are sorted by distance already
+    chunk_list = heapq.merge(*chunk_list_list, key=lambda x: x['distance'])
 
-def rm_db_tmp_file():
-    if os.path.isfile(DB_TMP_FILE_PATH):
-        os.remove(DB_TMP_FILE_PATH)
+    return list(itertools.islice(chunk_list, top_k))
 
 
-def get_group_id_by_tmp_file():
-    try:
-        with open(GROUP_ID_TMP_FILE_PATH, 'r') as f:
-            group_id = f.read()
-        group_id = group_id.strip()
-    except:
-        group_id = ''
-    return group_id
+def get_db_path():
+    return context.get_context().db_path or DATABASE_PATH
 
 
-def update_group_id_tmp_file(group_id):
-    with open(GROUP_ID_TMP_FILE_PATH, 'w') as f:
-        f.write(group_id)
-        f.flush()
+def update_db_path(new_db_path):
+    context.update_context(db_path=new_db_path)
+    reset_clients()
 
 
-def rm_group_id_tmp_file():
-    if os.path.isfile(GROUP_ID_TMP_FILE_PATH):
-        os.remove(GROUP_ID_TMP_FILE_PATH)
+def get_cur_group_id():
+    # group being indexed by the graphrag subprocess, '' otherwise
+    return context.get_context().group_id
 
 
 def check_group_id(group_id):
-    group_exist = False
-    for group in get_all_groups():
-        if group['group_id'] == str(group_id):
-            group_exist = True
-            break
-    return group_exist
+    # existence only, without reading the metadatas
+    return str(group_id) in get_items_by_ids(COLLECTION_GROUP, [group_id], lambda ids, documents, metadatas: ids, include=[])
 
 
 def split_text_into_chunks(text, min_num_char=1000):
@@ -793,55 +1298,112 @@ def split_text_into_sub_chunks(denoised_text, min_num_tokens=300):
 
 
 def get_chunks_for_graphrag(text):
+    # return [(chunk_text, chunk_metadata)], chunk_metadata carries the chunk identity through the graphrag pipeline
     paper_id = get_id(COLLECTION_PAPER, text)
     chunks = []
-    for chunk in get_all_chunks():
+    for chunk in get_all_chunks(where={'paper_id': paper_id}):
         if chunk['paper_id'] == paper_id:
+            chunk_metadata = {
+                'chunk_id': chunk['chunk_id'],
+                'paper_id': chunk['paper_id'],
+                'group_id': chunk['group_id'],
+                'sub_chunk_idx': -1,
+            }
             if len(chunk['sub_chunks']) > 0:
-                chunks += chunk['sub_chunks']
+                for sub_chunk_idx, sub_chunk in enumerate(chunk['sub_chunks']):
+                    chunks.append((sub_chunk, {**chunk_metadata, 'sub_chunk_idx': sub_chunk_idx}))
             else:
-                chunks.append(chunk['chunk_content'])
+                chunks.append((chunk['chunk_content'], chunk_metadata))
     return chunks
 
 
+def get_ids_where(collection_name, where):
+    # ids of the items matching where, without documents or metadatas
+    if collection_name in STORE_COLLECTION_LIST:
+        return [ids for ids, _, _ in iter_items(collection_name, include=[], where=where)]
+
+    try:
+        collection = get_collection(collection_name)
+        return collection.get(where=where, include=[])['ids']
+    except Exception as e:
+        # print(e)
+        # traceback.print_exc()
+        return []
+
+
 def get_ref_ids_for_group(group_id):
+    # cached per group, the cache of a group is dropped when items of the group are written or any item is deleted
     group_id = str(group_id)
+    key = (os.path.normpath(get_db_path()), group_id)
 
-    paper_id_list = []
-    for paper in get_all_papers():
-        if paper['group_id'] == group_id:
-            paper_id_list.append(paper['paper_id'])
-    paper_id_list = list(set(paper_id_list))
+    with GROUP_REF_LOCK:
+        ref_ids = GROUP_REF_CACHE.get(key)
+    if ref_ids is None:
+        ref_ids = build_ref_ids_for_group(group_id)
+        with GROUP_REF_LOCK:
+            GROUP_REF_CACHE[key] = ref_ids
 
-    chunk_id_list = []
-    for chunk in get_all_chunks():
-        if chunk['paper_id'] in paper_id_list or chunk['group_id'] == group_id:
-            chunk_id_list.append(chunk['chunk_id'])
-    chunk_id_list = list(set(chunk_id_list))
-
-    report_id_list = []
-    for report in get_all_community_reports():
-        for chunk_id in report['chunk_id_list']:
-            if chunk_id in chunk_id_list:
-                report_id_list.append(report['report_id'])
-                break
-    report_id_list = list(set(report_id_list))
-
-    summary_id_list = []
-    for summary in get_all_summary_chunks():
-        if summary['group_id'] == group_id:
-            summary_id_list.append(summary['summary_id'])
-    summary_id_list = list(set(summary_id_list))
-
-    relationship_id_list = []
-    for relationship in get_all_relationships():
-        if relationship['chunk_id'] in chunk_id_list:
-            relationship_id_list.append(relationship['relationship_id'])
-    relationship_id_list = list(set(relationship_id_list))
+    # copies, so callers can change the lists
+    return tuple(list(id_list) for id_list in ref_ids)
+
+
+def build_ref_ids_for_group(group_id):
+    paper_id_list = list(set(get_ids_where(COLLECTION_PAPER, {'group_id': group_id})))
+
+    chunk_where = {'group_id': group_id}
+    if paper_id_list:
+        chunk_where = {'$or': [chunk_where, {'paper_id': {'$in': paper_id_list}}]}
+    chunk_id_list = list(set(get_ids_where(COLLECTION_CHUNK, chunk_where)))
+
+    # reports only refer to chunks of their own group
+    report_id_list = list(set(get_ids_where(COLLECTION_COMMUNITY_REPORT, {'group_id': group_id})))
+
+    summary_id_list = list(set(get_ids_where(COLLECTION_SUMMARY, {'group_id': group_id})))
+
+    # relationships saved before group_id was added are found by their chunk id
+    relationship_where = {'group_id': group_id}
+    if chunk_id_list:
+        relationship_where = {'$or': [relationship_where, {'chunk_id': {'$in': chunk_id_list}}]}
+    relationship_id_list = list(set(get_ids_where(COLLECTION_RELATIONSHIP, relationship_where)))
 
     return paper_id_list, chunk_id_list, relationship_id_list, report_id_list, summary_id_list
 
 
+def invalidate_ref_ids_for_group(group_id_list=None):
+    # group_id_list None drops the cache of all groups
+    with GROUP_REF_LOCK:
+        if group_id_list is None:
+            GROUP_REF_CACHE.clear()
+        else:
+            for key in list(GROUP_REF_CACHE.keys()):
+                if key[1] in group_id_list:
+                    GROUP_REF_CACHE.pop(key, None)
+
+
+def backfill_relationship_group_id():
+    # set the group_id of relationships saved without one, from the group of their chunk
+    ids_list = []
+    chunk_id_list = []
+    for ids, _, metadatas in iter_items(COLLECTION_RELATIONSHIP, include=['metadatas'], where={'group_id': ''}):
+        ids_list.append(ids)
+        chunk_id_list.append(metadatas['chunk_id'])
+
+    ref_dict = get_ref_ids_of_chunks(chunk_id_list)
+    new_ids_list = []
+    new_metadatas_list = []
+    for ids, chunk_id in zip(ids_list, chunk_id_list):
+        _, group_id = ref_dict.get(str(chunk_id), (None, None))
+        if group_id:
+            new_ids_list.append(ids)
+            new_metadatas_list.append({'group_id': group_id})
+
+    if new_ids_list:
+        store.update_items(get_db_path(), COLLECTION_RELATIONSHIP, new_ids_list, new_metadatas_list)
+        invalidate_ref_ids_for_group()
+
+    return len(new_ids_list)
+
+
 def count_ref_ids_for_group(group_id):
     paper_id_list, chunk_id_list, relationship_id_list, report_id_list, summary_id_list = get_ref_ids_for_group(group_id)
 
@@ -857,24 +1419,127 @@ def count_ref_ids_for_group(group_id):
     print('Number of summary:', len(summary_id_list))
 
 
+def start_journal_unit(stage, unit, group_id):
+    store.set_journal_unit(get_db_path(), group_id, stage, unit, JOURNAL_STARTED)
+
+
+def finish_journal_unit(stage, unit, group_id, item_ids=None, output=''):
+    # item_ids: {collection_name: [ids]} of the items written by the unit, kept when the stage is rolled back
+    # output: result of the unit that a restart reuses
+    store.set_journal_unit(get_db_path(), group_id, stage, unit, JOURNAL_DONE, item_ids, output)
+
+
+def get_journal_unit(stage, unit, group_id):
+    # {'status': status, 'item_ids': item_ids, 'output': output} of the unit, None if it was never started
+    return store.get_journal_units(get_db_path(), group_id, stage, unit).get(str(unit))
+
+
+def get_done_journal_output(stage, unit, group_id):
+    # output of a done unit, None if the unit has to run
+    if not unit or not group_id:
+        return None
+
+    journal_unit = get_journal_unit(stage, unit, group_id)
+    if journal_unit is None or journal_unit['status'] != JOURNAL_DONE:
+        return None
+    return journal_unit['output']
+
+
+def get_sub_chunk_unit(chunk_metadata):
+    # journal unit of a sub chunk from the chunk metadata handed to the graphrag extractor, '' without a chunk id
+    # split_idx: index of the piece when the extractor splits the sub chunk again (prechunked: false)
+    if not chunk_metadata or not chunk_metadata.get('chunk_id'):
+        return ''
+    unit = f"{chunk_metadata['chunk_id']}:{chunk_metadata.get('sub_chunk_idx', -1)}"
+    if 'split_idx' in chunk_metadata:
+        unit += f":{chunk_metadata['split_idx']}"
+    return unit
+
+
+def rollback_journal_stage(group_id, stage):
+    # before a stage of a group runs again, delete the items of the group in the collections of the stage
+    # that no done unit wrote, e.g. the relationships of a sub chunk cut off by a crash, or items saved before the journal
+    # the done units are kept and skipped by the stage, return the number of deleted items
+    group_id = str(group_id)
+    db_path = get_db_path()
+    _, _, relationship_id_list, report_id_list, summary_id_list = get_ref_ids_for_group(group_id)
+    group_id_dict = {
+        COLLECTION_RELATIONSHIP: relationship_id_list,
+        COLLECTION_COMMUNITY_REPORT: report_id_list,
+        COLLECTION_SUMMARY: summary_id_list,
+    }
+
+    count = 0
+    for unit_stage, collection_name in JOURNAL_STAGE_UNITS[stage].items():
+        kept_id_set = set()
+        for journal_unit in store.get_journal_units(db_path, group_id, unit_stage).values():
+            if journal_unit['status'] == JOURNAL_DONE:
+                kept_id_set |= set([str(ids) for ids in journal_unit['item_ids'].get(collection_name, [])])
+
+        rollback_id_list = [ids for ids in group_id_dict[collection_name] if str(ids) not in kept_id_set]
+        if rollback_id_list:
+            delete_items(collection_name, rollback_id_list)
+            count += len(rollback_id_list)
+
+    store.delete_journal_units(db_path, group_id, list(JOURNAL_STAGE_UNITS[stage].keys()), keep_done=True)
+
+    return count
+
+
+def prune_journal_units(stage, unit_list, group_id):
+    # once a run of the unit stage went through all its units, delete the done units it did not produce and the items they wrote,
+    # e.g. the reports of communities whose context changed after a restart because a description summary came out differently
+    # return the number of deleted items
+    group_id = str(group_id)
+    db_path = get_db_path()
+    unit_set = set([str(unit) for unit in unit_list])
+
+    stale_unit_list = []
+    stale_item_dict = {}
+    for unit, journal_unit in store.get_journal_units(db_path, group_id, stage).items():
+        if unit in unit_set:
+            continue
+        stale_unit_list.append(unit)
+        for collection_name, ids_list in journal_unit['item_ids'].items():
+            stale_item_dict.setdefault(collection_name, []).extend(ids_list)
+
+    count = 0
+    for collection_name, ids_list in stale_item_dict.items():
+        if ids_list:
+            delete_items(collection_name, ids_list)
+            count += len(ids_list)
+
+    if stale_unit_list:
+        store.delete_journal_units(db_path, group_id, [stage], unit_list=stale_unit_list)
+
+    return count
+
+
+def delete_journal(group_id, stage_list):
+    store.delete_journal_units(get_db_path(), group_id, stage_list)
+
+
 def delete_items(collection_name: str, ids: list):
     try:
-        client = chromadb.PersistentClient(path=get_db_path())
-        collection = client.get_collection(name=collection_name)
-        collection.delete(ids=ids)
+        db_path = get_db_path()
+        if collection_name in STORE_COLLECTION_LIST:
+            check_side_store(collection_name)
+            store.delete_items(db_path, collection_name, ids)
+        else:
+            collection = get_collection(collection_name)
+            collection.delete(ids=ids)
+            if collection_name == COLLECTION_CHUNK:
+                store.delete_chunk_texts(db_path, ids)
+        store.delete_content_hashes(db_path, collection_name, ids)
+        refresh_catalog()
+        invalidate_ref_ids_for_group()
     except:
         pass
 
 
 def delete_group(group_id, del_graphrag=True, del_raptor=True):
     group_id = str(group_id)
-    group_exist = False
-    for group in get_all_groups():
-        if group['group_id'] == group_id:
-            group_exist = True
-            break
-
-    if not group_exist:
+    if not check_group_id(group_id):
         print(f'Group ID {group_id} does not exist.')
         return
 
@@ -884,17 +1549,21 @@ def delete_group(group_id, del_graphrag=True, del_raptor=True):
 
     paper_id_list, chunk_id_list, relationship_id_list, report_id_list, summary_id_list = get_ref_ids_for_group(group_id)
 
+    # the journal of the deleted stages goes as well, so they run from the start the next time
     if del_graphrag:
         if relationship_id_list:
             delete_items(COLLECTION_RELATIONSHIP, relationship_id_list)
         if report_id_list:
             delete_items(COLLECTION_COMMUNITY_REPORT, report_id_list)
+        delete_journal(group_id, [JOURNAL_GRAPHRAG] + list(JOURNAL_STAGE_UNITS[JOURNAL_GRAPHRAG].keys()))
 
     if del_raptor:
         if summary_id_list:
             delete_items(COLLECTION_SUMMARY, summary_id_list)
+        delete_journal(group_id, [JOURNAL_RAPTOR] + list(JOURNAL_STAGE_UNITS[JOURNAL_RAPTOR].keys()))
 
     if del_graphrag and del_raptor:
+        delete_journal(group_id, [JOURNAL_DENOISE])
         delete_items(COLLECTION_GROUP, [group_id])
         if paper_id_list:
             delete_items(COLLECTION_PAPER, paper_id_list)
@@ -906,20 +1575,13 @@ def delete_group(group_id, del_graphrag=True, del_raptor=True):
 
 
 def get_group_name(group_id):
-    group_name = ''
-    for group in get_all_groups():
-        if group['group_id'] == str(group_id):
-            group_name = group['group_name']
-            break
-    return group_name
+    group = get_items_by_ids(COLLECTION_GROUP, [group_id], convert_group).get(str(group_id))
+    return group['group_name'] if group is not None else ''
 
 
 def get_paper_name(paper_id, with_suffix=False):
-    paper_name = ''
-    for paper in get_all_papers():
-        if paper['paper_id'] == str(paper_id):
-            paper_name = paper['paper_name']
-            break
+    paper = get_items_by_ids(COLLECTION_PAPER, [paper_id], convert_paper).get(str(paper_id))
+    paper_name = paper['paper_name'] if paper is not None else ''
     if not with_suffix:
         paper_name = os.path.splitext(paper_name)[0]
     return paper_name
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+
+PRJ_DIR = Path(os.path.dirname(os.path.realpath(__file__))).parent.parent.absolute()
+# one cache for all databases and runs, so re-indexing a group or re-running a query reuses earlier responses
+CACHE_PATH = os.environ.get('RG_RAG_LLM_CACHE_PATH', '') or os.path.join(PRJ_DIR, 'my_graphrag', 'llm_cache.sqlite3')
+# the least recently used responses are evicted when the cache grows past this size
+MAX_CACHE_BYTES = int(os.environ.get('RG_RAG_LLM_CACHE_MAX_BYTES', str(1 << 30)))
+# the cache size is checked after this many new responses
+EVICT_CHECK_INTERVAL = 100
+
+LOCK = threading.RLock()
+CONNECTIONS = {}
+PUT_COUNTS = {}
+
+
+def get_connection(cache_path=None):
+    cache_path = os.path.normpath(cache_path or CACHE_PATH)
+    with LOCK:
+        conn = CONNECTIONS.get(cache_path)
+        if conn is None:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            conn = sqlite3.connect(cache_path, timeout=60, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            init_tables(conn)
+            CONNECTIONS[cache_path] = conn
+    return conn
+
+
+def init_tables(conn):
+    # llm_cache
+    # key: sha256 of model path, prompt and sampling params
+    # model_path: model that gave the response
+    # response: raw response text, before the think part is removed
+    # size: bytes of response, for eviction
+    # last_used: unix time of the last read or write, for eviction
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            model_path TEXT NOT NULL,
+            response TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL
+        )
+        '''
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)')
+
+
+def get_cache_key(model_path, prompt, sampling_params=None):
+    # the model is keyed by its folder name, so moving the models folder keeps the cache valid
+    data = json.dumps(
+        [os.path.basename(os.path.normpath(model_path)), prompt, sampling_params or {}],
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def get_many(key_list, cache_path=None):
+    # {key: response} of the keys in the cache
+    key_list = list(set(key_list))
+    if not key_list:
+        return {}
+
+    with LOCK:
+        conn = get_connection(cache_path)
+        rows = conn.execute(
+            'SELECT key, response FROM llm_cache WHERE key IN (SELECT value FROM json_each(?))',
+            (json.dumps(key_list),)
+        ).fetchall()
+        if rows:
+            conn.execute(
+                'UPDATE llm_cache SET last_used = ? WHERE key IN (SELECT value FROM json_each(?))',
+                (time.time(), json.dumps([key for key, _ in rows]))
+            )
+
+    return dict(rows)
+
+
+def put_many(item_list, cache_path=None):
+    # item_list: [(key, model_path, response)], empty responses are not cached because failed calls return ''
+    item_list = [(key, model_path, response) for key, model_path, response in item_list if response]
+    if not item_list:
+        return
+
+    now = time.time()
+    with LOCK:
+        conn = get_connection(cache_path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO llm_cache (key, model_path, response, size, last_used) VALUES (?, ?, ?, ?, ?)',
+                [(key, model_path, response, len(response.encode()), now) for key, model_path, response in item_list]
+            )
+            conn.execute('COMMIT')
+        except:
+            conn.execute('ROLLBACK')
+            raise
+
+        cache_key = os.path.normpath(cache_path or CACHE_PATH)
+        PUT_COUNTS[cache_key] = PUT_COUNTS.get(cache_key, 0) + len(item_list)
+        if PUT_COUNTS[cache_key] >= EVICT_CHECK_INTERVAL:
+            PUT_COUNTS[cache_key] = 0
+            evict(MAX_CACHE_BYTES, cache_path)
+
+
+def evict(max_bytes, cache_path=None):
+    # delete the least recently used responses until the cache is at most max_bytes, return the number deleted
+    with LOCK:
+        conn = get_connection(cache_path)
+        total_size = conn.execute('SELECT COALESCE(SUM(size), 0) FROM llm_cache').fetchone()[0]
+        if total_size <= max_bytes:
+            return 0
+
+        delete_key_list = []
+        for key, size in conn.execute('SELECT key, size FROM llm_cache ORDER BY last_used'):
+            if total_size <= max_bytes:
+                break
+            delete_key_list.append(key)
+            total_size -= size
+
+        conn.execute(
+            'DELETE FROM llm_cache WHERE key IN (SELECT value FROM json_each(?))',
+            (json.dumps(delete_key_list),)
+        )
+
+    return len(delete_key_list)
+
+
+def clear(cache_path=None):
+    with LOCK:
+        conn = get_connection(cache_path)
+        conn.execute('DELETE FROM llm_cache')
@@ -0,0 +1,361 @@
+import os
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# stand-in for sglang.launch_server that speaks /v1/chat/completions without a GPU or weights,
+# the responses are canned from the prompt so the pipeline can run end to end on any machine
+# python -m graphrag.my_graphrag.mock_server --model-path ./models/Llama-3.1-8B-Instruct --port 30000
+
+
+# seconds before the first token of an uncached prompt and tokens per second of every response
+TTFT = float(os.environ.get('RG_RAG_MOCK_TTFT', '0.05'))
+TOKENS_PER_SECOND = float(os.environ.get('RG_RAG_MOCK_TOKENS_PER_SECOND', '200'))
+MODEL_PATH = ''
+# prompts seen last, the cached tokens of a prompt are its longest common prefix with one of them, like the radix cache
+PREFIX_CACHE_SIZE = 256
+PREFIX_CACHE = []
+PREFIX_CACHE_LOCK = threading.Lock()
+CACHE_REPORT = False
+# requests in the running batch, the others wait in the queue as on a GPU with a full KV cache
+MAX_RUNNING_REQUESTS = int(os.environ.get('RG_RAG_MOCK_MAX_RUNNING', '64'))
+RUNNING_SLOTS = None
+REQUEST_COUNTS = {'running': 0, 'queue': 0}
+REQUEST_COUNTS_LOCK = threading.Lock()
+
+STOP_WORDS = {
+    'the', 'this', 'that', 'these', 'those', 'there', 'then', 'than', 'they', 'them', 'their', 'what', 'when', 'where',
+    'which', 'while', 'who', 'whom', 'why', 'how', 'and', 'but', 'for', 'with', 'from', 'into', 'about', 'also', 'does',
+    'have', 'has', 'had', 'was', 'were', 'are', 'is', 'its', 'it', 'not', 'you', 'your', 'our', 'one', 'all', 'any',
+    'can', 'may', 'might', 'should', 'would', 'could', 'will', 'need', 'some', 'such', 'other', 'only', 'very', 'more',
+}
+
+
+def get_section(text, start, end=None):
+    # text between the start and end markers, '' if start is not found
+    if start not in text:
+        return ''
+    text = text.split(start, 1)[1]
+    if end and end in text:
+        text = text.split(end, 1)[0]
+    return text.strip()
+
+
+def clean_text(text):
+    # no markup, so the canned XML always parses
+    return re.sub(r'\s+', ' ', re.sub(r'[<>&]', ' ', text)).strip()
+
+
+def get_sentences(text, max_count=5):
+    sentence_list = [clean_text(s) for s in re.split(r'(?<=[.!?])\s+|\n+', text)]
+    return [s for s in sentence_list if len(s.split()) >= 3][:max_count]
+
+
+def get_keywords(text):
+    return {w.lower() for w in re.findall(r"[A-Za-z][A-Za-z'-]{3,}", text) if w.lower() not in STOP_WORDS}
+
+
+def get_entity_names(text, max_count=5):
+    # capitalized words in order of appearance, the most frequent long words if there are too few
+    name_list = []
+    for word in re.findall(r'\b[A-Z][A-Za-z-]{2,}\b', text):
+        name = word.upper()
+        if word.lower() not in STOP_WORDS and name not in name_list:
+            name_list.append(name)
+
+    if len(name_list) < 2:
+        count_dict = {}
+        for word in re.findall(r'[A-Za-z]{5,}', text):
+            if word.lower() not in STOP_WORDS:
+                count_dict[word.upper()] = count_dict.get(word.upper(), 0) + 1
+        for name in sorted(count_dict, key=lambda k: -count_dict[k]):
+            if name not in name_list:
+                name_list.append(name)
+
+    return name_list[:max_count]
+
+
+def get_bullets(sentence_list, marker='-'):
+    return '\n\n'.join(f'{marker} {sentence}' for sentence in sentence_list)
+
+
+def get_describing_sentence(name, text):
+    for sentence in get_sentences(text, max_count=100):
+        if name.lower() in sentence.lower():
+            return sentence
+    return f'{name.title()} is mentioned in the text.'
+
+
+def get_entities_xml(name_list, text):
+    return '\n'.join(
+        f'<entity>\n    <entity_name>{name}</entity_name>\n    <entity_type>CONCEPT</entity_type>\n'
+        f'    <entity_description>{get_describing_sentence(name, text)}</entity_description>\n</entity>'
+        for name in name_list
+    )
+
+
+def get_relationships_xml(name_list):
+    return '\n'.join(
+        f'<relationship>\n    <source_entity>{source}</source_entity>\n    <target_entity>{target}</target_entity>\n'
+        f'    <relationship_description>{source.title()} and {target.title()} are mentioned together in the text.</relationship_description>\n'
+        f'    <relationship_strength>5</relationship_strength>\n</relationship>'
+        for source, target in zip(name_list, name_list[1:])
+    )
+
+
+def get_heading(text):
+    sentence_list = get_sentences(text, max_count=1) or [clean_text(text) or 'Summary']
+    return ' '.join(sentence_list[0].rstrip('.!?').split()[:6])
+
+
+def get_response_text(prompt):
+    # (prompt type, canned answer), the type is found by the wording of the prompts
+    if 'Reorganise the following text into bullet points' in prompt:
+        text = get_section(prompt, '== Text')
+        return 'denoise', '\n'.join(f'# {sentence}' for sentence in get_sentences(text, max_count=20))
+
+    if '== Real Data' in prompt and '<entity>' in prompt:
+        text = get_section(prompt, '== Real Data\nText:')
+        name_list = get_entity_names(text)
+        return 'extraction', get_entities_xml(name_list, text) + '\n' + get_relationships_xml(name_list) + '\n'
+
+    if 'put the single word NOMORE' in prompt:
+        return 'gleaning', 'NOMORE'
+
+    if 'Identify all entities whose <entity_name> appears in the source text' in prompt:
+        text = get_section(prompt, '== Source Text', '== Entities').lower()
+        entity_list = re.findall(r'<entity>.*?</entity>', get_section(prompt, '== Entities', '== Important Reminder'), re.DOTALL)
+        entity_list = [e for e in entity_list if re.search(r'<entity_name>(.*?)</entity_name>', e).group(1).strip().lower() in text]
+        return 'entity_identification', '\n'.join(entity_list) + '\n'
+
+    if 'combine all the information into a single, comprehensive description' in prompt:
+        name = get_section(prompt, 'Entity:', 'Description List:')
+        description_list = get_sentences(get_section(prompt, 'Description List:'), max_count=3)
+        return 'description_summary', f'{name.title()}: ' + ' '.join(description_list)
+
+    if 'compile a comprehensive report' in prompt:
+        text = get_section(prompt, '=== Text')
+        sentence_list = get_sentences(text, max_count=4)
+        insight_list = [f'### {get_heading(sentence)}\n\n{sentence}' for sentence in sentence_list]
+        return 'community_report', (
+            f'Title: {get_heading(text)}\n\nSummary: {" ".join(sentence_list[:2])}\n\nInsights:\n\n' + '\n\n'.join(insight_list)
+        )
+
+    if 'Please determine whether the text is relevant to the question' in prompt:
+        question = get_section(prompt, '<question>', '</question>')
+        text = get_section(prompt, '<text>', '</text>')
+        keyword_set = get_keywords(question)
+        sentence_list = [s for s in get_sentences(text, max_count=100) if get_keywords(s) & keyword_set][:3]
+        if not sentence_list:
+            return 'query_step1', '<relevant>no</relevant>'
+        return 'query_step1', (
+            f'<relevant>yes</relevant>\n<info>\n<heading>{get_heading(question)}</heading>\n{get_bullets(sentence_list)}\n</info>'
+        )
+
+    if 'Please provide a structured answer to the question' in prompt:
+        info_list = re.findall(r'<info>(.*?)</info>', prompt, re.DOTALL)
+        sentence_list = [s.lstrip('- ') for info in info_list for s in get_sentences(info, max_count=3)]
+        return 'query_step2', get_bullets(sentence_list[:10]) or 'No relevant information was found.'
+
+    if 'descriptive heading that captures the core theme' in prompt:
+        return 'raptor_step3', get_heading(get_section(prompt, '<text>', '</text>'))
+
+    if prompt.startswith('Summarize the following text in bullet points') or prompt.startswith('Please refine the following text'):
+        return 'raptor_summary', get_bullets(get_sentences(get_section(prompt, '<text>', '</text>'), max_count=8))
+
+    return 'other', ' '.join(get_sentences(prompt, max_count=2))
+
+
+def get_think_text(prompt_type):
+    return f'Okay, the prompt type is {prompt_type}. Let me read the text and answer in the requested format.\n</think>\n\n'
+
+
+def is_thinking_model(model_path):
+    return 'DeepSeek-R1' in os.path.basename(os.path.normpath(model_path))
+
+
+def get_tokens(text):
+    # about one token per word
+    return re.findall(r'\s*\S+\s*', text)
+
+
+def count_request(key, n):
+    with REQUEST_COUNTS_LOCK:
+        REQUEST_COUNTS[key] += n
+
+
+def get_metrics_text():
+    # the gauges of sglang --enable-metrics that the client reads
+    labels = '{model_name="%s"}' % MODEL_PATH
+    return (
+        f'# TYPE sglang:num_running_reqs gauge\nsglang:num_running_reqs{labels} {float(REQUEST_COUNTS["running"])}\n'
+        f'# TYPE sglang:num_queue_reqs gauge\nsglang:num_queue_reqs{labels} {float(REQUEST_COUNTS["queue"])}\n'
+    )
+
+
+def get_cached_tokens(prompt_token_list):
+    with PREFIX_CACHE_LOCK:
+        cached_tokens = 0
+        for token_list in PREFIX_CACHE:
+            n = 0
+            for a, b in zip(token_list, prompt_token_list):
+                if a != b:
+                    break
+                n += 1
+            cached_tokens = max(cached_tokens, n)
+
+        PREFIX_CACHE.append(prompt_token_list)
+        del PREFIX_CACHE[:-PREFIX_CACHE_SIZE]
+    return cached_tokens
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path in ['/health', '/health_generate']:
+            self.send_json({})
+        elif self.path == '/v1/models':
+            self.send_json({'object': 'list', 'data': [{'id': MODEL_PATH, 'object': 'model'}]})
+        elif self.path == '/get_model_info':
+            self.send_json({'model_path': MODEL_PATH, 'is_generation': True})
+        elif self.path == '/metrics':
+            body = get_metrics_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        if self.path != '/v1/chat/completions':
+            self.send_json({'error': 'not found'}, 404)
+            return
+
+        data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        count_request('queue', 1)
+        RUNNING_SLOTS.acquire()
+        count_request('queue', -1)
+        count_request('running', 1)
+        try:
+            self.generate(data)
+        finally:
+            count_request('running', -1)
+            RUNNING_SLOTS.release()
+
+    def generate(self, data):
+        messages = data.get('messages', [])
+        prompt = ''.join(m['content'] for m in messages if m['role'] == 'user')
+        prompt_type, answer = get_response_text(prompt)
+
+        prefix = ''
+        if data.get('continue_final_message') and messages and messages[-1]['role'] == 'assistant':
+            prefix = messages[-1]['content']
+        if prefix and '</think>' in prefix:
+            output = answer
+        elif is_thinking_model(data.get('model') or MODEL_PATH):
+            output = get_think_text(prompt_type) + answer
+        else:
+            output = answer
+
+        token_list = get_tokens(output)
+        prompt_token_list = get_tokens(prompt)
+        cached_tokens = get_cached_tokens(prompt_token_list)
+        usage = {
+            'prompt_tokens': len(prompt_token_list),
+            'completion_tokens': len(token_list),
+            'total_tokens': len(prompt_token_list) + len(token_list),
+        }
+        if CACHE_REPORT:
+            usage['prompt_tokens_details'] = {'cached_tokens': cached_tokens}
+        # only the uncached part of the prompt is prefilled
+        time.sleep(TTFT * (1 - cached_tokens / max(len(prompt_token_list), 1)))
+
+        if not data.get('stream'):
+            time.sleep(len(token_list) / TOKENS_PER_SECOND)
+            self.send_json({
+                'id': 'mock',
+                'object': 'chat.completion',
+                'model': data.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': output}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for token in token_list:
+                chunk = {'id': 'mock', 'object': 'chat.completion.chunk', 'choices': [{'index': 0, 'delta': {'content': token}}]}
+                self.write_chunk(f'data: {json.dumps(chunk)}\n\n'.encode())
+                time.sleep(1 / TOKENS_PER_SECOND)
+
+            if (data.get('stream_options') or {}).get('include_usage'):
+                chunk = {'id': 'mock', 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage}
+                self.write_chunk(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.write_chunk(b'data: [DONE]\n\n')
+            self.write_chunk(b'')
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stopped the stream early
+            self.close_connection = True
+
+
+def main():
+    global MODEL_PATH, TTFT, TOKENS_PER_SECOND, CACHE_REPORT, RUNNING_SLOTS
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-path', type=str, default='mock', help='Model name reported by the server.')
+    parser.add_argument('--host', type=str, default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=30000)
+    parser.add_argument('--ttft', type=float, default=TTFT, help='Seconds before the first token.')
+    parser.add_argument('--tokens-per-second', type=float, default=TOKENS_PER_SECOND, help='Tokens per second of each response.')
+    # accepted for the same command line as sglang.launch_server
+    parser.add_argument('--mem-fraction-static', type=float, default=None)
+    parser.add_argument('--schedule-policy', type=str, default='fcfs')
+    parser.add_argument('--enable-cache-report', action='store_true', help='Report the cached prompt tokens in the usage.')
+    parser.add_argument('--enable-metrics', action='store_true')
+    parser.add_argument('--max-running-requests', type=int, default=MAX_RUNNING_REQUESTS, help='Requests in the running batch.')
+    args = parser.parse_args()
+
+    MODEL_PATH = args.model_path
+    TTFT = args.ttft
+    TOKENS_PER_SECOND = max(args.tokens_per_second, 1e-3)
+    CACHE_REPORT = args.enable_cache_report
+    RUNNING_SLOTS = threading.Semaphore(max(args.max_running_requests, 1))
+
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    print(f'Mock SGL server started with {MODEL_PATH} on port {args.port}.')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
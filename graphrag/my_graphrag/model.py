@@ -1,12 +1,22 @@
 import os
+import re
+import json
+import time
+import asyncio
 import threading
-import requests
+import subprocess
+import httpx
 from sglang.utils import (
     execute_shell_command,
     wait_for_server,
     terminate_process,
 )
 from pathlib import Path
+from urllib.parse import urlparse
+
+import graphrag.my_graphrag.context as context
+import graphrag.my_graphrag.llm_cache as llm_cache
+import graphrag.my_graphrag.telemetry as telemetry
 
 
 PRJ_DIR = os.path.join(Path(os.path.dirname(os.path.realpath(__file__))).parent.parent.absolute())
@@ -16,68 +26,584 @@ MODEL_NAME_LLAMA = 'Llama-3.1-8B-Instruct'
 # https://huggingface.co/deepseek-ai/DeepSeek-R1-Distill-Llama-8B
 MODEL_NAME_DEEPSEEK = 'DeepSeek-R1-Distill-Llama-8B'
 
-MODEL_TMP_FILE_PATH = os.path.join(PRJ_DIR, './my_graphrag/model_tmp_file.txt')
+# model of each role, the calls of a role go to the server of its model if it is running, otherwise to the running server
+ROLE_MODEL_NAMES = {
+    'denoise': MODEL_NAME_LLAMA,
+    'extract': MODEL_NAME_DEEPSEEK,
+    'summarize': MODEL_NAME_LLAMA,
+    'query': MODEL_NAME_DEEPSEEK,
+}
+
+# models that think in a <think> block before they answer
+THINKING_MODEL_NAMES = [MODEL_NAME_DEEPSEEK]
+# the think block is left free when the answer of a thinking model is constrained by a regex
+THINK_REGEX = r'(?:<think>)?[\s\S]*</think>\s{0,4}'
+# text of an XML element, without markup so that the element can be parsed
+XML_TEXT_REGEX = r'[^<>&]+'
+
+# 'true' to launch mock_server.py instead of sglang.launch_server, for runs without a GPU or weights
+MOCK_SERVER = os.environ.get('RG_RAG_SGL_MOCK', '').lower() == 'true'
+
+# 'true' to always run the servers of several models at once, 'false' to never, '' to decide by GPU memory
+COLOCATE = os.environ.get('RG_RAG_SGL_COLOCATE', '').lower()
+# share of GPU memory for weights and KV cache, split evenly between the servers running at once
+MEM_FRACTION_STATIC = float(os.environ.get('RG_RAG_SGL_MEM_FRACTION', '0.85'))
+# KV cache each server needs besides its weights
+MIN_KV_CACHE_BYTES = 4 << 30
+
+
+# requests to one SGL server in flight at the same time at the start, the others wait for a free slot
+MAX_IN_FLIGHT = int(os.environ.get('RG_RAG_SGL_MAX_IN_FLIGHT', '32'))
+# the in-flight limit follows the load of the server (AIMD): one more after a full limit of requests served without congestion,
+# a quarter less on congestion, i.e. requests waiting on the server, an inter-token latency far above the best seen, or a failure
+# 'false' to keep MAX_IN_FLIGHT fixed
+ADAPTIVE_IN_FLIGHT = os.environ.get('RG_RAG_SGL_ADAPTIVE', 'true').lower() != 'false'
+MIN_IN_FLIGHT = 2
+MAX_IN_FLIGHT_CAP = int(os.environ.get('RG_RAG_SGL_MAX_IN_FLIGHT_CAP', '128'))
+BACKOFF_FACTOR = 0.75
+# congestion once the inter-token latency is this many times the best seen
+LATENCY_TOLERANCE = 2.0
+# congestion once more requests than this wait on the server, from any process
+MAX_SERVER_QUEUE = 4
+# seconds between two reads of the server queue from /metrics, doubled after each failed read up to METRICS_MAX_INTERVAL
+METRICS_INTERVAL = 2
+METRICS_MAX_INTERVAL = 60
+# seconds to wait for one response
+REQUEST_TIMEOUT = float(os.environ.get('RG_RAG_SGL_TIMEOUT', '600'))
+# prompts of one batch that share this many leading characters are sent as a group, the first one alone so that
+# the server caches the shared prefix, and the others once its first token is out, 0 to send all prompts at once
+MIN_SHARED_PREFIX_CHARS = int(os.environ.get('RG_RAG_SGL_MIN_SHARED_PREFIX', '256'))
+
+
+# registry of the warm SGL servers kept by server.py, one file per base port
+DAEMON_DIR = os.path.join(PRJ_DIR, 'my_graphrag', 'sgl_daemon')
+# seconds between two activity marks of a process using the daemon
+DAEMON_TOUCH_INTERVAL = 30
+LAST_DAEMON_TOUCH = 0
+
+
+# {model_path: process} of the SGL servers started by this process
+SERVER_PROCESSES = {}
+LOCK = threading.RLock()
 
+# all requests of the process go through one event loop in a background thread,
+# so sync callers, async callers and different event loops share the same connection pool and in-flight limit
+CLIENT_LOCK = threading.RLock()
+CLIENT_LOOP = None
+# {server_url: SGLClient}, only used inside CLIENT_LOOP
+SGL_CLIENTS = {}
+
+
+class StopCondition(object):
+    # early stop of a streamed response, checked on the answer, i.e. the text after </think>
+    # stop_strings: stop once the answer contains one of them, the stop string is kept
+    # stop_regex: stop once the answer matches
+    # think_budget: stream chunks (about one token each) the model may think, then the think block is closed
+    # and the model is made to answer, 0 for no limit
+    def __init__(self, stop_strings=None, stop_regex='', think_budget=0):
+        self.stop_strings = list(stop_strings or [])
+        self.stop_regex = stop_regex
+        self.pattern = re.compile(stop_regex) if stop_regex else None
+        self.think_budget = think_budget
+
+    def get_answer(self, output, thinking):
+        # None while a thinking model is still in its think block
+        if '</think>' in output:
+            return output.split('</think>')[-1]
+        return None if thinking else output
+
+    def is_done(self, answer):
+        if any(stop_string in answer for stop_string in self.stop_strings):
+            return True
+        return self.pattern is not None and self.pattern.search(answer) is not None
+
+    def get_key(self):
+        # part of the LLM cache key, an early stopped response differs from a full one
+        return {'stop_strings': self.stop_strings, 'stop_regex': self.stop_regex, 'think_budget': self.think_budget}
+
+
+class InFlightLimit(object):
+    # limit of the requests in flight to one server, used like a semaphore inside CLIENT_LOOP
+    # `async with limit as epoch`, epoch counts the decreases, so the requests already in flight at a decrease
+    # do not decrease the limit again
+    def __init__(self, limit, adaptive=ADAPTIVE_IN_FLIGHT, max_limit=MAX_IN_FLIGHT_CAP):
+        self.limit = max(1, limit)
+        self.adaptive = adaptive
+        self.min_limit = min(MIN_IN_FLIGHT, self.limit)
+        self.max_limit = max(max_limit, self.limit) if adaptive else self.limit
+        self.in_flight = 0
+        self.epoch = 0
+        # requests served without congestion since the last change
+        self.served = 0
+        self.best_itl = None
+        self.queue_depth = 0
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self.epoch
+
+    async def __aexit__(self, *args):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def set_limit(self, limit):
+        self.limit = max(self.min_limit, min(self.max_limit, limit))
+        self.served = 0
+
+    def is_congested(self, stats):
+        if not stats['ok'] or self.queue_depth > MAX_SERVER_QUEUE:
+            return True
+        if stats['ttft'] is None or stats['completion_tokens'] < 2:
+            return False
+
+        # time per output token after the first, independent of the prompt and response lengths
+        itl = (stats['latency'] - stats['ttft']) / (stats['completion_tokens'] - 1)
+        self.best_itl = itl if self.best_itl is None else min(self.best_itl, itl)
+        return itl > self.best_itl * LATENCY_TOLERANCE
+
+    def observe(self, stats, epoch):
+        # update the limit after a request that started in epoch
+        if not self.adaptive:
+            return
+
+        if self.is_congested(stats):
+            if epoch == self.epoch:
+                self.epoch += 1
+                self.set_limit(int(self.limit * BACKOFF_FACTOR))
+        else:
+            self.served += 1
+            if self.served >= self.limit:
+                self.set_limit(self.limit + 1)
+
+
+class SGLClient(object):
+    # pooled async client of one SGL server
+    def __init__(self, server_url, max_in_flight=MAX_IN_FLIGHT, timeout=REQUEST_TIMEOUT):
+        self.server_url = server_url
+        self.in_flight_limit = InFlightLimit(max_in_flight)
+        # one more connection for the metrics
+        max_connections = self.in_flight_limit.max_limit + 1
+        self.client = httpx.AsyncClient(
+            base_url=server_url,
+            timeout=httpx.Timeout(timeout, connect=10),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        # False once the server has no /metrics
+        self.metrics = ADAPTIVE_IN_FLIGHT
+        self.metrics_time = 0
+        self.metrics_interval = METRICS_INTERVAL
+        # read of /metrics in the background, None before the first one
+        self.metrics_task = None
+
+    async def read_queue_depth(self):
+        # requests waiting on the server for a slot in the running batch, from all processes using it
+        try:
+            response = await self.client.get('/metrics', timeout=5)
+        except Exception:
+            # a timeout or a lost connection, most likely from a busy server, the last depth stands until a read works again
+            self.metrics_interval = min(self.metrics_interval * 2, METRICS_MAX_INTERVAL)
+            return
+
+        value_list = []
+        if response.status_code != 404:
+            if not response.is_success:
+                self.metrics_interval = min(self.metrics_interval * 2, METRICS_MAX_INTERVAL)
+                return
+            value_list = re.findall(r'^sglang:num_queue_reqs(?:\{[^}]*\})?\s+(\S+)', response.text, re.MULTILINE)
+
+        if not value_list:
+            # the server runs without --enable-metrics
+            self.metrics = False
+            self.in_flight_limit.queue_depth = 0
+            return
+
+        self.in_flight_limit.queue_depth = sum(float(value) for value in value_list)
+        self.metrics_interval = METRICS_INTERVAL
+
+    def poll_queue_depth(self):
+        # read the server queue in the background, at most every metrics_interval seconds and one read at a time
+        if not self.metrics or time.time() - self.metrics_time < self.metrics_interval:
+            return
+        if self.metrics_task is not None and not self.metrics_task.done():
+            return
+        self.metrics_time = time.time()
+        self.metrics_task = asyncio.ensure_future(self.read_queue_depth())
+
+    async def stream(self, prompt, model_path, sampling_params, stop, thinking, stats, prefix='', on_first_token=None):
+        # stream one response until stop is met, (output, False) if the think budget ran out first
+        # stats: tokens and time to first token are added to it
+        # prefix: start of the answer, the model continues it
+        # on_first_token: called once the first token is out, the prompt is in the prefix cache of the server then
+        messages = [{"role": "user", "content": prompt}]
+        data = {
+            "model": model_path,
+            "messages": messages,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        if sampling_params:
+            data.update(sampling_params)
+        if prefix:
+            messages.append({"role": "assistant", "content": prefix})
+            data["continue_final_message"] = True
+            # the prefix already closes the think block, only the answer is constrained
+            if data.get("regex"):
+                data["regex"] = remove_think_regex(data["regex"])
+
+        output = prefix
+        answered = True
+        think_tokens = 0
+        chunk_count = 0
+        usage = None
+        start_time = time.time()
+        # leaving the block closes the connection, which aborts the request on the server
+        async with self.client.stream('POST', '/v1/chat/completions', json=data) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                line = line[len('data:'):].strip()
+                if line == '[DONE]':
+                    break
+
+                chunk = json.loads(line)
+                usage = chunk.get('usage') or usage
+                choices = chunk.get('choices')
+                if not choices:
+                    continue
+                content = choices[0]['delta'].get('content') or ''
+                if not content:
+                    continue
+
+                if stats['ttft'] is None:
+                    stats['ttft'] = time.time() - start_time
+                    if on_first_token is not None:
+                        on_first_token()
+                chunk_count += 1
+                output += content
+
+                answer = stop.get_answer(output, thinking)
+                if answer is None:
+                    think_tokens += 1
+                    if stop.think_budget and think_tokens >= stop.think_budget:
+                        answered = False
+                        stats['stopped'] = True
+                        break
+                elif stop.is_done(answer):
+                    stats['stopped'] = True
+                    break
+
+        # a stopped stream ends before the usage, about one token per chunk then
+        if usage:
+            stats['prompt_tokens'] += usage.get('prompt_tokens') or 0
+            stats['completion_tokens'] += usage.get('completion_tokens') or 0
+            # prompt tokens found in the radix cache of the server, reported with --enable-cache-report
+            stats['cached_tokens'] += (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+        else:
+            stats['completion_tokens'] += chunk_count
+
+        return output, answered
+
+    async def generate(self, prompt, model_path, sampling_params=None, stop=None, thinking=False, on_first_token=None):
+        # (raw response that ends as soon as stop is met, stats of the call), '' if the request failed
+        stats = {
+            'ok': True,
+            'stopped': False,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'cached_tokens': 0,
+            'ttft': None,
+            'queue_time': 0,
+            'latency': 0,
+            'in_flight_limit': 0,
+        }
+        stop = stop or StopCondition()
+
+        output = ''
+        epoch = None
+        queue_start_time = time.time()
+        self.poll_queue_depth()
+        try:
+            async with self.in_flight_limit as epoch:
+                start_time = time.time()
+                stats['queue_time'] = start_time - queue_start_time
+                stats['in_flight_limit'] = self.in_flight_limit.limit
+                try:
+                    output, answered = await self.stream(
+                        prompt, model_path, sampling_params, stop, thinking, stats, on_first_token=on_first_token
+                    )
+                    if not answered:
+                        # close the think block and let the model answer
+                        output, _ = await self.stream(
+                            prompt, model_path, sampling_params, stop, thinking, stats, output + '\n</think>\n\n'
+                        )
+                finally:
+                    stats['latency'] = time.time() - start_time
+
+        except Exception:
+            # a cancelled request is not a failure, CancelledError goes on to the caller
+            output = ''
+            stats['ok'] = False
+            print('Failed to get response from SGL server.')
+
+        if epoch is not None:
+            self.in_flight_limit.observe(stats, epoch)
+        return output, stats
+
+    async def generate_group(self, prompts, model_path, sampling_params, stop, thinking):
+        # the first prompt fills the prefix cache of the server, the others wait for its first token and reuse the prefix
+        first_token = asyncio.Event()
+
+        async def generate_first():
+            try:
+                return await self.generate(prompts[0], model_path, sampling_params, stop, thinking, first_token.set)
+            finally:
+                first_token.set()
+
+        async def generate_other(prompt):
+            await first_token.wait()
+            return await self.generate(prompt, model_path, sampling_params, stop, thinking)
+
+        return await asyncio.gather(generate_first(), *[generate_other(prompt) for prompt in prompts[1:]])
+
+    async def generate_many(self, prompts, model_path, sampling_params=None, stop=None):
+        # [(response, stats)] in the order of prompts
+        # the prompts are sent in prefix order, so the ones sharing a prefix are served one after another from the radix cache
+        thinking = os.path.basename(model_path) in THINKING_MODEL_NAMES
+        group_list = get_prefix_groups(prompts, MIN_SHARED_PREFIX_CHARS)
+        group_result_list = await asyncio.gather(*[
+            self.generate_group([prompts[i] for i in group], model_path, sampling_params, stop, thinking) for group in group_list
+        ])
+
+        result_list = [None] * len(prompts)
+        for group, group_results in zip(group_list, group_result_list):
+            for i, result in zip(group, group_results):
+                result_list[i] = result
+        return result_list
+
+    async def close(self):
+        if self.metrics_task is not None and not self.metrics_task.done():
+            self.metrics_task.cancel()
+        await self.client.aclose()
+
+
+def get_prefix_groups(prompts, min_shared_chars):
+    # [[index of prompt]], the prompts sorted so that common prefixes are next to each other, and cut into groups
+    # where each prompt shares at least min_shared_chars leading characters with the one before it
+    index_list = sorted(range(len(prompts)), key=lambda i: prompts[i])
+    group_list = []
+    for n, i in enumerate(index_list):
+        if n > 0 and min_shared_chars > 0:
+            shared_chars = len(os.path.commonprefix([prompts[index_list[n - 1]], prompts[i]]))
+            if shared_chars >= min_shared_chars:
+                group_list[-1].append(i)
+                continue
+        group_list.append([i])
+    return group_list
+
+
+def check_safetensors_file(file_path):
+    # read only the header, the file is complete if its size matches the tensor offsets
+    try:
+        with open(file_path, 'rb') as f:
+            header_size = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(header_size))
+        data_size = max([v['data_offsets'][1] for k, v in header.items() if k != '__metadata__'], default=0)
+        return 8 + header_size + data_size == os.path.getsize(file_path)
+    except:
+        return False
 
-SERVER_PROCESS = None
-LOCK = threading.RLock()
 
+def check_model_files(model_name):
+    # check config and weights of a downloaded model without launching it
+    if MOCK_SERVER:
+        return
+
+    model_path = os.path.join(MODEL_DIR, model_name)
+    if not os.path.isdir(model_path):
+        raise Exception(f'Model {model_name} not found in {model_path}. Please download the model.')
+    if len(os.listdir(model_path)) == 0:
+        raise Exception(f'Model {model_name} found in {model_path} but it is empty. Please download the model.')
+
+    try:
+        with open(os.path.join(model_path, 'config.json'), 'r') as f:
+            config = json.load(f)
+        if not config.get('architectures'):
+            raise ValueError
+    except:
+        raise Exception(f'Model {model_name} found in {model_path} but config.json is missing or invalid. Please download the model again.')
+
+    index_path = os.path.join(model_path, 'model.safetensors.index.json')
+    if os.path.isfile(index_path):
+        with open(index_path, 'r') as f:
+            weight_file_list = sorted(set(json.load(f)['weight_map'].values()))
+    else:
+        weight_file_list = sorted(fn for fn in os.listdir(model_path) if fn.endswith('.safetensors') or fn.endswith('.bin'))
+    if not weight_file_list:
+        raise Exception(f'Model {model_name} found in {model_path} but it has no weights. Please download the model again.')
+
+    for fn in weight_file_list:
+        file_path = os.path.join(model_path, fn)
+        if not os.path.isfile(file_path):
+            raise Exception(f'Model {model_name} found in {model_path} but {fn} is missing. Please download the model again.')
+        if fn.endswith('.safetensors') and not check_safetensors_file(file_path):
+            raise Exception(f'Model {model_name} found in {model_path} but {fn} is incomplete. Please download the model again.')
 
-def check_model_dir():
+
+def check_model_dir(launch=False):
+    # check both models, launch=True also starts and stops an SGL server for each of them
     if not os.path.isdir(MODEL_DIR):
         os.mkdir(MODEL_DIR)
 
-    model_path_llama = os.path.join(MODEL_DIR, MODEL_NAME_LLAMA)
-    if os.path.isdir(model_path_llama):
-        if len(os.listdir(model_path_llama)) == 0:
-            raise Exception(f'Model {MODEL_NAME_LLAMA} found in {model_path_llama} but it is empty. Please download the model.')
+    for model_name in [MODEL_NAME_LLAMA, MODEL_NAME_DEEPSEEK]:
+        check_model_files(model_name)
 
-        try:
-            start_sgl_server_llama()
-        except:
-            raise Exception(f'Model {MODEL_NAME_LLAMA} found in {model_path_llama} but failed to start SGL server. Please check the model.')
-        finally:
-            stop_sgl_server()
-    else:
-        raise Exception(f'Model {MODEL_NAME_LLAMA} not found in {model_path_llama}. Please download the model.')
+        if launch:
+            try:
+                start_sgl_server(model_name)
+            except:
+                raise Exception(f'Model {model_name} found in {os.path.join(MODEL_DIR, model_name)} but failed to start SGL server. Please check the model.')
+            finally:
+                stop_sgl_server()
 
-    model_path_deepseek = os.path.join(MODEL_DIR, MODEL_NAME_DEEPSEEK)
-    if os.path.isdir(model_path_deepseek):
-        if len(os.listdir(model_path_deepseek)) == 0:
-            raise Exception(f'Model {MODEL_NAME_DEEPSEEK} found in {model_path_deepseek} but it is empty. Please download the model.')
 
-        try:
-            start_sgl_server_deepseek()
-        except:
-            raise Exception(f'Model {MODEL_NAME_DEEPSEEK} found in {model_path_deepseek} but failed to start SGL server. Please check the model.')
-        finally:
-            stop_sgl_server()
-    else:
-        raise Exception(f'Model {MODEL_NAME_DEEPSEEK} not found in {model_path_deepseek}. Please download the model.')
+def get_gpu_memory():
+    # total memory of the first GPU in bytes, 0 if unknown
+    try:
+        output = subprocess.run(
+            ['nvidia-smi', '--query-gpu=memory.total', '--format=csv,noheader,nounits'],
+            capture_output=True, text=True, check=True
+        ).stdout
+        return int(output.split()[0]) << 20
+    except:
+        return 0
 
 
-def start_sgl_server(model_name):
-    global SERVER_PROCESS
+def get_model_size(model_name):
+    # bytes of the weight files of a model
+    model_path = os.path.join(MODEL_DIR, model_name)
+    size = 0
+    if os.path.isdir(model_path):
+        for fn in os.listdir(model_path):
+            if fn.endswith('.safetensors') or fn.endswith('.bin'):
+                size += os.path.getsize(os.path.join(model_path, fn))
+    return size
 
-    tmp_file_model_path = get_cur_model_path()
 
-    with LOCK:
-        if SERVER_PROCESS is not None or tmp_file_model_path:
-            print(f'SGL server is already running with {tmp_file_model_path}. Please stop the server first.')
+def can_colocate(model_name_list):
+    # whether the servers of all models fit in GPU memory at the same time
+    if MOCK_SERVER:
+        return True
+    if COLOCATE in ['true', 'false']:
+        return COLOCATE == 'true'
 
-        else:
+    gpu_memory = get_gpu_memory()
+    if gpu_memory == 0:
+        return False
+
+    mem_per_server = gpu_memory * MEM_FRACTION_STATIC / len(model_name_list)
+    return all(get_model_size(model_name) + MIN_KV_CACHE_BYTES <= mem_per_server for model_name in model_name_list)
+
+
+def get_role_model_names(role_list):
+    # models needed by the roles, without duplicates
+    return list(dict.fromkeys(ROLE_MODEL_NAMES[role] for role in role_list))
+
+
+def get_endpoints():
+    # {model_path: server_url} of the running SGL servers
+    ctx = context.get_context()
+    if ctx.endpoints:
+        return json.loads(ctx.endpoints)
+    return {ctx.model_path: ctx.server_url} if ctx.model_path else {}
+
+
+def get_endpoint(role=None):
+    # (model_path, server_url) of the server for a call of role, model_path is '' if no SGL server is running
+    endpoint_dict = get_endpoints()
+    model_name = ROLE_MODEL_NAMES.get(role)
+    for model_path, server_url in endpoint_dict.items():
+        if os.path.basename(model_path) == model_name:
+            return model_path, server_url
+
+    # fall back to the server running now, e.g. when the models are swapped
+    model_path = get_cur_model_path()
+    return model_path, endpoint_dict.get(model_path, context.get_context().server_url)
+
+
+def get_running_model_names():
+    return [os.path.basename(model_path) for model_path in get_endpoints()]
+
+
+def start_sgl_servers(model_name_list):
+    # start one server per model, at once and on consecutive ports from the context server url, when they fit in GPU memory together
+    # return False without starting any if they do not fit or another model is running, the phases then swap servers with start_role_server
+    model_name_list = list(dict.fromkeys(model_name_list))
+
+    with LOCK:
+        running_model_name_list = get_running_model_names()
+        if running_model_name_list:
+            if all(model_name in running_model_name_list for model_name in model_name_list):
+                return True
+            if SERVER_PROCESSES:
+                print(f'SGL server is already running with {get_cur_model_path()}. Please stop the server first.')
+                return False
+            # only attached to the daemon, which does not serve all models
+            context.update_context(model_path='', endpoints='')
+
+        # reuse the warm servers of server.py
+        daemon_info = read_daemon_info()
+        if daemon_info is not None and attach_sgl_daemon(daemon_info, model_name_list):
+            return True
+
+        if len(model_name_list) > 1 and not can_colocate(model_name_list):
+            return False
+
+        for model_name in model_name_list:
             model_path = os.path.join(MODEL_DIR, model_name)
-            if not os.path.exists(model_path):
+            if not MOCK_SERVER and not os.path.exists(model_path):
                 raise Exception(f'Model not found in {model_path}. Please download the model first.')
 
-            server_process = execute_shell_command(f'python -m sglang.launch_server --model-path {model_path} --port 30000 --host 0.0.0.0')
-            SERVER_PROCESS = server_process
-            update_model_tmp_file(model_path)
+        server_url = urlparse(context.get_context().server_url)
+        base_port = server_url.port or 30000
+        if daemon_info is not None:
+            # start after the ports of the daemon
+            base_port = max(urlparse(daemon_server_url).port for daemon_server_url in daemon_info['endpoints'].values()) + 1
+        mem_fraction = MEM_FRACTION_STATIC / len(model_name_list)
 
-            wait_for_server("http://localhost:30000")
+        # launch all servers before waiting, so the models load at the same time
+        endpoint_dict = {}
+        for i, model_name in enumerate(model_name_list):
+            model_path = os.path.join(MODEL_DIR, model_name)
+            port = base_port + i
+            server_module = 'graphrag.my_graphrag.mock_server' if MOCK_SERVER else 'sglang.launch_server'
+            # the longest prefix match policy serves the queued requests that share a cached prefix first,
+            # and the cache report adds the cached prompt tokens to the usage of each response
+            command = (
+                f'python -m {server_module} --model-path {model_path} --port {port} --host 0.0.0.0'
+                f' --schedule-policy lpm --enable-cache-report --enable-metrics'
+            )
+            if len(model_name_list) > 1:
+                command += f' --mem-fraction-static {mem_fraction:.2f}'
+            SERVER_PROCESSES[model_path] = execute_shell_command(command)
+            endpoint_dict[model_path] = server_url._replace(netloc=f'{server_url.hostname}:{port}').geturl()
 
+        context.update_context(model_path=list(endpoint_dict.keys())[0], endpoints=json.dumps(endpoint_dict))
+
+        for model_path, model_server_url in endpoint_dict.items():
+            wait_for_server(model_server_url)
             print(f'SGL server started with {model_path}.')
 
+    return True
+
+
+def start_sgl_server(model_name):
+    return start_sgl_servers([model_name])
+
 
 def start_sgl_server_llama():
     start_sgl_server(MODEL_NAME_LLAMA)
@@ -87,65 +613,246 @@ def start_sgl_server_deepseek():
     start_sgl_server(MODEL_NAME_DEEPSEEK)
 
 
-def stop_sgl_server():
-    global SERVER_PROCESS
+def start_role_server(role):
+    # start the server of a role for one phase, return True if it was started here and the caller has to stop it
+    # a server already running for the role, e.g. started by start_sgl_servers for the whole run, is reused
+    model_name = ROLE_MODEL_NAMES[role]
+    if model_name in get_running_model_names():
+        return False
+    return start_sgl_server(model_name)
 
-    tmp_file_model_path = get_cur_model_path()
 
+def stop_sgl_server():
+    # stop all SGL servers started by this process, servers of the daemon are only detached and keep running
     with LOCK:
-        if SERVER_PROCESS is not None:
-            try:
-                terminate_process(SERVER_PROCESS)
-            except:
-                pass
-            print(f'SGL server stopped with {tmp_file_model_path}.')
+        if SERVER_PROCESSES:
+            for model_path, server_process in SERVER_PROCESSES.items():
+                try:
+                    terminate_process(server_process)
+                except:
+                    pass
+                print(f'SGL server stopped with {model_path}.')
+
+        elif get_running_model_names():
+            print('Detached from SGL daemon.')
 
         else:
             print('SGL server is not running.')
 
-        SERVER_PROCESS = None
+        SERVER_PROCESSES.clear()
+
+    context.update_context(model_path='', endpoints='')
+    close_sgl_clients()
 
-    remove_model_tmp_file()
 
+def get_daemon_path(server_url=None):
+    port = urlparse(server_url or context.get_context().server_url).port or 30000
+    return os.path.join(DAEMON_DIR, f'{port}.json')
 
-def get_response_from_sgl(prompt, remove_think=True):
-    output = ''
+
+def get_daemon_activity_path(server_url=None):
+    # mtime is the last time a process used the daemon
+    return os.path.splitext(get_daemon_path(server_url))[0] + '.active'
+
+
+def read_daemon_info(server_url=None):
+    # {'pid': pid, 'endpoints': {model_path: server_url}} of the daemon on the base port, None if no daemon is running
     try:
-        tmp_file_model_path = get_cur_model_path()
-
-        if tmp_file_model_path:
-            data = {
-                "model": tmp_file_model_path,
-                "messages": [{"role": "user", "content": prompt}],
-            }
-            response = requests.post(
-                "http://localhost:30000/v1/chat/completions",
-                json=data
-            )
-            output = response.json()['choices'][0]['message']['content']
+        with open(get_daemon_path(server_url), 'r') as f:
+            info = json.load(f)
+        os.kill(info['pid'], 0)
+    except:
+        return None
+    return info
 
-            if remove_think:
-                output = output.split('</think>')[-1].strip()
 
+def check_server_health(server_url):
+    try:
+        return httpx.get(f'{server_url}/health', timeout=5).status_code == 200
     except:
-        print('Failed to get response from SGL server.')
+        return False
+
+
+def touch_daemon(force=False):
+    # mark the daemon as used, at most once per DAEMON_TOUCH_INTERVAL
+    global LAST_DAEMON_TOUCH
+
+    now = time.time()
+    if not force and now - LAST_DAEMON_TOUCH < DAEMON_TOUCH_INTERVAL:
+        return
+    LAST_DAEMON_TOUCH = now
+
+    try:
+        os.utime(get_daemon_activity_path())
+    except OSError:
+        pass
+
+
+def attach_sgl_daemon(daemon_info, model_name_list):
+    # use the servers of the daemon, False if it can not serve all models
+    endpoint_dict = daemon_info['endpoints']
+    running_model_name_list = [os.path.basename(model_path) for model_path in endpoint_dict]
+    missing_model_name_list = [model_name for model_name in model_name_list if model_name not in running_model_name_list]
+    if missing_model_name_list:
+        print(f'SGL daemon does not serve {missing_model_name_list}, starting a new server.')
+        return False
+
+    if not all(check_server_health(server_url) for server_url in endpoint_dict.values()):
+        print('SGL daemon is not healthy, starting a new server.')
+        return False
+
+    context.update_context(model_path=list(endpoint_dict.keys())[0], endpoints=json.dumps(endpoint_dict))
+    touch_daemon(force=True)
+    print(f'Attached to SGL daemon with {list(endpoint_dict.keys())}.')
+    return True
+
+
+def get_client_loop():
+    global CLIENT_LOOP
+    with CLIENT_LOCK:
+        if CLIENT_LOOP is None:
+            CLIENT_LOOP = asyncio.new_event_loop()
+            threading.Thread(target=CLIENT_LOOP.run_forever, name='sgl-client', daemon=True).start()
+    return CLIENT_LOOP
+
+
+def get_sgl_client(server_url):
+    # called inside CLIENT_LOOP only
+    client = SGL_CLIENTS.get(server_url)
+    if client is None:
+        client = SGLClient(server_url, MAX_IN_FLIGHT, REQUEST_TIMEOUT)
+        SGL_CLIENTS[server_url] = client
+    return client
+
+
+async def run_generate_many(prompts, server_url, model_path, remove_think, sampling_params, stop, read_cache, trace_info):
+    # prompts found in the LLM cache are not sent, the same prompt is sent once
+    # trace_info: (trace_path, phase, role), every prompt is recorded to the trace
+    if sampling_params and 'regex' in sampling_params and os.path.basename(model_path) in THINKING_MODEL_NAMES:
+        sampling_params = dict(sampling_params, regex=add_think_regex(sampling_params['regex']))
+    key_params = sampling_params if stop is None else dict(sampling_params or {}, stop_condition=stop.get_key())
+    key_list = [llm_cache.get_cache_key(model_path, prompt, key_params) for prompt in prompts]
+    output_dict = llm_cache.get_many(key_list) if read_cache else {}
+    stats_dict = {}
+
+    miss_dict = {}
+    for key, prompt in zip(key_list, prompts):
+        if key not in output_dict:
+            miss_dict[key] = prompt
+
+    if miss_dict:
+        miss_key_list = list(miss_dict.keys())
+        miss_result_list = await get_sgl_client(server_url).generate_many(
+            [miss_dict[key] for key in miss_key_list], model_path, sampling_params, stop
+        )
+        llm_cache.put_many([(key, model_path, output) for key, (output, _) in zip(miss_key_list, miss_result_list)])
+        for key, (output, stats) in zip(miss_key_list, miss_result_list):
+            output_dict[key] = output
+            stats_dict[key] = stats
+
+    trace_path, phase, role = trace_info
+    if trace_path:
+        telemetry.write_records(
+            [telemetry.get_record(phase, role, model_path, server_url, key not in stats_dict, stats_dict.pop(key, None)) for key in key_list],
+            trace_path
+        )
+
+    output_list = [output_dict[key] for key in key_list]
+    if remove_think:
+        output_list = [output.split('</think>')[-1].strip() for output in output_list]
+    return output_list
+
+
+def get_xml_regex(tag, child_tag_list):
+    # regex of an XML element with one line per child element, as laid out in the prompts
+    children = ''.join(f'\\n    <{child_tag}>{XML_TEXT_REGEX}</{child_tag}>' for child_tag in child_tag_list)
+    return f'<{tag}>{children}\\n</{tag}>'
+
+
+def add_think_regex(regex):
+    # regex of a thinking model's response, a free think block before an answer that matches regex
+    # regex is grouped, so that a top-level | in it does not split off the think block
+    return f'{THINK_REGEX}(?:{regex})'
+
+
+def remove_think_regex(regex):
+    # regex of the answer only, for a response that continues a closed think block
+    if regex.startswith(f'{THINK_REGEX}(?:') and regex.endswith(')'):
+        return regex[len(THINK_REGEX) + len('(?:'):-len(')')]
+    return regex
+
+
+def get_constrained_params(regex):
+    # sampling params that constrain the answer to regex, None if constrained decoding is off
+    if not context.get_context().constrained_decoding:
+        return None
+    return {'regex': regex}
+
+
+def submit_generate_many(prompts, remove_think, sampling_params, role, stop, phase):
+    # the server, model, cache bypass and trace are read from the context of the caller, the request runs in CLIENT_LOOP
+    model_path, server_url = get_endpoint(role)
+    ctx = context.get_context()
+    touch_daemon()
+    return asyncio.run_coroutine_threadsafe(
+        run_generate_many(
+            list(prompts), server_url, model_path, remove_think, sampling_params, stop, not ctx.llm_cache_bypass,
+            (ctx.trace_path, phase, role)
+        ),
+        get_client_loop()
+    )
+
+
+def generate_many(prompts, remove_think=True, sampling_params=None, role=None, stop=None, phase=''):
+    # send all prompts at once, at most the in-flight limit of them are in flight, return the responses in order
+    # '' for a prompt without response, or for all prompts if no SGL server is running
+    # sampling_params: extra fields of the chat completion request, e.g. {'temperature': 0}, part of the cache key
+    # role: one of ROLE_MODEL_NAMES, routes the prompts to the server of its model
+    # stop: StopCondition, the responses end as soon as the answer is complete
+    # phase: tag of the calls in the trace, e.g. 'gleaning'
+    if not prompts or not get_endpoint(role)[0]:
+        return [''] * len(prompts)
+    return submit_generate_many(prompts, remove_think, sampling_params, role, stop, phase).result()
+
+
+async def generate_many_async(prompts, remove_think=True, sampling_params=None, role=None, stop=None, phase=''):
+    if not prompts or not get_endpoint(role)[0]:
+        return [''] * len(prompts)
+    return await asyncio.wrap_future(submit_generate_many(prompts, remove_think, sampling_params, role, stop, phase))
+
+
+def get_response_from_sgl(prompt, remove_think=True, sampling_params=None, role=None, stop=None, phase=''):
+    return generate_many([prompt], remove_think, sampling_params, role, stop, phase)[0]
 
-    return output
+
+async def get_response_from_sgl_async(prompt, remove_think=True, sampling_params=None, role=None, stop=None, phase=''):
+    return (await generate_many_async([prompt], remove_think, sampling_params, role, stop, phase))[0]
+
+
+def configure_sgl_client(max_in_flight=None, timeout=None):
+    # change the starting in-flight limit or the timeout, the clients are created again with the new values
+    global MAX_IN_FLIGHT, REQUEST_TIMEOUT
+    if max_in_flight is not None:
+        MAX_IN_FLIGHT = max(1, int(max_in_flight))
+    if timeout is not None:
+        REQUEST_TIMEOUT = float(timeout)
+    close_sgl_clients()
 
 
-def update_model_tmp_file(cur_model_path):
-    with open(MODEL_TMP_FILE_PATH, 'w') as f:
-        f.write(cur_model_path)
-        f.flush()
+async def run_close_sgl_clients():
+    client_list = list(SGL_CLIENTS.values())
+    SGL_CLIENTS.clear()
+    for client in client_list:
+        await client.close()
 
 
-def remove_model_tmp_file():
-    if os.path.isfile(MODEL_TMP_FILE_PATH):
-        os.remove(MODEL_TMP_FILE_PATH)
+def close_sgl_clients():
+    with CLIENT_LOCK:
+        if CLIENT_LOOP is None:
+            return
+    asyncio.run_coroutine_threadsafe(run_close_sgl_clients(), CLIENT_LOOP).result()
 
 
 def get_cur_model_path():
-    if os.path.isfile(MODEL_TMP_FILE_PATH):
-        with open(MODEL_TMP_FILE_PATH, 'r') as f:
-            return f.read().strip()
-    return ''
+    # model of the running SGL server, '' if no server is running
+    return context.get_context().model_path
@@ -0,0 +1,96 @@
+import os
+import time
+import asyncio
+import yaml
+import pandas as pd
+
+import graphrag.my_graphrag.db as db
+import graphrag.my_graphrag.model as model
+import graphrag.my_graphrag.context as context
+from graphrag.config import create_graphrag_config
+from graphrag.index import create_pipeline_config
+from graphrag.index.cache import InMemoryCache
+from graphrag.index.config import PipelineFileReportingConfig
+from graphrag.index.progress import PrintProgressReporter
+from graphrag.index.run import run_pipeline_with_config
+from graphrag.index.storage import FilePipelineStorage, MemoryPipelineStorage
+from graphrag.index.utils import gen_md5_hash
+
+
+# graphrag indexing of a group inside the current process, instead of copying the config folder and the input texts
+# and running python -m graphrag.index on the copy, the settings are read once per run and the input comes from the database
+
+
+def load_pipeline_config(config_dir):
+    # pipeline config of settings.yaml in config_dir, the prompts are read from config_dir/prompts
+    with open(os.path.join(config_dir, 'settings.yaml'), 'r') as f:
+        values = yaml.safe_load(f)
+
+    # the verbs hand every row to the SGL client, whose in-flight limit follows the server load,
+    # so they run as many rows at once as the limit may grow to
+    if not os.environ.get('GRAPHRAG_LLM_THREAD_COUNT'):
+        values['parallelization'] = values.get('parallelization') or {}
+        values['parallelization'].setdefault('num_threads', model.MAX_IN_FLIGHT_CAP)
+
+    return create_pipeline_config(create_graphrag_config(values, config_dir))
+
+
+def get_group_dataset(paper_id_list):
+    # input table of the pipeline, one row per paper as the text input loader makes it from the copied files,
+    # the chunker then takes the chunks of each paper from the database
+    paper_dict = db.get_items_by_ids(db.COLLECTION_PAPER, paper_id_list, db.convert_paper, ['documents', 'metadatas'])
+    row_list = []
+    for paper in [paper_dict[str(paper_id)] for paper_id in paper_id_list if str(paper_id) in paper_dict]:
+        row = {'text': paper['paper_content']}
+        row['id'] = gen_md5_hash(row, row.keys())
+        row['title'] = paper['paper_name']
+        row_list.append(row)
+    return pd.DataFrame(row_list)
+
+
+async def run_pipeline(pipeline_config, dataset, output_dir):
+    # run the workflows, return the names of the workflows that failed
+    run_id = time.strftime('%Y%m%d-%H%M%S')
+    if output_dir:
+        storage = FilePipelineStorage(os.path.join(output_dir, 'artifacts'))
+        pipeline_config.reporting = PipelineFileReportingConfig(base_dir=os.path.join(output_dir, 'reports'))
+    else:
+        storage = MemoryPipelineStorage()
+        pipeline_config.reporting = None
+
+    progress_reporter = PrintProgressReporter('GraphRAG Indexer ')
+    failed_workflow_list = []
+    async for output in run_pipeline_with_config(
+        pipeline_config,
+        run_id=run_id,
+        dataset=dataset,
+        storage=storage,
+        cache=InMemoryCache(),
+        progress_reporter=progress_reporter,
+    ):
+        if output.errors:
+            failed_workflow_list.append(output.workflow)
+            progress_reporter.error(output.workflow)
+        else:
+            progress_reporter.success(output.workflow)
+    progress_reporter.stop()
+
+    return failed_workflow_list
+
+
+def run_group(pipeline_config, group_id, paper_id_list, output_dir='', prompt_dir=''):
+    # index the papers of a group with graphrag, return True if all workflows succeeded
+    # output_dir: folder of the artifacts and reports, '' to keep them in memory only
+    # prompt_dir: folder the extractors export their prompts to, as in the context
+    dataset = get_group_dataset(paper_id_list)
+    if len(dataset) == 0:
+        print(f'Group ID {group_id}: no papers found in the database.')
+        return False
+
+    with context.use_context(group_id=group_id, prompt_dir=prompt_dir):
+        failed_workflow_list = asyncio.run(run_pipeline(pipeline_config.model_copy(deep=True), dataset, output_dir))
+
+    if failed_workflow_list:
+        print(f'Group ID {group_id}: errors occurred in {failed_workflow_list}, see the reports for details.')
+        return False
+    return True
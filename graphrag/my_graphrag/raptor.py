@@ -1,5 +1,5 @@
+import json
 import random
-import csv
 import umap
 import numpy as np
 from datetime import datetime
@@ -7,6 +7,7 @@ from sentence_transformers import SentenceTransformer
 from sklearn.mixture import GaussianMixture
 import graphrag.my_graphrag.db as db
 import graphrag.my_graphrag.model as model
+import graphrag.my_graphrag.scheduler as scheduler
 
 
 EMBEDDING_MODEL_NAME = 'sentence-transformers/multi-qa-mpnet-base-cos-v1'
@@ -39,14 +40,21 @@ PROMPT_SUMMARY3 = '''Please provide a concise and descriptive heading that captu
 '''
 
 
+# the heading is complete at the end of its first line
+HEADING_STOP = model.StopCondition(stop_regex=r'\S[^\n]*\n')
+
+
 class Chunk(object):
-    def __init__(self, text, index, children, group_id, from_base_chunk=False, root_summary=False):
+    def __init__(self, text, index, children, group_id, from_base_chunk=False, root_summary=False, base_chunk_ids=None, paper_ids=None):
         self.text = text
         self.index = index
         self.children = children
         self.group_id = group_id
         self.from_base_chunk = from_base_chunk
         self.root_summary = root_summary
+        # all base chunks and papers under this chunk in the raptor tree
+        self.base_chunk_ids = base_chunk_ids if base_chunk_ids is not None else set()
+        self.paper_ids = paper_ids if paper_ids is not None else set()
 
 
 def convert_chunk_list(chunk_list):
@@ -55,7 +63,16 @@ def convert_chunk_list(chunk_list):
     new_chunk_list = []
     for chunk in chunk_list:
         for sub_chunk in chunk['sub_chunks']:
-            new_chunk_list.append(Chunk(text=sub_chunk, index=chunk['chunk_id'], children=[], group_id=chunk['group_id']))
+            new_chunk_list.append(
+                Chunk(
+                    text=sub_chunk,
+                    index=chunk['chunk_id'],
+                    children=[],
+                    group_id=chunk['group_id'],
+                    base_chunk_ids={chunk['chunk_id']},
+                    paper_ids={chunk['paper_id']},
+                )
+            )
     return new_chunk_list
 
 
@@ -114,34 +131,98 @@ def split_chunks_into_clusters(chunks):
 def gen_summary_chunks(chunks):
     clusters_list = split_chunks_into_clusters(chunks)
 
-    summary_chunks = []
+    context_list = []
+    cluster_list = []
     for indices in clusters_list:
         context = ''
         children_idx = []
+        base_chunk_ids = set()
+        paper_ids = set()
         for idx in indices:
             child_chunk = chunks[idx]
             context += child_chunk.text + '\n\n'
             children_idx.append(child_chunk.index)
+            base_chunk_ids |= child_chunk.base_chunk_ids
+            paper_ids |= child_chunk.paper_ids
+        context_list.append(context)
+        cluster_list.append((children_idx, base_chunk_ids, paper_ids))
 
-        # step 1: generate summary text
-        summary_text = model.get_response_from_sgl(PROMPT_SUMMARY1.format(text=context))
+    # each step is sent for all clusters at once
+    # step 1: generate summary text
+    summary_text_list = model.generate_many([PROMPT_SUMMARY1.format(text=context) for context in context_list], role='summarize', phase='raptor_step1')
 
-        # step 2: review summary text
-        reviewed_summary_text = model.get_response_from_sgl(PROMPT_SUMMARY2.format(text=summary_text))
+    # step 2: review summary text
+    reviewed_summary_text_list = model.generate_many([PROMPT_SUMMARY2.format(text=summary_text) for summary_text in summary_text_list], role='summarize', phase='raptor_step2')
 
-        # step 3: add heading
-        heading = model.get_response_from_sgl(PROMPT_SUMMARY3.format(text=reviewed_summary_text))
+    # step 3: add heading
+    heading_list = model.generate_many([PROMPT_SUMMARY3.format(text=reviewed_summary_text) for reviewed_summary_text in reviewed_summary_text_list], role='summarize', stop=HEADING_STOP, phase='raptor_step3')
 
+    summary_chunks = []
+    for heading, reviewed_summary_text, (children_idx, base_chunk_ids, paper_ids) in zip(heading_list, reviewed_summary_text_list, cluster_list):
         summary = f'<heading>{heading}<\heading>\n{reviewed_summary_text}'
-        summary_chunks.append((summary, children_idx))
+        summary_chunks.append((summary, children_idx, base_chunk_ids, paper_ids))
 
     return summary_chunks
 
 
-def raptor_index(new_paper_id_list, log_path):
+def raptor_index_group(group_id, group_chunk_list, group_name, paper_id_list, paper_name_list, log_path):
     summary_max_times = 5
+    start_time_one_group = datetime.now()
+
+    # summaries of a level cut off by a crash are deleted, the finished levels are read from the journal
+    db.rollback_journal_stage(group_id, db.JOURNAL_RAPTOR)
+
+    chunks = group_chunk_list
+    for i in range(summary_max_times):
+        from_base_chunk = i == 0
+
+        # [[summary_id, summary, children_idx, base_chunk_ids, paper_ids]] of a finished level
+        journal_output = db.get_done_journal_output(db.JOURNAL_RAPTOR_LEVEL, i, group_id)
+        if journal_output is not None:
+            level_list = json.loads(journal_output)
+            summary_id_list = [summary_id for summary_id, _, _, _, _ in level_list]
+            summary_list = [tuple(level[1:]) for level in level_list]
+            root_summary = len(summary_list) == 1 or i == summary_max_times - 1
+        else:
+            summary_chunks = gen_summary_chunks(chunks)
+            root_summary = len(summary_chunks) == 1 or i == summary_max_times - 1
 
-    chunk_list = [chunk for chunk in db.get_all_chunks() if chunk['paper_id'] in new_paper_id_list]
+            summary_list = [
+                (summary, list(set(children_idx)), sorted(base_chunk_ids, key=int), sorted(paper_ids, key=int))
+                for summary, children_idx, base_chunk_ids, paper_ids in summary_chunks
+            ]
+            summary_id_list = db.save_new_summaries(summary_list, from_base_chunk, root_summary, group_id)
+            db.finish_journal_unit(
+                db.JOURNAL_RAPTOR_LEVEL, i, group_id, {db.COLLECTION_SUMMARY: summary_id_list},
+                json.dumps([[summary_id] + list(summary) for summary_id, summary in zip(summary_id_list, summary_list)])
+            )
+
+        chunks = []
+        for (summary, children_idx, base_chunk_ids, paper_ids), summary_id in zip(summary_list, summary_id_list):
+            chunks.append(Chunk(summary, summary_id, children_idx, group_id, from_base_chunk, root_summary, set(base_chunk_ids), set(paper_ids)))
+
+        if root_summary:
+            break
+
+    db.finish_journal_unit(db.JOURNAL_RAPTOR, db.JOURNAL_GROUP_UNIT, group_id)
+
+    end_time_one_group = datetime.now()
+    scheduler.write_log_rows(log_path, [
+        ['Start time', start_time_one_group.strftime('%Y-%m-%d-%H-%M-%S')],
+        ['Group ID', group_id],
+        ['Group name', group_name],
+        ['Document IDs', str(paper_id_list)],
+        ['Document names', str(paper_name_list)],
+        ['Index type', 'Raptor'],
+        ['Run time', end_time_one_group - start_time_one_group],
+        ['End time', end_time_one_group.strftime('%Y-%m-%d-%H-%M-%S')],
+    ])
+
+
+def raptor_index(new_paper_id_list, log_path, max_groups=1):
+    # max_groups: groups summarized at the same time
+    new_paper_id_list = [str(paper_id) for paper_id in new_paper_id_list]
+    chunk_list = db.get_all_chunks(where={'paper_id': {'$in': new_paper_id_list}}) if new_paper_id_list else []
     chunk_list = convert_chunk_list(chunk_list)
 
     chunk_dict = {}
@@ -152,11 +233,12 @@ def raptor_index(new_paper_id_list, log_path):
         chunk_dict[group_id].append(chunk)
 
     group_list = db.get_all_groups()
-    paper_list = db.get_all_papers()
+    # paper ids are chroma ids, not metadatas, so they are read by id
+    paper_dict = db.get_items_by_ids(db.COLLECTION_PAPER, new_paper_id_list, db.convert_paper)
+    paper_list = sorted(paper_dict.values(), key=lambda x: int(x['paper_id']))
 
+    job_list = []
     for group_id, group_chunk_list in chunk_dict.items():
-        start_time_one_group = datetime.now()
-
         group_name = ''
         for group in group_list:
             if group['group_id'] == group_id:
@@ -170,35 +252,6 @@ def raptor_index(new_paper_id_list, log_path):
                 paper_id_list.append(paper['paper_id'])
                 paper_name_list.append(paper['paper_name'])
 
-        with open(log_path, 'a') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Start time', start_time_one_group.strftime('%Y-%m-%d-%H-%M-%S')])
-            writer.writerow(['Group ID', group_id])
-            writer.writerow(['Group name', group_name])
-            writer.writerow(['Document IDs', str(paper_id_list)])
-            writer.writerow(['Document names', str(paper_name_list)])
-            writer.writerow(['Index type', 'Raptor'])
-            f.flush()
-
-        chunks = group_chunk_list
-        for i in range(summary_max_times):
-            summary_chunks = gen_summary_chunks(chunks)
-
-            from_base_chunk = i == 0
-            root_summary = len(summary_chunks) == 1 or i == summary_max_times - 1
-
-            chunks = []
-            for summary, children_idx in summary_chunks:
-                children_idx = list(set(children_idx))
-                summary_id = db.save_new_summary(summary, children_idx, from_base_chunk, root_summary, group_id)
-                chunks.append(Chunk(summary, summary_id, children_idx, group_id, from_base_chunk, root_summary))
-
-            if root_summary:
-                break
+        job_list.append((group_id, group_chunk_list, group_name, paper_id_list, paper_name_list, log_path))
 
-        end_time_one_group = datetime.now()
-        with open(log_path, 'a') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Run time', end_time_one_group - start_time_one_group])
-            writer.writerow(['End time', end_time_one_group.strftime('%Y-%m-%d-%H-%M-%S')])
-            f.flush()
+    scheduler.run_groups(lambda job: raptor_index_group(*job), job_list, max_groups)
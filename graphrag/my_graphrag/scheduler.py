@@ -0,0 +1,30 @@
+import csv
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+
+# groups are independent, so several of them are indexed at the same time in threads of one process
+# their LLM calls go through the SGL client of the process, so the in-flight limit of each server holds for all groups together
+
+LOG_LOCK = threading.RLock()
+
+
+def run_groups(fn, item_list, max_groups=1):
+    # [fn(item)] in the order of item_list, at most max_groups calls at once, each in a copy of the context of the caller
+    # an exception is raised once all calls have finished, so the other groups are not cut off
+    if max_groups <= 1 or len(item_list) <= 1:
+        return [fn(item) for item in item_list]
+
+    with ThreadPoolExecutor(max_workers=min(max_groups, len(item_list))) as executor:
+        future_list = [executor.submit(contextvars.copy_context().run, fn, item) for item in item_list]
+    return [future.result() for future in future_list]
+
+
+def write_log_rows(log_path, row_list):
+    # the rows of one group are written in one block, so the blocks of groups running at the same time do not interleave
+    with LOG_LOCK:
+        with open(log_path, 'a') as f:
+            writer = csv.writer(f)
+            writer.writerows(row_list)
+            f.flush()
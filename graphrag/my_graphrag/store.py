@@ -0,0 +1,598 @@
+import os
+import json
+import sqlite3
+import threading
+
+
+# side store next to chroma.sqlite3 in the same database folder
+STORE_FILE_NAME = 'rg_rag.sqlite3'
+
+LOCK = threading.RLock()
+CONNECTIONS = {}
+
+# collections kept in item tables of the side store instead of chroma, they are never searched by embedding
+# table: table of the collection
+# document: column of the chroma document
+# columns: columns of the chroma metadatas, the keys a where filter can use
+ITEM_TABLES = {
+    'group': {
+        'table': 'item_group',
+        'document': 'group_name',
+        'columns': ['group_name'],
+    },
+    'paper': {
+        'table': 'item_paper',
+        'document': 'paper_content',
+        'columns': ['paper_name', 'group_id', 'hash'],
+    },
+    'relationship': {
+        'table': 'item_relationship',
+        'document': 'relationship_description',
+        'columns': ['source_entity_name', 'target_entity_name', 'relationship_description', 'relationship_strength', 'chunk_id', 'group_id'],
+    },
+}
+
+WHERE_OPERATORS = {
+    '$eq': '=',
+    '$ne': '!=',
+    '$gt': '>',
+    '$gte': '>=',
+    '$lt': '<',
+    '$lte': '<=',
+}
+
+
+def get_store_path(db_path):
+    return os.path.join(db_path, STORE_FILE_NAME)
+
+
+def get_connection(db_path):
+    # one connection per database path, shared by all threads and guarded by LOCK
+    db_path = os.path.normpath(db_path)
+    with LOCK:
+        conn = CONNECTIONS.get(db_path)
+        if conn is None:
+            os.makedirs(db_path, exist_ok=True)
+            conn = sqlite3.connect(
+                get_store_path(db_path),
+                timeout=60,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            init_tables(conn)
+            CONNECTIONS[db_path] = conn
+    return conn
+
+
+def close_connection(db_path):
+    db_path = os.path.normpath(db_path)
+    with LOCK:
+        conn = CONNECTIONS.pop(db_path, None)
+        if conn is not None:
+            conn.close()
+
+
+def init_tables(conn):
+    # meta
+    # key: name of a flag, e.g. which migrations have been applied
+    # value: flag value
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        '''
+    )
+
+    # id_sequence
+    # collection_name: chroma collection name
+    # last_id: last id handed out for the collection
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS id_sequence (
+            collection_name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )
+        '''
+    )
+
+    # content_hash
+    # collection_name: chroma collection name
+    # hash: sha256 of the item text with all whitespace removed
+    # item_id: id of the item in the collection
+    # group_id: group id of the item, '' if the item has none
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS content_hash (
+            collection_name TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            group_id TEXT NOT NULL DEFAULT '',
+            UNIQUE (collection_name, hash, item_id)
+        )
+        '''
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS content_hash_lookup ON content_hash (collection_name, hash)')
+
+    # item_group
+    # item_id: group id
+    # group_name: group name, also the chroma document of the group
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS item_group (
+            item_id INTEGER PRIMARY KEY,
+            group_name TEXT NOT NULL
+        )
+        '''
+    )
+
+    # item_paper
+    # item_id: paper id
+    # paper_content: full text of the paper
+    # paper_name: file name of the paper
+    # group_id: group id of the paper
+    # hash: sha256 of paper_content
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS item_paper (
+            item_id INTEGER PRIMARY KEY,
+            paper_content TEXT NOT NULL,
+            paper_name TEXT NOT NULL,
+            group_id TEXT NOT NULL,
+            hash TEXT NOT NULL
+        )
+        '''
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS item_paper_group ON item_paper (group_id)')
+
+    # item_relationship
+    # item_id: relationship id
+    # source_entity_name, target_entity_name, relationship_description, relationship_strength: graphrag relationship
+    # chunk_id: id of the chunk the relationship comes from
+    # group_id: group id of the chunk, '' if unknown
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS item_relationship (
+            item_id INTEGER PRIMARY KEY,
+            source_entity_name TEXT NOT NULL,
+            target_entity_name TEXT NOT NULL,
+            relationship_description TEXT NOT NULL,
+            relationship_strength NUMERIC,
+            chunk_id TEXT NOT NULL,
+            group_id TEXT NOT NULL DEFAULT ''
+        )
+        '''
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS item_relationship_group ON item_relationship (group_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS item_relationship_chunk ON item_relationship (chunk_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS item_relationship_description ON item_relationship (relationship_description)')
+
+    # chunk_text
+    # chunk_id: id of the chunk in the chunk collection
+    # denoising_chunk: denoised text of the chunk
+    # sub_chunks: json list of the sub chunks of denoising_chunk
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS chunk_text (
+            chunk_id INTEGER PRIMARY KEY,
+            denoising_chunk TEXT NOT NULL,
+            sub_chunks TEXT NOT NULL
+        )
+        '''
+    )
+
+    # journal
+    # group_id: group of the unit
+    # stage: indexing stage of the unit, e.g. denoise, extraction, community_report or raptor_level
+    # unit: key of the unit in the stage and group, e.g. the paper name, or the chunk id and sub chunk index
+    # status: 'started' or 'done'
+    # item_ids: json {collection_name: [ids]} of the items written by the unit
+    # output: result of the unit that a restart reuses instead of computing it again, '' if there is none
+    # update_time: time of the last change
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS journal (
+            group_id TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            unit TEXT NOT NULL,
+            status TEXT NOT NULL,
+            item_ids TEXT NOT NULL DEFAULT '{}',
+            output TEXT NOT NULL DEFAULT '',
+            update_time TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (group_id, stage, unit)
+        )
+        '''
+    )
+
+
+def get_meta(db_path, key, default=None):
+    with LOCK:
+        conn = get_connection(db_path)
+        row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row is not None else default
+
+
+def set_meta(db_path, key, value):
+    with LOCK:
+        conn = get_connection(db_path)
+        conn.execute(
+            'INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+            (key, str(value))
+        )
+
+
+def next_ids(db_path, collection_name, count=1, seed_fn=None):
+    # allocate count new ids for the collection in one atomic step
+    # seed_fn returns the current max id of the collection and is only called once per collection,
+    # when the sequence does not exist yet (e.g. a database created before the sequence was added)
+    if count <= 0:
+        return []
+
+    with LOCK:
+        conn = get_connection(db_path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT last_id FROM id_sequence WHERE collection_name = ?',
+                (collection_name,)
+            ).fetchone()
+
+            if row is None:
+                last_id = int(seed_fn()) if seed_fn is not None else 0
+                conn.execute(
+                    'INSERT INTO id_sequence (collection_name, last_id) VALUES (?, ?)',
+                    (collection_name, last_id + count)
+                )
+            else:
+                last_id = row[0]
+                conn.execute(
+                    'UPDATE id_sequence SET last_id = ? WHERE collection_name = ?',
+                    (last_id + count, collection_name)
+                )
+
+            conn.execute('COMMIT')
+        except:
+            conn.execute('ROLLBACK')
+            raise
+
+    return [str(i) for i in range(last_id + 1, last_id + count + 1)]
+
+
+def seed_id_sequence(db_path, collection_name, last_id):
+    # never move a sequence backwards, so ids are not reused after a delete
+    with LOCK:
+        conn = get_connection(db_path)
+        conn.execute(
+            '''
+            INSERT INTO id_sequence (collection_name, last_id) VALUES (?, ?)
+            ON CONFLICT(collection_name) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)
+            ''',
+            (collection_name, int(last_id))
+        )
+
+
+def get_last_id(db_path, collection_name):
+    with LOCK:
+        conn = get_connection(db_path)
+        row = conn.execute(
+            'SELECT last_id FROM id_sequence WHERE collection_name = ?',
+            (collection_name,)
+        ).fetchone()
+    return row[0] if row is not None else None
+
+
+def add_content_hashes(db_path, collection_name, hash_list):
+    # hash_list: [(hash, item_id, group_id)]
+    if not hash_list:
+        return
+
+    with LOCK:
+        conn = get_connection(db_path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT OR IGNORE INTO content_hash (collection_name, hash, item_id, group_id) VALUES (?, ?, ?, ?)',
+                [(collection_name, hash_value, str(item_id), str(group_id or '')) for hash_value, item_id, group_id in hash_list]
+            )
+            conn.execute('COMMIT')
+        except:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def find_content_hash(db_path, collection_name, hash_value, group_id=None):
+    # return the smallest item id with the hash, preferring items of group_id if given
+    with LOCK:
+        conn = get_connection(db_path)
+        rows = conn.execute(
+            'SELECT item_id, group_id FROM content_hash WHERE collection_name = ? AND hash = ? ORDER BY CAST(item_id AS INTEGER)',
+            (collection_name, hash_value)
+        ).fetchall()
+
+    if group_id is not None:
+        for item_id, item_group_id in rows:
+            if item_group_id == str(group_id) or item_group_id == '':
+                return item_id
+        return None
+
+    return rows[0][0] if rows else None
+
+
+def delete_content_hashes(db_path, collection_name, ids):
+    if not ids:
+        return
+
+    with LOCK:
+        conn = get_connection(db_path)
+        conn.executemany(
+            'DELETE FROM content_hash WHERE collection_name = ? AND item_id = ?',
+            [(collection_name, str(item_id)) for item_id in ids]
+        )
+
+
+def get_item_table(collection_name):
+    item_table = ITEM_TABLES[collection_name]
+    # document column first, then the metadatas columns not already in it
+    column_list = [item_table['document']] + [c for c in item_table['columns'] if c != item_table['document']]
+    return item_table['table'], item_table['document'], item_table['columns'], column_list
+
+
+def get_where_sql(columns, where):
+    # translate a chroma where filter on the metadatas into sql
+    # supports {key: value}, {key: {operator: value}} with $eq $ne $gt $gte $lt $lte $in $nin, and $and / $or lists
+    if not where:
+        return '1', []
+
+    sql_list = []
+    params = []
+    for key, value in where.items():
+        if key in ('$and', '$or'):
+            sub_list = [get_where_sql(columns, sub_where) for sub_where in value]
+            if not sub_list:
+                sql_list.append('1' if key == '$and' else '0')
+                continue
+            joiner = ' AND ' if key == '$and' else ' OR '
+            sql_list.append('(' + joiner.join(sub_sql for sub_sql, _ in sub_list) + ')')
+            for _, sub_params in sub_list:
+                params += sub_params
+            continue
+
+        if key not in columns:
+            raise ValueError(f'Unknown metadata key {key}')
+
+        if isinstance(value, dict):
+            (operator, operand), = value.items()
+        else:
+            operator, operand = '$eq', value
+
+        if operator in ('$in', '$nin'):
+            # one json parameter instead of one parameter per value, so long lists do not hit the sqlite limit
+            sql_list.append(f'{key} {"IN" if operator == "$in" else "NOT IN"} (SELECT value FROM json_each(?))')
+            params.append(json.dumps(list(operand)))
+        elif operator in WHERE_OPERATORS:
+            sql_list.append(f'{key} {WHERE_OPERATORS[operator]} ?')
+            params.append(operand)
+        else:
+            raise ValueError(f'Unknown where operator {operator}')
+
+    return '(' + ' AND '.join(sql_list) + ')', params
+
+
+def convert_item_row(row, column_list, document_column, columns, with_documents):
+    # row: (item_id, *column_list) -> (item_id, document, metadatas)
+    values = dict(zip(column_list, row[1:]))
+    documents = values[document_column] if with_documents else None
+    metadatas = {c: values[c] for c in columns}
+    return str(row[0]), documents, metadatas
+
+
+def add_items(db_path, collection_name, ids_list, documents_list, metadatas_list):
+    table, document_column, columns, column_list = get_item_table(collection_name)
+
+    rows = []
+    for ids, documents, metadatas in zip(ids_list, documents_list, metadatas_list):
+        values = {**metadatas, document_column: documents}
+        rows.append([int(ids)] + [values.get(c, '') for c in column_list])
+
+    with LOCK:
+        conn = get_connection(db_path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                f'INSERT OR REPLACE INTO {table} (item_id, {", ".join(column_list)}) VALUES ({", ".join(["?"] * (len(column_list) + 1))})',
+                rows
+            )
+            conn.execute('COMMIT')
+        except:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def update_items(db_path, collection_name, ids_list, metadatas_list):
+    # set the metadatas columns in metadatas, the other columns are kept
+    table, _, columns, _ = get_item_table(collection_name)
+
+    with LOCK:
+        conn = get_connection(db_path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for ids, metadatas in zip(ids_list, metadatas_list):
+                update_columns = [c for c in columns if c in metadatas]
+                if update_columns:
+                    conn.execute(
+                        f'UPDATE {table} SET {", ".join(f"{c} = ?" for c in update_columns)} WHERE item_id = ?',
+                        [metadatas[c] for c in update_columns] + [int(ids)]
+                    )
+            conn.execute('COMMIT')
+        except:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def iter_items(db_path, collection_name, where=None, with_documents=True, page_size=1000):
+    # yield (item_id, document, metadatas) in id order, one query per page, the lock is not held between pages
+    table, document_column, columns, column_list = get_item_table(collection_name)
+    where_sql, params = get_where_sql(columns, where)
+    # the document column is not read without documents, unless it is a metadatas column too
+    select_list = [c if with_documents or c in columns else 'NULL' for c in column_list]
+
+    last_id = -1
+    while True:
+        with LOCK:
+            conn = get_connection(db_path)
+            rows = conn.execute(
+                f'SELECT item_id, {", ".join(select_list)} FROM {table} WHERE {where_sql} AND item_id > ? ORDER BY item_id LIMIT ?',
+                params + [last_id, page_size]
+            ).fetchall()
+
+        for row in rows:
+            yield convert_item_row(row, column_list, document_column, columns, with_documents)
+
+        if len(rows) < page_size:
+            break
+        last_id = rows[-1][0]
+
+
+def get_items(db_path, collection_name, ids_list, with_documents=True):
+    # [(item_id, document, metadatas)] of the ids in ids_list that exist
+    ids_list = [int(ids) for ids in ids_list]
+    if not ids_list:
+        return []
+
+    table, document_column, columns, column_list = get_item_table(collection_name)
+    with LOCK:
+        conn = get_connection(db_path)
+        rows = conn.execute(
+            f'SELECT item_id, {", ".join(column_list)} FROM {table} WHERE item_id IN (SELECT value FROM json_each(?))',
+            (json.dumps(ids_list),)
+        ).fetchall()
+
+    return [convert_item_row(row, column_list, document_column, columns, with_documents) for row in rows]
+
+
+def delete_items(db_path, collection_name, ids_list):
+    if not ids_list:
+        return
+
+    table, _, _, _ = get_item_table(collection_name)
+    with LOCK:
+        conn = get_connection(db_path)
+        conn.execute(
+            f'DELETE FROM {table} WHERE item_id IN (SELECT value FROM json_each(?))',
+            (json.dumps([int(ids) for ids in ids_list]),)
+        )
+
+
+def count_items(db_path, collection_name):
+    table, _, _, _ = get_item_table(collection_name)
+    with LOCK:
+        conn = get_connection(db_path)
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def get_max_item_id(db_path, collection_name):
+    table, _, _, _ = get_item_table(collection_name)
+    with LOCK:
+        conn = get_connection(db_path)
+        return conn.execute(f'SELECT COALESCE(MAX(item_id), 0) FROM {table}').fetchone()[0]
+
+
+def set_chunk_texts(db_path, chunk_text_list, replace=True):
+    # chunk_text_list: [(chunk_id, denoising_chunk, sub_chunks_json)]
+    # replace False keeps the rows that exist already
+    if not chunk_text_list:
+        return
+
+    with LOCK:
+        conn = get_connection(db_path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                f'INSERT OR {"REPLACE" if replace else "IGNORE"} INTO chunk_text (chunk_id, denoising_chunk, sub_chunks) VALUES (?, ?, ?)',
+                [(int(chunk_id), denoising_chunk, sub_chunks) for chunk_id, denoising_chunk, sub_chunks in chunk_text_list]
+            )
+            conn.execute('COMMIT')
+        except:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def get_chunk_texts(db_path, chunk_id_list):
+    # {chunk_id: (denoising_chunk, sub_chunks_json)}
+    chunk_id_list = [int(chunk_id) for chunk_id in chunk_id_list]
+    if not chunk_id_list:
+        return {}
+
+    with LOCK:
+        conn = get_connection(db_path)
+        rows = conn.execute(
+            'SELECT chunk_id, denoising_chunk, sub_chunks FROM chunk_text WHERE chunk_id IN (SELECT value FROM json_each(?))',
+            (json.dumps(chunk_id_list),)
+        ).fetchall()
+
+    return {str(chunk_id): (denoising_chunk, sub_chunks) for chunk_id, denoising_chunk, sub_chunks in rows}
+
+
+def delete_chunk_texts(db_path, chunk_id_list):
+    if not chunk_id_list:
+        return
+
+    with LOCK:
+        conn = get_connection(db_path)
+        conn.execute(
+            'DELETE FROM chunk_text WHERE chunk_id IN (SELECT value FROM json_each(?))',
+            (json.dumps([int(chunk_id) for chunk_id in chunk_id_list]),)
+        )
+
+
+def set_journal_unit(db_path, group_id, stage, unit, status, item_ids=None, output=''):
+    # item_ids: {collection_name: [ids]}
+    with LOCK:
+        conn = get_connection(db_path)
+        conn.execute(
+            '''
+            INSERT INTO journal (group_id, stage, unit, status, item_ids, output) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(group_id, stage, unit) DO UPDATE SET
+                status = excluded.status, item_ids = excluded.item_ids, output = excluded.output, update_time = CURRENT_TIMESTAMP
+            ''',
+            (str(group_id), stage, str(unit), status, json.dumps(item_ids or {}), output or '')
+        )
+
+
+def get_journal_units(db_path, group_id, stage, unit=None):
+    # {unit: {'status': status, 'item_ids': {collection_name: [ids]}, 'output': output}} of all units of the stage, or of unit only
+    sql = 'SELECT unit, status, item_ids, output FROM journal WHERE group_id = ? AND stage = ?'
+    params = [str(group_id), stage]
+    if unit is not None:
+        sql += ' AND unit = ?'
+        params.append(str(unit))
+
+    with LOCK:
+        conn = get_connection(db_path)
+        rows = conn.execute(sql, params).fetchall()
+
+    return {
+        row_unit: {'status': status, 'item_ids': json.loads(item_ids), 'output': output}
+        for row_unit, status, item_ids, output in rows
+    }
+
+
+def delete_journal_units(db_path, group_id, stage_list, keep_done=False, unit_list=None):
+    # keep_done True only deletes the units that did not finish
+    # unit_list: only delete these units, None for all units of the stages
+    if not stage_list:
+        return
+
+    sql = 'DELETE FROM journal WHERE group_id = ? AND stage IN (SELECT value FROM json_each(?))'
+    params = [str(group_id), json.dumps(stage_list)]
+    if keep_done:
+        sql += " AND status != 'done'"
+    if unit_list is not None:
+        sql += ' AND unit IN (SELECT value FROM json_each(?))'
+        params.append(json.dumps([str(unit) for unit in unit_list]))
+
+    with LOCK:
+        conn = get_connection(db_path)
+        conn.execute(sql, params)
@@ -0,0 +1,134 @@
+import os
+import csv
+import json
+import time
+import threading
+
+import graphrag.my_graphrag.context as context
+
+
+# columns of the summary table, one row per phase
+SUMMARY_FIELDS = [
+    'phase', 'calls', 'cache_hits', 'failed', 'prompt_tokens', 'cached_tokens', 'prefix_hit_rate', 'completion_tokens',
+    'ttft_mean', 'latency_p50', 'latency_p95', 'latency_total', 'queue_time_total'
+]
+
+LOCK = threading.RLock()
+
+
+def get_trace_path():
+    # JSONL trace of the LLM calls of the current run, '' if no trace is written
+    return context.get_context().trace_path
+
+
+def get_record(phase, role, model_path, server_url, cache_hit, stats=None):
+    # one LLM call, stats comes from SGLClient.generate and is None for a cache hit
+    stats = stats or {}
+    return {
+        'time': time.time(),
+        'pid': os.getpid(),
+        'phase': phase,
+        'role': role or '',
+        'model': os.path.basename(model_path),
+        'server': server_url,
+        'cache_hit': cache_hit,
+        'ok': stats.get('ok', True),
+        'stopped': stats.get('stopped', False),
+        'prompt_tokens': stats.get('prompt_tokens', 0),
+        'completion_tokens': stats.get('completion_tokens', 0),
+        'cached_tokens': stats.get('cached_tokens', 0),
+        'ttft': stats.get('ttft'),
+        'queue_time': stats.get('queue_time', 0),
+        'latency': stats.get('latency', 0),
+        'in_flight_limit': stats.get('in_flight_limit', 0),
+    }
+
+
+def write_records(record_list, trace_path):
+    # append to the trace, the graphrag subprocess appends to the same file
+    if not trace_path or not record_list:
+        return
+
+    text = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in record_list)
+    with LOCK:
+        os.makedirs(os.path.dirname(trace_path), exist_ok=True)
+        with open(trace_path, 'a') as f:
+            f.write(text)
+            f.flush()
+
+
+def read_records(trace_path):
+    record_list = []
+    if not os.path.isfile(trace_path):
+        return record_list
+
+    with open(trace_path, 'r') as f:
+        for line in f:
+            try:
+                record_list.append(json.loads(line))
+            except ValueError:
+                # a line cut by a crash
+                pass
+    return record_list
+
+
+def get_percentile(value_list, percentile):
+    if not value_list:
+        return 0
+    value_list = sorted(value_list)
+    return value_list[min(len(value_list) - 1, int(len(value_list) * percentile / 100))]
+
+
+def summarize_records(record_list):
+    # one row per phase in the order the phases first appear, and a total row
+    phase_record_dict = {}
+    for record in record_list:
+        phase_record_dict.setdefault(record['phase'] or 'other', []).append(record)
+    phase_record_dict['total'] = record_list
+
+    row_list = []
+    for phase, phase_record_list in phase_record_dict.items():
+        sent_record_list = [record for record in phase_record_list if not record['cache_hit']]
+        ttft_list = [record['ttft'] for record in sent_record_list if record['ttft'] is not None]
+        latency_list = [record['latency'] for record in sent_record_list]
+        prompt_tokens = sum(record['prompt_tokens'] or 0 for record in sent_record_list)
+        # share of the prompt tokens served from the prefix cache of the server, older traces have no cached_tokens
+        cached_tokens = sum(record.get('cached_tokens') or 0 for record in sent_record_list)
+        row_list.append({
+            'phase': phase,
+            'calls': len(phase_record_list),
+            'cache_hits': len(phase_record_list) - len(sent_record_list),
+            'failed': len([record for record in sent_record_list if not record['ok']]),
+            'prompt_tokens': prompt_tokens,
+            'cached_tokens': cached_tokens,
+            'prefix_hit_rate': round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0,
+            'completion_tokens': sum(record['completion_tokens'] or 0 for record in sent_record_list),
+            'ttft_mean': round(sum(ttft_list) / len(ttft_list), 3) if ttft_list else 0,
+            'latency_p50': round(get_percentile(latency_list, 50), 3),
+            'latency_p95': round(get_percentile(latency_list, 95), 3),
+            'latency_total': round(sum(latency_list), 3),
+            'queue_time_total': round(sum(record['queue_time'] for record in sent_record_list), 3),
+        })
+
+    return row_list
+
+
+def write_summary(trace_path, summary_path):
+    # summary table of a trace as csv, printed as well, None if the trace has no calls
+    record_list = read_records(trace_path)
+    if not record_list:
+        return None
+
+    row_list = summarize_records(record_list)
+    with open(summary_path, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(row_list)
+        f.flush()
+
+    output_format = '{:<24}' + '{:>18}' * (len(SUMMARY_FIELDS) - 1)
+    print(output_format.format(*SUMMARY_FIELDS))
+    for row in row_list:
+        print(output_format.format(*[str(row[field]) for field in SUMMARY_FIELDS]))
+
+    return row_list
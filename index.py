@@ -3,11 +3,14 @@ import shutil
 import subprocess
 import argparse
 import pathlib
-import csv
 import pdftotext
 from datetime import datetime
 import graphrag.my_graphrag.db as db
 import graphrag.my_graphrag.model as model
+import graphrag.my_graphrag.pipeline as pipeline
+import graphrag.my_graphrag.scheduler as scheduler
+import graphrag.my_graphrag.context as context
+import graphrag.my_graphrag.telemetry as telemetry
 from graphrag.my_graphrag.raptor import raptor_index
 
 
@@ -52,35 +55,52 @@ def extract_text_from_pdf(pdf_path, save_txt_file=False):
     return pdftotext_text
 
 
-def get_denoising_chunk(original_chunk, group_chunk_idx, denoising_group_dir=''):
-    prompt = DENOISING_PROMPT.format(input_text=original_chunk)
+def get_denoising_chunks(original_chunk_list, group_chunk_idx_list, denoising_group_dir=''):
+    # all chunks are sent to the SGL server at once
+    prompt_list = [DENOISING_PROMPT.format(input_text=original_chunk) for original_chunk in original_chunk_list]
 
-    output = model.get_response_from_sgl(prompt)
+    output_list = model.generate_many(prompt_list, role='denoise', phase='denoise')
 
     if denoising_group_dir and os.path.isdir(denoising_group_dir):
         # export input and output
-        prefix = f'denoising_prompt_{group_chunk_idx}'
+        for group_chunk_idx, prompt, output in zip(group_chunk_idx_list, prompt_list, output_list):
+            prefix = f'denoising_prompt_{group_chunk_idx}'
 
-        with open(os.path.join(denoising_group_dir, f'{prefix}_input.txt'), 'w') as f:
-            f.write(prompt)
-            f.flush()
+            with open(os.path.join(denoising_group_dir, f'{prefix}_input.txt'), 'w') as f:
+                f.write(prompt)
+                f.flush()
 
-        with open(os.path.join(denoising_group_dir, f'{prefix}_output.txt'), 'w') as f:
-            f.write(output)
-            f.flush()
+            with open(os.path.join(denoising_group_dir, f'{prefix}_output.txt'), 'w') as f:
+                f.write(output)
+                f.flush()
 
-    return output
+    return output_list
 
 
-def save_group_and_paper(export_prompts):
+def denoise_group(group_id, new_chunk_list, denoising_group_dir):
+    # new_chunk_list: [(paper_id, paper_name, chunk)] of the papers of the group saved in this run or not denoised before a restart
+    denoising_chunk_list = get_denoising_chunks(
+        [chunk for _, _, chunk in new_chunk_list],
+        [f'{paper_id}' for paper_id, _, _ in new_chunk_list],
+        denoising_group_dir
+    )
+    for (paper_id, paper_name, chunk), denoising_chunk in zip(new_chunk_list, denoising_chunk_list):
+        chunk_id = db.save_new_chunk(chunk, paper_id, group_id, denoising_chunk=denoising_chunk)
+        db.finish_journal_unit(db.JOURNAL_DENOISE, paper_name, group_id, {db.COLLECTION_CHUNK: [chunk_id]})
+
+
+def save_group_and_paper(export_prompts, denoising_prompt_dir, max_groups=1):
+    # groups and papers are saved one group after another, then max_groups groups are denoised at the same time
     # use llama for denoise
-    model.start_sgl_server_llama()
+    started = model.start_role_server('denoise')
 
     cur_group_list = db.get_all_groups()
-    cur_paper_list = db.get_all_papers()
+    cur_paper_list = db.get_all_papers(with_content=False)
 
     new_paper_list_list_graphrag = []
     new_paper_list_list_raptor = []
+    # (group_id, new_chunk_list, denoising_group_dir) of each group
+    denoise_job_list = []
     group_folder_list = os.listdir(INPUT_DIR)
     group_folder_list.sort()
     for group_name in group_folder_list:
@@ -94,10 +114,17 @@ def save_group_and_paper(export_prompts):
                 break
 
         if existing_group_id is not None:
+            # the journal of a stage decides, groups indexed before the journal was added go by the items they have
+            graphrag_unit = db.get_journal_unit(db.JOURNAL_GRAPHRAG, db.JOURNAL_GROUP_UNIT, existing_group_id)
+            raptor_unit = db.get_journal_unit(db.JOURNAL_RAPTOR, db.JOURNAL_GROUP_UNIT, existing_group_id)
             paper_id_list, chunk_id_list, relationship_id_list, report_id_list, summary_id_list = db.get_ref_ids_for_group(existing_group_id)
-            if len(summary_id_list) == 0:
+            if raptor_unit is not None:
+                new_raptor = raptor_unit['status'] != db.JOURNAL_DONE
+            elif len(summary_id_list) == 0:
                 new_raptor = True
-            if len(report_id_list) == 0 or len(relationship_id_list) == 0:
+            if graphrag_unit is not None:
+                new_graphrag = graphrag_unit['status'] != db.JOURNAL_DONE
+            elif len(report_id_list) == 0 or len(relationship_id_list) == 0:
                 new_graphrag = True
         else:
             new_graphrag = True
@@ -121,15 +148,21 @@ def save_group_and_paper(export_prompts):
         txt_file_list.sort()
 
         group_id = db.save_new_group(group_name) if existing_group_id is None else existing_group_id
+        if new_graphrag:
+            db.start_journal_unit(db.JOURNAL_GRAPHRAG, db.JOURNAL_GROUP_UNIT, group_id)
+        if new_raptor:
+            db.start_journal_unit(db.JOURNAL_RAPTOR, db.JOURNAL_GROUP_UNIT, group_id)
 
         denoising_group_dir = ''
         if export_prompts:
-            denoising_group_dir = os.path.join(DENOISING_PROMPT_DIR, group_name)
+            denoising_group_dir = os.path.join(denoising_prompt_dir, group_name)
             if os.path.isdir(denoising_group_dir):
                 shutil.rmtree(denoising_group_dir)
-            os.mkdir(denoising_group_dir)
+            os.makedirs(denoising_group_dir)
 
         new_paper_list = []
+        # (paper_id, paper_name, chunk) of the papers to denoise, denoised together by denoise_group
+        new_chunk_list = []
         for txt_file_path in txt_file_list:
             with open(txt_file_path, 'r') as txtf:
                 paper_content = txtf.read()
@@ -143,10 +176,17 @@ def save_group_and_paper(export_prompts):
                         break
 
             if paper_id is None:
+                db.start_journal_unit(db.JOURNAL_DENOISE, paper_name, group_id)
                 paper_id = db.save_new_paper(paper_content, paper_name, group_id)
-                chunk = paper_content
-                denoising_chunk = get_denoising_chunk(chunk, f'{paper_id}', denoising_group_dir)
-                db.save_new_chunk(chunk, paper_id, group_id, denoising_chunk=denoising_chunk)
+                new_chunk_list.append((paper_id, paper_name, paper_content))
+            else:
+                denoise_unit = db.get_journal_unit(db.JOURNAL_DENOISE, paper_name, group_id)
+                if denoise_unit is not None and denoise_unit['status'] != db.JOURNAL_DONE:
+                    # saved before a restart but not denoised, the chunk may be written without its unit being done
+                    paper_chunk_id_list = db.get_ids_where(db.COLLECTION_CHUNK, {'paper_id': paper_id})
+                    if paper_chunk_id_list:
+                        db.delete_items(db.COLLECTION_CHUNK, paper_chunk_id_list)
+                    new_chunk_list.append((paper_id, paper_name, paper_content))
 
             new_paper_list.append(
                 {
@@ -156,13 +196,18 @@ def save_group_and_paper(export_prompts):
                 }
             )
 
+        denoise_job_list.append((group_id, new_chunk_list, denoising_group_dir))
+
         if new_paper_list:
             if new_graphrag:
                 new_paper_list_list_graphrag.append(new_paper_list)
             if new_raptor:
                 new_paper_list_list_raptor.append(new_paper_list)
 
-    model.stop_sgl_server()
+    scheduler.run_groups(lambda job: denoise_group(*job), denoise_job_list, max_groups)
+
+    if started:
+        model.stop_sgl_server()
 
     return new_paper_list_list_graphrag, new_paper_list_list_raptor
 
@@ -200,6 +245,98 @@ def check_config_example_dir():
     return True
 
 
+def graphrag_index_group(new_paper_list, args, pipeline_config, tmp_config_dir, tmp_prompts_dir, denoising_prompt_dir,
+                         db_output_graphrag_output_dir, db_output_prompts_dir, log_path):
+    # index one group with graphrag, the tmp folders of the group are inside tmp_config_dir and tmp_prompts_dir,
+    # so groups indexed at the same time do not share them
+    start_time_one_group = datetime.now()
+
+    group_name = ''
+    group_id = ''
+    paper_name_list = []
+    paper_id_list = []
+
+    for new_paper in new_paper_list:
+        txt_file = new_paper['txt_path']
+        paper_id_list.append(new_paper['paper_id'])
+        paper_name_list.append(os.path.basename(txt_file))
+        if not group_name:
+            group_name = os.path.basename(os.path.dirname(txt_file))
+            group_id = new_paper['group_id']
+
+    # relationships and reports of units cut off by a crash are deleted, the done units are skipped by the extractors
+    rollback_count = db.rollback_journal_stage(group_id, db.JOURNAL_GRAPHRAG)
+    if rollback_count:
+        print(f'Group ID {group_id}: {rollback_count} items of unfinished units rolled back.')
+
+    group_tmp_prompts_dir = os.path.join(tmp_prompts_dir, group_name)
+    if os.path.isdir(group_tmp_prompts_dir):
+        shutil.rmtree(group_tmp_prompts_dir)
+    if args.export_prompts:
+        os.makedirs(group_tmp_prompts_dir)
+
+    group_tmp_config_dir = os.path.join(tmp_config_dir, group_name)
+    if args.graphrag_subprocess:
+        if os.path.isdir(group_tmp_config_dir):
+            shutil.rmtree(group_tmp_config_dir)
+        shutil.copytree(CONFIG_EXAMPLE_DIR, group_tmp_config_dir)
+        for new_paper in new_paper_list:
+            txt_file = new_paper['txt_path']
+            shutil.copyfile(txt_file, os.path.join(group_tmp_config_dir, 'input', os.path.basename(txt_file)))
+
+        # python -m graphrag.index --root ./ragtest
+        # the subprocess gets the database, group, model and prompt folder of this run from its environment
+        env = context.get_subprocess_env(group_id=group_id, prompt_dir=group_tmp_prompts_dir)
+        # each subprocess has its own SGL client and in-flight limit, so the groups running at the same time
+        # split the limit and its cap, and together send no more requests than one client would
+        max_in_flight = max(model.MIN_IN_FLIGHT, model.MAX_IN_FLIGHT // max(args.max_groups, 1))
+        max_in_flight_cap = max(max_in_flight, model.MAX_IN_FLIGHT_CAP // max(args.max_groups, 1))
+        env['RG_RAG_SGL_MAX_IN_FLIGHT'] = str(max_in_flight)
+        env['RG_RAG_SGL_MAX_IN_FLIGHT_CAP'] = str(max_in_flight_cap)
+        # the verbs hand every row to the SGL client, whose in-flight limit follows the server load,
+        # so they run as many rows at once as the limit may grow to
+        env.setdefault('GRAPHRAG_LLM_THREAD_COUNT', str(max_in_flight_cap))
+        p = subprocess.Popen(['python', '-m', 'graphrag.index', '--root', group_tmp_config_dir], env=env)
+        p.wait()
+        succeeded = p.returncode == 0
+    else:
+        # the artifacts and reports of the group go straight to its output folder
+        group_output_dir = os.path.join(db_output_graphrag_output_dir, group_name + start_time_one_group.strftime('-%Y-%m-%d-%H-%M-%S'))
+        succeeded = pipeline.run_group(pipeline_config, group_id, paper_id_list, group_output_dir, group_tmp_prompts_dir)
+
+    # a failed group stays started, the next run goes on from its done units
+    if succeeded:
+        db.finish_journal_unit(db.JOURNAL_GRAPHRAG, db.JOURNAL_GROUP_UNIT, group_id)
+
+    end_time_one_group = datetime.now()
+
+    if os.path.isdir(group_tmp_config_dir):
+        shutil.move(group_tmp_config_dir, os.path.join(db_output_graphrag_output_dir, group_name + end_time_one_group.strftime('-%Y-%m-%d-%H-%M-%S')))
+
+    if args.export_prompts:
+        denoising_group_dir = os.path.join(denoising_prompt_dir, group_name)
+        if os.path.isdir(denoising_group_dir) and os.path.isdir(group_tmp_prompts_dir):
+            for fn in os.listdir(denoising_group_dir):
+                shutil.move(os.path.join(denoising_group_dir, fn), os.path.join(group_tmp_prompts_dir, fn))
+            shutil.rmtree(denoising_group_dir)
+
+        if os.path.isdir(group_tmp_prompts_dir):
+            shutil.move(group_tmp_prompts_dir, os.path.join(db_output_prompts_dir, 'index-' + group_name + end_time_one_group.strftime('-%Y-%m-%d-%H-%M-%S')))
+        else:
+            print(f'No prompts folder found for {group_name}')
+
+    scheduler.write_log_rows(log_path, [
+        ['Start time', start_time_one_group.strftime('%Y-%m-%d-%H-%M-%S')],
+        ['Group ID', group_id],
+        ['Group name', group_name],
+        ['Document IDs', str(paper_id_list)],
+        ['Document names', str(paper_name_list)],
+        ['Index type', 'GraphRAG'],
+        ['Run time', end_time_one_group - start_time_one_group],
+        ['End time', end_time_one_group.strftime('%Y-%m-%d-%H-%M-%S')],
+    ])
+
+
 def process_arguments():
     parser = argparse.ArgumentParser()
 
@@ -247,6 +384,41 @@ def process_arguments():
         help=f'If True, export the input and output text of all 3 index prompts. If False, skip exporting. Default is False.'
     )
 
+    parser.add_argument(
+        '--migrate',
+        type=lambda x: x.lower() == 'true',
+        default=False,
+        help='If True, migrate an existing database to the current format and exit. Default is False.'
+    )
+
+    parser.add_argument(
+        '--llm_cache_bypass',
+        type=lambda x: x.lower() == 'true',
+        default=False,
+        help='If True, do not read responses from the LLM cache, new responses are still cached. Default is False.'
+    )
+
+    parser.add_argument(
+        '--constrained_decoding',
+        type=lambda x: x.lower() == 'true',
+        default=False,
+        help='If True, constrain the responses of prompts with a known format (e.g. XML) to that format. Default is False.'
+    )
+
+    parser.add_argument(
+        '--graphrag_subprocess',
+        type=lambda x: x.lower() == 'true',
+        default=False,
+        help='If True, run "python -m graphrag.index" on a copy of the config folder for each group instead of running the pipeline in this process. Default is False.'
+    )
+
+    parser.add_argument(
+        '--max_groups', '-n',
+        type=int,
+        default=1,
+        help='Number of groups denoised, indexed and summarized at the same time. The LLM calls of all groups share the in-flight limit of the SGL server. Default is 1.'
+    )
+
     args = parser.parse_args()
 
     if not args.raptor and not args.graphrag:
@@ -263,6 +435,15 @@ def process_arguments():
         return None
 
     db.update_db_path(input_db_path)
+    context.update_context(llm_cache_bypass=args.llm_cache_bypass, constrained_decoding=args.constrained_decoding)
+
+    if args.migrate:
+        if not os.path.isdir(input_db_path):
+            print(f'Database path "{input_db_path}" does not exist.')
+            return None
+
+        db.migrate_db()
+        return None
 
     if args.del_group != -1:
         if args.del_option == 'graphrag':
@@ -284,132 +465,91 @@ def process_arguments():
 def main():
     start_time = datetime.now()
 
-    db.rm_db_tmp_file()
-
     args = process_arguments()
     if args is None:
-        db.rm_db_tmp_file()
         return
 
     if not check_config_example_dir():
         return
 
-    model.remove_model_tmp_file()
     model.check_model_dir()
 
-    if os.path.isdir(TMP_CONFIG_DIR):
-        shutil.rmtree(TMP_CONFIG_DIR)
+    # tmp folders of this run, one per database so runs on different databases do not share them
+    db_name = os.path.basename(os.path.normpath(db.get_db_path()))
+    tmp_config_dir = os.path.join(TMP_CONFIG_DIR, db_name)
+    tmp_prompts_dir = os.path.join(TMP_PROMPTS_DIR, db_name)
+    denoising_prompt_dir = os.path.join(DENOISING_PROMPT_DIR, db_name)
+
+    if os.path.isdir(tmp_config_dir):
+        shutil.rmtree(tmp_config_dir)
 
     if not os.path.isdir(OUTPUT_DIR):
         os.mkdir(OUTPUT_DIR)
 
     if not os.path.isdir(PROMPTS_DIR):
         os.mkdir(PROMPTS_DIR)
-    if os.path.isdir(TMP_PROMPTS_DIR):
-        shutil.rmtree(TMP_PROMPTS_DIR)
+    if os.path.isdir(tmp_prompts_dir):
+        shutil.rmtree(tmp_prompts_dir)
 
-    db_output_dir = os.path.join(OUTPUT_DIR, os.path.basename(os.path.normpath(db.get_db_path())))
+    db_output_dir = os.path.join(OUTPUT_DIR, db_name)
     db_output_prompts_dir = os.path.join(db_output_dir, 'prompts')
     os.makedirs(db_output_prompts_dir, exist_ok=True)
     db_output_graphrag_output_dir = os.path.join(db_output_dir, 'graphrag_output')
     os.makedirs(db_output_graphrag_output_dir, exist_ok=True)
 
     log_path = os.path.join(db_output_dir, 'index_log_%s.csv' % (start_time.strftime('%Y-%m-%d-%H-%M-%S')))
+    # every LLM call of the run, including the graphrag pipeline, is recorded here
+    trace_path = os.path.join(db_output_dir, 'index_llm_trace_%s.jsonl' % (start_time.strftime('%Y-%m-%d-%H-%M-%S')))
+    context.update_context(trace_path=trace_path)
 
     if args.export_prompts:
-        if os.path.isdir(DENOISING_PROMPT_DIR):
-            shutil.rmtree(DENOISING_PROMPT_DIR)
-        os.mkdir(DENOISING_PROMPT_DIR)
+        if os.path.isdir(denoising_prompt_dir):
+            shutil.rmtree(denoising_prompt_dir)
+        os.makedirs(denoising_prompt_dir)
+
+    # keep the servers of all phases running for the whole run when they fit in GPU memory together,
+    # otherwise each phase starts and stops the server of its model
+    role_list = ['denoise'] + (['extract'] if args.graphrag else []) + (['summarize'] if args.raptor else [])
+    model.start_sgl_servers(model.get_role_model_names(role_list))
 
-    new_paper_list_list_graphrag, new_paper_list_list_raptor = save_group_and_paper(args.export_prompts)
+    new_paper_list_list_graphrag, new_paper_list_list_raptor = save_group_and_paper(args.export_prompts, denoising_prompt_dir, args.max_groups)
 
     start_time_graphrag = datetime.now()
     if args.graphrag:
         # use deepseek for graphrag indexing
-        model.start_sgl_server_deepseek()
-
-        for new_paper_list in new_paper_list_list_graphrag:
-            start_time_one_group = datetime.now()
-
-            if os.path.isdir(TMP_PROMPTS_DIR):
-                shutil.rmtree(TMP_PROMPTS_DIR)
-            if args.export_prompts:
-                os.mkdir(TMP_PROMPTS_DIR)
-
-            if os.path.isdir(TMP_CONFIG_DIR):
-                shutil.rmtree(TMP_CONFIG_DIR)
-            shutil.copytree(CONFIG_EXAMPLE_DIR, TMP_CONFIG_DIR)
-
-            group_name = ''
-            group_id = ''
-            paper_name_list = []
-            paper_id_list = []
-
-            for new_paper in new_paper_list:
-                txt_file = new_paper['txt_path']
-                shutil.copyfile(txt_file, os.path.join(TMP_CONFIG_DIR, 'input', os.path.basename(txt_file)))
-                paper_id_list.append(new_paper['paper_id'])
-                paper_name_list.append(os.path.basename(txt_file))
-                if not group_name:
-                    group_name = os.path.basename(os.path.dirname(txt_file))
-                    group_id = new_paper['group_id']
-
-            with open(log_path, 'a') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Start time', start_time_one_group.strftime('%Y-%m-%d-%H-%M-%S')])
-                writer.writerow(['Group ID', group_id])
-                writer.writerow(['Group name', group_name])
-                writer.writerow(['Document IDs', str(paper_id_list)])
-                writer.writerow(['Document names', str(paper_name_list)])
-                writer.writerow(['Index type', 'GraphRAG'])
-                f.flush()
-
-            db.update_group_id_tmp_file(group_id)
-
-            # python -m graphrag.index --root ./ragtest
-            p = subprocess.Popen(['python', '-m', 'graphrag.index', '--root', TMP_CONFIG_DIR])
-            p.wait()
-
-            end_time_one_group = datetime.now()
-
-            if os.path.isdir(TMP_CONFIG_DIR):
-                shutil.move(TMP_CONFIG_DIR, os.path.join(db_output_graphrag_output_dir, group_name + end_time_one_group.strftime('-%Y-%m-%d-%H-%M-%S')))
-
-            if args.export_prompts:
-                denoising_group_dir = os.path.join(DENOISING_PROMPT_DIR, group_name)
-                if os.path.isdir(denoising_group_dir) and os.path.isdir(TMP_PROMPTS_DIR):
-                    for fn in os.listdir(denoising_group_dir):
-                        shutil.move(os.path.join(denoising_group_dir, fn), os.path.join(TMP_PROMPTS_DIR, fn))
-                    shutil.rmtree(denoising_group_dir)
-                if os.path.isdir(DENOISING_PROMPT_DIR) and len(os.listdir(DENOISING_PROMPT_DIR)) == 0:
-                    shutil.rmtree(DENOISING_PROMPT_DIR)
-
-                if os.path.isdir(TMP_PROMPTS_DIR):
-                    shutil.move(TMP_PROMPTS_DIR, os.path.join(db_output_prompts_dir, 'index-' + group_name + end_time_one_group.strftime('-%Y-%m-%d-%H-%M-%S')))
-                else:
-                    print(f'No prompts folder found for {group_name}')
-
-            with open(log_path, 'a') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Run time', end_time_one_group - start_time_one_group])
-                writer.writerow(['End time', end_time_one_group.strftime('%Y-%m-%d-%H-%M-%S')])
-                f.flush()
-
-            db.rm_group_id_tmp_file()
-
-        model.stop_sgl_server()
-
-    if os.path.isdir(PROMPTS_DIR) and len(os.listdir(PROMPTS_DIR)) == 0:
-        shutil.rmtree(PROMPTS_DIR)
+        started = model.start_role_server('extract')
+        # settings and prompts are read once for all groups
+        pipeline_config = None if args.graphrag_subprocess else pipeline.load_pipeline_config(CONFIG_EXAMPLE_DIR)
+
+        scheduler.run_groups(
+            lambda new_paper_list: graphrag_index_group(
+                new_paper_list, args, pipeline_config, tmp_config_dir, tmp_prompts_dir, denoising_prompt_dir,
+                db_output_graphrag_output_dir, db_output_prompts_dir, log_path
+            ),
+            new_paper_list_list_graphrag,
+            args.max_groups
+        )
+
+        if started:
+            model.stop_sgl_server()
+
+    for tmp_dir in [denoising_prompt_dir, tmp_prompts_dir, tmp_config_dir, DENOISING_PROMPT_DIR, TMP_PROMPTS_DIR, PROMPTS_DIR]:
+        if os.path.isdir(tmp_dir) and len(os.listdir(tmp_dir)) == 0:
+            shutil.rmtree(tmp_dir)
 
     end_time_graphrag = datetime.now()
 
     if args.raptor:
         # use llama for raptor summary
-        model.start_sgl_server_llama()
+        started = model.start_role_server('summarize')
+
+        raptor_index([p['paper_id'] for l in new_paper_list_list_raptor for p in l], log_path, args.max_groups)
 
-        raptor_index([p['paper_id'] for l in new_paper_list_list_raptor for p in l], log_path)
+        if started:
+            model.stop_sgl_server()
 
+    # servers of start_sgl_servers
+    if model.get_running_model_names():
         model.stop_sgl_server()
 
     end_time_raptor = datetime.now()
@@ -418,9 +558,9 @@ def main():
     print('raptor run time:', end_time_raptor - end_time_graphrag)
     print('run time:', end_time_raptor - start_time)
 
-    db.count_all_collection()
+    telemetry.write_summary(trace_path, os.path.join(db_output_dir, 'index_llm_summary_%s.csv' % (start_time.strftime('%Y-%m-%d-%H-%M-%S'))))
 
-    db.rm_db_tmp_file()
+    db.count_all_collection()
 
 
 if __name__ == '__main__':
@@ -5,6 +5,8 @@ from datetime import datetime
 from multiprocessing import Process
 import graphrag.my_graphrag.db as db
 import graphrag.my_graphrag.model as model
+import graphrag.my_graphrag.context as context
+import graphrag.my_graphrag.telemetry as telemetry
 
 
 FILE_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -15,6 +17,7 @@ EXPORT_PROMPTS_DIR = ''
 QUESTION = 'Do Buddhists Also Need Knowledge and Scholarship to Practice Buddhism?'
 
 
+# the instruction and the question come before the text, so the step 1 prompts of a query share their prefix in the server cache
 QUERY_PROMPT1 = '''
 You are provided with a question and a piece of text below. Please determine whether the text is relevant to the question. Indicate your answer by putting yes or no within <relevant> </relevant> tags. If the text is relevant, extract the relevant information in bullet points, placing the bullets within <info> </info> tags. Add a blank line between each bullet. Do not mention the source of information or "the text" in your response. Put a heading for the relevant information. The heading should be in <heading></heading> tags and within <info> </info> tags.
 
@@ -39,6 +42,12 @@ You are provided with a question and some pieces of information below. Please pr
 '''
 
 
+# step 1 is complete once the text is found irrelevant or the relevant information is closed, and it may think for at most 1024 tokens
+# format of the step 1 response, used with constrained decoding
+QUERY_REGEX1 = rf'<relevant>(?:yes|no)</relevant>(?:\n<info>\n<heading>{model.XML_TEXT_REGEX}</heading>\n{model.XML_TEXT_REGEX}</info>)?'
+QUERY_STOP1 = model.StopCondition(stop_strings=['</info>'], stop_regex=r'<relevant>\s*no\s*</relevant>', think_budget=1024)
+
+
 FINAL_ANSWER_TEMPLATE_NO_TEXT = '''<question>
 {question}
 </question>
@@ -156,6 +165,20 @@ def process_arguments():
         help=f'If True, export the input and output text of all query prompts. If False, skip exporting. Default is False.'
     )
 
+    parser.add_argument(
+        '--llm_cache_bypass',
+        type=lambda x: x.lower() == 'true',
+        default=False,
+        help='If True, do not read responses from the LLM cache, new responses are still cached. Default is False.'
+    )
+
+    parser.add_argument(
+        '--constrained_decoding',
+        type=lambda x: x.lower() == 'true',
+        default=False,
+        help='If True, constrain the responses of prompts with a known format (e.g. XML) to that format. Default is False.'
+    )
+
     args = parser.parse_args()
 
     QUESTION = args.question
@@ -168,15 +191,10 @@ def process_arguments():
         return None
 
     db.update_db_path(input_db_path)
+    context.update_context(llm_cache_bypass=args.llm_cache_bypass, constrained_decoding=args.constrained_decoding)
 
     if args.group_id != -1:
-        has_group = False
-        group_list = db.get_all_groups()
-        for group in group_list:
-            if args.group_id == int(group['group_id']):
-                has_group = True
-                break
-        if not has_group:
+        if not db.check_group_id(args.group_id):
             print('Please input an valid Group ID. You can list group IDs by "--list_group True"')
             return None
 
@@ -185,7 +203,7 @@ def process_arguments():
 
 def list_group():
     group_list = db.get_all_groups()
-    paper_list = db.get_all_papers()
+    paper_list = db.get_all_papers(with_content=False)
 
     output_format = "{:^15}|{:^15}|{:^15}| {:<20}"
     print(output_format.format('Group ID', 'Group Name', 'Document ID', 'Document Name'))
@@ -246,7 +264,7 @@ def export_reports(export_type, export_group_name, export_group_id):
     os.makedirs(output_report_folder, exist_ok=True)
 
     if export_type == 1:
-        report_list = db.get_all_community_reports()
+        report_list = db.get_all_community_reports(where={'group_id': export_group_id})
         for report in report_list:
             report_id = report['report_id']
             report_text = report['report_content']
@@ -259,7 +277,7 @@ def export_reports(export_type, export_group_name, export_group_id):
                 print(f'Exported report {report_id} to {file_path}')
 
     else:
-        summary_list = db.get_all_summary_chunks()
+        summary_list = db.get_all_summary_chunks(where={'group_id': export_group_id})
         for summary in summary_list:
             summary_id = summary['summary_id']
             summary_text = summary['summary_content']
@@ -284,21 +302,16 @@ def export_prompts(fn, text):
 def main():
     start = datetime.now()
 
-    db.rm_db_tmp_file()
-
     args = process_arguments()
     if args is None:
-        db.rm_db_tmp_file()
         return
 
     if args.list_group:
         list_group()
-        db.rm_db_tmp_file()
         return
 
     if args.export_reports:
         export_reports(args.export_type, args.export_group_name, args.export_group_id)
-        db.rm_db_tmp_file()
         return
 
     if args.query_option == 1:
@@ -316,8 +329,11 @@ def main():
     print(f'{query_type} query ...')
 
     # use deepseek for all types of query
-    model.remove_model_tmp_file()
-    model.start_sgl_server_deepseek()
+    started = model.start_role_server('query')
+
+    db_output_dir = os.path.join(OUTPUT_DIR, os.path.basename(os.path.normpath(db.get_db_path())))
+    trace_path = os.path.join(db_output_dir, 'query_llm_trace_%s.jsonl' % (start.strftime('%Y-%m-%d-%H-%M-%S')))
+    context.update_context(trace_path=trace_path)
 
     global EXPORT_PROMPTS_DIR
     if args.export_prompts:
@@ -334,10 +350,13 @@ def main():
     # step 1
     ref_paper_id_list = []
     info_list = []
-    for i, chunk in enumerate(query_chunk_list):
-        prompt_step1 = QUERY_PROMPT1.format(question=QUESTION, context=chunk['text'])
-        answer_step1 = model.get_response_from_sgl(prompt_step1)
-
+    prompt_step1_list = [QUERY_PROMPT1.format(question=QUESTION, context=chunk['text']) for chunk in query_chunk_list]
+    # all chunks are sent at once
+    answer_step1_list = model.generate_many(
+        prompt_step1_list, sampling_params=model.get_constrained_params(QUERY_REGEX1), role='query', stop=QUERY_STOP1,
+        phase='query_step1'
+    )
+    for i, (chunk, prompt_step1, answer_step1) in enumerate(zip(query_chunk_list, prompt_step1_list, answer_step1_list)):
         export_prompts('query1_chunk%03d_input.txt' % (i + 1), prompt_step1)
         export_prompts('query1_chunk%03d_output.txt' % (i + 1), answer_step1)
 
@@ -353,25 +372,23 @@ def main():
     # step 2
     context_step2 = '\n\n'.join(['<info>\n%s\n</info>' % info for info in info_list])
     prompt_step2 = QUERY_PROMPT2.format(question=QUESTION, context=context_step2)
-    answer_step2 = model.get_response_from_sgl(prompt_step2)
+    answer_step2 = model.get_response_from_sgl(prompt_step2, role='query', phase='query_step2')
 
     export_prompts('query2_input.txt', prompt_step2)
     export_prompts('query2_output.txt', answer_step2)
 
-    paper_list = db.get_all_papers()
+    paper_dict = db.get_items_by_ids(db.COLLECTION_PAPER, ref_paper_id_list, db.convert_paper)
     group_dict = {}
     for paper_id in list(set(ref_paper_id_list)):
-        for paper in paper_list:
-            if paper_id == paper['paper_id']:
-                group_id = paper['group_id']
-                paper_name = os.path.splitext(paper['paper_name'])[0]
-                group_name = db.get_group_name(group_id)
+        paper = paper_dict.get(str(paper_id))
+        if paper is not None:
+            group_id = paper['group_id']
+            paper_name = os.path.splitext(paper['paper_name'])[0]
+            group_name = db.get_group_name(group_id)
 
-                if group_name not in group_dict:
-                    group_dict[group_name] = []
-                group_dict[group_name].append(paper_name)
-
-                break
+            if group_name not in group_dict:
+                group_dict[group_name] = []
+            group_dict[group_name].append(paper_name)
 
     ref_text = []
     group_name_list = list(group_dict.keys())
@@ -396,9 +413,10 @@ def main():
     end = datetime.now()
     print('run time:', end - start)
 
-    db.rm_db_tmp_file()
+    telemetry.write_summary(trace_path, os.path.join(db_output_dir, 'query_llm_summary_%s.csv' % (start.strftime('%Y-%m-%d-%H-%M-%S'))))
 
-    model.stop_sgl_server()
+    if started:
+        model.stop_sgl_server()
 
 
 def main_with_timeout():
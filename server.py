@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import signal
+import argparse
+import graphrag.my_graphrag.model as model
+
+
+# seconds between two health and idle checks
+CHECK_INTERVAL = 30
+
+MODEL_NAMES = {
+    'llama': model.MODEL_NAME_LLAMA,
+    'deepseek': model.MODEL_NAME_DEEPSEEK,
+}
+
+
+def process_arguments():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--models', '-m',
+        type=str,
+        default='llama,deepseek',
+        help='Comma separated models to keep warm, from "llama" and "deepseek". Default is "llama,deepseek".'
+    )
+
+    parser.add_argument(
+        '--idle_timeout', '-t',
+        type=int,
+        default=30,
+        help='Minutes without any index or query call before the servers are stopped. 0 to never stop. Default is 30.'
+    )
+
+    parser.add_argument(
+        '--stop',
+        type=lambda x: x.lower() == 'true',
+        default=False,
+        help='If True, stop the running daemon and exit. Default is False.'
+    )
+
+    args = parser.parse_args()
+
+    model_name_list = []
+    for model_key in args.models.split(','):
+        model_key = model_key.strip().lower()
+        if model_key not in MODEL_NAMES:
+            print(f'Unknown model "{model_key}". Please choose from {list(MODEL_NAMES.keys())}.')
+            return None
+        model_name_list.append(MODEL_NAMES[model_key])
+    args.model_name_list = model_name_list
+
+    return args
+
+
+def stop_daemon():
+    info = model.read_daemon_info()
+    if info is None:
+        print('SGL daemon is not running.')
+        return
+
+    os.kill(info['pid'], signal.SIGTERM)
+    print(f'SGL daemon stopped with {list(info["endpoints"].keys())}.')
+
+
+def stop_on_signal(signum, frame):
+    raise SystemExit(0)
+
+
+def main():
+    args = process_arguments()
+    if args is None:
+        return
+
+    if args.stop:
+        stop_daemon()
+        return
+
+    if model.read_daemon_info() is not None:
+        print(f'SGL daemon is already running on {model.get_daemon_path()}.')
+        return
+
+    for model_name in args.model_name_list:
+        model.check_model_files(model_name)
+
+    if not model.start_sgl_servers(args.model_name_list):
+        print(f'{args.model_name_list} do not fit in GPU memory together. Please keep fewer models warm with "--models".')
+        return
+
+    signal.signal(signal.SIGTERM, stop_on_signal)
+
+    daemon_path = model.get_daemon_path()
+    activity_path = model.get_daemon_activity_path()
+    os.makedirs(os.path.dirname(daemon_path), exist_ok=True)
+    try:
+        with open(activity_path, 'w'):
+            pass
+        with open(daemon_path, 'w') as f:
+            json.dump({'pid': os.getpid(), 'endpoints': model.get_endpoints()}, f)
+            f.flush()
+        print(f'SGL daemon is running. Stop it with "python server.py --stop True".')
+
+        while True:
+            time.sleep(CHECK_INTERVAL)
+
+            if not all(model.check_server_health(server_url) for server_url in model.get_endpoints().values()):
+                print('SGL server is not healthy.')
+                break
+
+            idle_time = time.time() - os.path.getmtime(activity_path)
+            if args.idle_timeout > 0 and idle_time > args.idle_timeout * 60:
+                print(f'SGL daemon idle for {int(idle_time / 60)} minutes.')
+                break
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        for path in [daemon_path, activity_path]:
+            if os.path.isfile(path):
+                os.remove(path)
+        model.stop_sgl_server()
+
+
+if __name__ == '__main__':
+    main()
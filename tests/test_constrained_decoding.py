@@ -0,0 +1,44 @@
+import re
+
+import graphrag.my_graphrag.model as model
+from graphrag.index.graph.extractors.graph.graph_extractor import GLEANING_REGEX
+from graphrag.index.graph.extractors.community_reports.community_reports_extractor import COMMUNITY_REPORT_REGEX
+
+
+THINK_BLOCK = '<think>\nThe text mentions one more entity.\n</think>\n\n'
+ENTITY_XML = (
+    '<entity>\n'
+    '    <entity_name>RAPTOR</entity_name>\n'
+    '    <entity_type>method</entity_type>\n'
+    '    <entity_description>Recursive summarization of chunks</entity_description>\n'
+    '</entity>\n'
+)
+
+
+def test_think_block_before_gleaning_entities():
+    assert re.fullmatch(model.add_think_regex(GLEANING_REGEX), THINK_BLOCK + ENTITY_XML)
+
+
+def test_think_block_before_gleaning_nomore():
+    assert re.fullmatch(model.add_think_regex(GLEANING_REGEX), THINK_BLOCK + 'NOMORE')
+
+
+def test_remove_think_regex():
+    assert model.remove_think_regex(model.add_think_regex(GLEANING_REGEX)) == GLEANING_REGEX
+
+
+def test_community_report_sections():
+    report = (
+        'Title: RAPTOR and GraphRAG\n\n'
+        'Summary: Two ways of indexing the papers.\n\n'
+        'Insights:\n\n'
+        '### Recursive summaries\n\nChunks are clustered and summarized level by level.\n\n'
+        '### Graph communities\n\nReports are written per community.\n'
+    )
+    assert re.fullmatch(COMMUNITY_REPORT_REGEX, report)
+    assert re.fullmatch(model.add_think_regex(COMMUNITY_REPORT_REGEX), THINK_BLOCK + report)
+
+
+def test_community_report_needs_sections_in_order():
+    assert not re.fullmatch(COMMUNITY_REPORT_REGEX, 'Some text with a Title, a Summary and Insights.')
+    assert not re.fullmatch(COMMUNITY_REPORT_REGEX, 'Title: A\n\nSummary: B\n\nInsights:\n\nNo heading.')